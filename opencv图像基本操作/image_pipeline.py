@@ -0,0 +1,322 @@
+"""声明式图像处理流水线
+
+learning.py 把 resize -> 拼图 -> 高斯模糊 -> 灰度/Sobel -> 色彩映射 写成一行一行的脚本，
+只能处理一张图，也没法并行。这里把每一步声明成一个 Stage（名字、操作、输入、参数），
+Pipeline 按依赖关系执行：
+
+    并行:   输入都已经算好的 Stage 立即提交到线程池（OpenCV 计算时会释放GIL），
+            例如8种插值放大互不依赖，会同时计算
+    去重:   操作、输入和参数完全相同的 Stage 只计算一次（learning.py 里 BICUBIC 和 CUBIC 是同一个操作）
+    内存:   中间结果在所有下游 Stage 用完后立即释放，只保留需要输出的结果；
+            处理目录时逐张读取，同一时间只有一张图的结果在内存里
+    输出:   每个输出 Stage 算完就交给 sink，不用等整条流水线结束；
+            处理目录时 sink 把结果交给 ImageWriter（见 image_writer.py）在后台编码写文件
+    缓存:   传入 StageCache（见 stage_cache.py）时，已经缓存的结果直接内存映射读取，它的上游不再计算；
+            改了某个 Stage 的参数后重新运行，只有它和它的下游会重新计算
+
+参数只用数字和字符串（插值方法写 "CUBIC"、色彩映射写 "RAINBOW"），可以直接写进JSON。
+
+用法:
+    python image_pipeline.py ROBOCON-GREAT-SMALL.png -o .       # 与 learning.py 相同的20个输出
+    python image_pipeline.py photos/ -o out/ --workers 8         # 目录里每张图输出到 out/<文件名>/
+    python image_pipeline.py ROBOCON-GREAT-SMALL.png -o . --cache .cache --colormap JET
+    python image_pipeline.py photos/ -o out/ --png-level 1 --rule "*_grad=npy" --rule "big_*=jpg:95"
+"""
+import argparse
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from image_writer import FORMATS, ImageWriter, OutputFormats
+from stage_cache import StageCache, content_key, stage_key
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+# 流水线的输入图像在 Stage.inputs 里的名字
+INPUT = "input"
+
+INTERPOLATIONS = {
+    "NEAREST": cv2.INTER_NEAREST,
+    "LINEAR": cv2.INTER_LINEAR,
+    "CUBIC": cv2.INTER_CUBIC,
+    "AREA": cv2.INTER_AREA,
+    "LANCZOS4": cv2.INTER_LANCZOS4,
+    "LINEAR_EXACT": cv2.INTER_LINEAR_EXACT,
+    "NEAREST_EXACT": cv2.INTER_NEAREST_EXACT,
+}
+
+# learning.py 里放大的顺序，前4张拼成 imgbig1，后4张拼成 imgbig2；BICUBIC 就是 CUBIC
+LEARNING_UPSCALES = ["NEAREST", "BICUBIC", "AREA", "LANCZOS4", "LINEAR", "LINEAR_EXACT", "NEAREST_EXACT", "CUBIC"]
+INTERPOLATION_ALIASES = {"BICUBIC": "CUBIC"}
+
+DEPTHS = {"8U": cv2.CV_8U, "16S": cv2.CV_16S, "32F": cv2.CV_32F, "64F": cv2.CV_64F}
+
+# name: 结果的名字（也是输出文件名）；op: OPS 中的操作名；inputs: 输入的名字元组；params: 参数 ((键, 值), ...)
+Stage = namedtuple("Stage", ["name", "op", "inputs", "params"])
+
+
+def stage(name, op, inputs=(INPUT,), **params):
+    """声明一个 Stage，inputs 可以是单个名字或名字列表"""
+    if op not in OPS:
+        raise ValueError(f"未知操作: {op}")
+    inputs = (inputs,) if isinstance(inputs, str) else tuple(inputs)
+    return Stage(name, op, inputs, tuple(sorted(params.items())))
+
+
+def resize(image, fx=1.0, fy=None, width=0, height=0, interpolation="LINEAR"):
+    size = (width, height) if width and height else None
+    return cv2.resize(image, size, fx=fx, fy=fy or fx, interpolation=INTERPOLATIONS[interpolation])
+
+
+def blur(image, ksize=5, sigma=0.0):
+    return cv2.GaussianBlur(image, (ksize, ksize), sigma)
+
+
+def gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def sobel(image, dx=1, dy=1, ksize=3, depth="64F"):
+    return cv2.Sobel(image, DEPTHS[depth], dx, dy, ksize=ksize)
+
+
+def colormap(image, colormap="RAINBOW"):
+    """非8位图像（如Sobel结果）先用 convertScaleAbs 转成8位"""
+    if image.dtype != np.uint8:
+        image = cv2.convertScaleAbs(image)
+    return cv2.applyColorMap(image, getattr(cv2, "COLORMAP_" + colormap))
+
+
+def mosaic(*images, columns=2):
+    """按行拼接，每行 columns 张"""
+    rows = [np.hstack(images[i:i + columns]) for i in range(0, len(images), columns)]
+    return np.vstack(rows)
+
+
+OPS = {
+    "resize": resize,
+    "blur": blur,
+    "gray": gray,
+    "sobel": sobel,
+    "colormap": colormap,
+    "mosaic": mosaic,
+}
+
+
+class Pipeline:
+    """按依赖关系并行执行的 Stage 集合；outputs 为需要输出的 Stage 名字，默认全部；cache 为 StageCache"""
+
+    def __init__(self, stages, outputs=None, workers=None, cache=None):
+        self.stages = {}
+        self.aliases = {}   # 重复 Stage 的名字 -> 第一次声明的名字
+        known = {}
+        for s in stages:
+            if s.name in self.stages or s.name in self.aliases or s.name == INPUT:
+                raise ValueError(f"Stage 名字重复: {s.name}")
+            for name in s.inputs:
+                if name != INPUT and name not in self.stages and name not in self.aliases:
+                    raise ValueError(f"{s.name} 的输入 {name} 没有在前面声明")
+            s = s._replace(inputs=tuple(self.aliases.get(name, name) for name in s.inputs))
+            key = (s.op, s.inputs, s.params)
+            if key in known:
+                self.aliases[s.name] = known[key]
+                continue
+            known[key] = s.name
+            self.stages[s.name] = s
+        self.outputs = list(outputs) if outputs is not None else [s.name for s in stages]
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.cache = cache
+
+    def _resolve(self, name):
+        return self.aliases.get(name, name)
+
+    def keys(self, image):
+        """每个 Stage 结果的缓存键（按声明顺序，输入总是先于使用它的 Stage）"""
+        keys = {INPUT: content_key(image)}
+        for name, s in self.stages.items():
+            keys[name] = stage_key(s.op, s.params, [keys[i] for i in s.inputs])
+        return keys
+
+    def _required(self, outputs, keys=None, loaded=None):
+        """计算 outputs 需要执行的 Stage 名字；有缓存时命中的结果放进 loaded，它的上游不再需要"""
+        required = set()
+        pending = [self._resolve(name) for name in outputs]
+        while pending:
+            name = pending.pop()
+            if name == INPUT or name in required or (loaded is not None and name in loaded):
+                continue
+            if name not in self.stages:
+                raise KeyError(f"没有这个 Stage: {name}")
+            if keys is not None:
+                cached = self.cache.get(keys[name])
+                if cached is not None:
+                    loaded[name] = cached
+                    continue
+            required.add(name)
+            pending.extend(self.stages[name].inputs)
+        return required
+
+    def compute(self, s, inputs, key=None):
+        """用输入图像列表执行一个 Stage，有缓存时把结果存进缓存"""
+        result = OPS[s.op](*inputs, **dict(s.params))
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    def run(self, image, outputs=None, sink=None, executor=None):
+        """处理一张图，返回 {输出名: 结果}；sink(名字, 结果) 在每个输出算完时调用（在调用 run 的线程里）"""
+        outputs = self.outputs if outputs is None else list(outputs)
+        keys = self.keys(image) if self.cache is not None else None
+        values = {INPUT: image}
+        required = self._required(outputs, keys, values)
+        keep = {self._resolve(name) for name in outputs}
+        # 每个结果还有多少个下游 Stage 没有执行，减到0且不需要输出时释放
+        consumers = {}
+        for name in required:
+            for source in set(self.stages[name].inputs):
+                consumers[source] = consumers.get(source, 0) + 1
+
+        if sink is not None:
+            # 从缓存读到的输出
+            for output in outputs:
+                if self._resolve(output) in values and self._resolve(output) != INPUT:
+                    sink(output, values[self._resolve(output)])
+        waiting = set(required)
+        in_flight = {}
+        own_executor = executor is None
+        executor = executor or ThreadPoolExecutor(self.workers)
+        try:
+            while waiting or in_flight:
+                for name in [n for n in waiting if all(i in values for i in self.stages[n].inputs)]:
+                    waiting.discard(name)
+                    s = self.stages[name]
+                    key = keys[name] if keys is not None else None
+                    in_flight[executor.submit(self.compute, s, [values[i] for i in s.inputs], key)] = name
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = in_flight.pop(future)
+                    values[name] = future.result()
+                    for source in set(self.stages[name].inputs):
+                        consumers[source] -= 1
+                        if consumers[source] == 0 and source not in keep:
+                            del values[source]
+                    if sink is not None:
+                        for output in outputs:
+                            if self._resolve(output) == name:
+                                sink(output, values[name])
+        finally:
+            if own_executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+        return {name: values[self._resolve(name)] for name in outputs}
+
+
+def learning_pipeline(scale=4, colormap_name="RAINBOW", cache=None):
+    """learning.py 的处理链：8种插值放大，两张2x2拼图，每张拼图 模糊 -> 灰度/Sobel -> 色彩映射"""
+    names = LEARNING_UPSCALES
+    stages = [stage(f"big_{name}", "resize", fx=scale, interpolation=INTERPOLATION_ALIASES.get(name, name))
+              for name in names]
+    for i, group in enumerate((names[:4], names[4:]), 1):
+        big = f"imgbig{i}"
+        stages += [
+            stage(big, "mosaic", [f"big_{name}" for name in group], columns=2),
+            stage(f"{big}_smooth", "blur", big, ksize=5),
+            stage(f"{big}_gray", "gray", f"{big}_smooth"),
+            stage(f"{big}_grad", "sobel", f"{big}_smooth", dx=1, dy=1, ksize=3, depth="64F"),
+            stage(f"{big}_color", "colormap", f"{big}_gray", colormap=colormap_name),
+            stage(f"{big}_grad_color", "colormap", f"{big}_grad", colormap=colormap_name),
+        ]
+    return Pipeline(stages, cache=cache)
+
+
+def iter_images(path):
+    """逐张产生 (名字, 图像)；path 为目录时按文件名排序，读不出来的文件跳过"""
+    if os.path.isdir(path):
+        files = sorted(entry.path for entry in os.scandir(path)
+                       if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS))
+    else:
+        files = [path]
+    for file in files:
+        image = cv2.imread(file)
+        if image is None:
+            print(f"无法读取图片: {file}")
+            continue
+        yield os.path.splitext(os.path.basename(file))[0], image
+
+
+def run_directory(pipeline, source, output_dir, formats=None, writer=None):
+    """处理 source（图片或目录）中的每张图，输出写到 output_dir（目录输入时每张图一个子目录）
+
+    每个输出算完就交给 ImageWriter 在后台编码写文件，下一张图的计算和上一张图的编码同时进行；
+    writer 排队的图像数有上限，内存不会随图片数增长。formats 为 OutputFormats，默认全部PNG；
+    返回 (图片数, 耗时秒)
+    """
+    formats = formats or OutputFormats()
+    own_writer = writer is None
+    writer = writer or ImageWriter()
+    per_image = os.path.isdir(source)
+    count = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(pipeline.workers) as executor:
+            for name, image in iter_images(source):
+                directory = os.path.join(output_dir, name) if per_image else output_dir
+                os.makedirs(directory, exist_ok=True)
+
+                def sink(output, result):
+                    path, settings = formats.path(directory, output)
+                    writer.write(path, result, **settings)
+
+                pipeline.run(image, sink=sink, executor=executor)
+                count += 1
+        writer.flush()
+    finally:
+        if own_writer:
+            writer.close()
+    return count, time.perf_counter() - start
+
+
+def parse_rule(text):
+    """--rule 的参数 "通配符=格式[:级别或质量]"，例如 "*_grad=npy"、"big_*=jpg:95" """
+    pattern, _, setting = text.partition("=")
+    extension, _, level = setting.partition(":")
+    if not pattern or not extension:
+        raise argparse.ArgumentTypeError(f"规则格式应为 通配符=格式[:级别]: {text}")
+    return pattern, extension, int(level) if level else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="learning.py 的处理链，批量并行处理图片")
+    parser.add_argument("source", help="图片文件或目录")
+    parser.add_argument("-o", "--output", default=".", help="输出目录")
+    parser.add_argument("--workers", type=int, default=0, help="线程数，0表示自动")
+    parser.add_argument("--scale", type=float, default=4, help="放大倍数")
+    parser.add_argument("--colormap", default="RAINBOW", help="色彩映射（cv2.COLORMAP_* 去掉前缀）")
+    parser.add_argument("--cache", metavar="DIR", help="中间结果缓存目录，重复运行时只重新计算参数变化的 Stage")
+    parser.add_argument("--cache-size", type=int, default=2048, help="缓存大小上限(MB)")
+    parser.add_argument("--format", default="png", choices=FORMATS, help="输出格式")
+    parser.add_argument("--png-level", type=int, help="PNG压缩级别0~9，越小越快（默认OpenCV的默认值）")
+    parser.add_argument("--quality", type=int, help="JPEG/WebP 质量0~100")
+    parser.add_argument("--rule", type=parse_rule, action="append", default=[],
+                        help='按输出名字指定格式，如 "*_grad=npy"、"big_*=jpg:95"（可以多次指定，第一个匹配的生效）')
+    parser.add_argument("--writers", type=int, default=2, help="后台编码写文件的线程数")
+    args = parser.parse_args()
+
+    cache = StageCache(args.cache, args.cache_size << 20) if args.cache else None
+    pipeline = learning_pipeline(args.scale, args.colormap, cache)
+    if args.workers:
+        pipeline.workers = args.workers
+    formats = OutputFormats(args.format, args.png_level, args.quality, args.rule)
+    with ImageWriter(args.writers, max_pending=2 * len(pipeline.outputs)) as writer:
+        count, elapsed = run_directory(pipeline, args.source, args.output, formats, writer)
+    print(f"处理 {count} 张图片, {elapsed:.2f}s, 写出 {writer.written} 个文件 {writer.bytes / (1 << 20):.1f}MB, "
+          f"编码 {writer.encode_seconds:.2f}s, 等待写出 {writer.wait_seconds:.2f}s")
+    if cache is not None:
+        print(f"缓存命中 {cache.hits} 次, 未命中 {cache.misses} 次, 占用 {cache.total / (1 << 20):.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""后台编码、写文件的图像输出
+
+learning.py 和 image_pipeline.py 的输出都是同步 cv2.imwrite，默认参数的PNG压缩放大后的大拼图
+比计算本身还慢，计算线程一直在等压缩。ImageWriter 把 编码+写文件 放到后台线程池：
+
+    write(path, image)  提交后立即返回（排队的图像超过 max_pending 张时等待，内存有上限），
+                        计算可以继续，编码和计算同时进行（cv2.imencode 编码时会释放GIL）
+    flush()             等待已提交的全部写完，有写失败时抛出第一个错误；结束前必须调用（close() 也会调用）
+    格式和参数          由扩展名决定: .png 压缩级别(0~9)，.jpg/.webp 质量(0~100)，
+                        .npy 用 np.save 原样保存（Sobel 的 float64 这类中间结果不会被截断成8位）
+
+用 cv2.imencode 加普通文件写入而不是 cv2.imwrite，路径里有中文时在 Windows 上也能写。
+
+OutputFormats 按输出名字选格式，例如 PNG 压缩级别1，"*_grad" 存成 .npy，"big_*" 存成质量95的JPEG:
+    OutputFormats("png", png_compression=1, rules=[("*_grad", "npy", None), ("big_*", "jpg", 95)])
+"""
+import fnmatch
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+FORMATS = ("png", "jpg", "jpeg", "webp", "npy")
+
+
+def encode_params(extension, png_compression=None, quality=None):
+    """扩展名对应的 cv2.imencode 参数列表，没有指定的参数用OpenCV默认值"""
+    extension = extension.lower().lstrip(".")
+    if extension == "png" and png_compression is not None:
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+    if extension in ("jpg", "jpeg") and quality is not None:
+        return [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    if extension == "webp" and quality is not None:
+        return [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    return []
+
+
+class OutputFormats:
+    """按输出名字选择格式和编码参数；rules 为 [(通配符, 格式, 级别/质量)]，第一个匹配的生效"""
+
+    def __init__(self, format="png", png_compression=None, quality=None, rules=()):
+        self.format = format
+        self.png_compression = png_compression
+        self.quality = quality
+        self.rules = list(rules)
+        for _, extension, _ in self.rules:
+            if extension not in FORMATS:
+                raise ValueError(f"不支持的格式: {extension}")
+
+    def settings(self, name):
+        """返回 (扩展名, write() 的参数)"""
+        for pattern, extension, level in self.rules:
+            if fnmatch.fnmatchcase(name, pattern):
+                if extension == "png":
+                    return extension, {'png_compression': level}
+                return extension, {'quality': level}
+        return self.format, {'png_compression': self.png_compression, 'quality': self.quality}
+
+    def path(self, directory, name):
+        """返回 (输出路径, write() 的参数)"""
+        extension, settings = self.settings(name)
+        return os.path.join(directory, f"{name}.{extension}"), settings
+
+
+class ImageWriter:
+    """后台线程池编码并写文件；提交后不要再修改图像数组"""
+
+    def __init__(self, workers=2, max_pending=8):
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="image-writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._futures = set()
+        self._errors = []
+        self.written = 0
+        self.bytes = 0
+        self.encode_seconds = 0.0   # 后台线程编码+写文件的总时间
+        self.wait_seconds = 0.0     # 提交时因为排队已满等待的总时间
+
+    def write(self, path, image, png_compression=None, quality=None):
+        """提交一张图像，排队已满时等待"""
+        start = time.perf_counter()
+        self._slots.acquire()
+        self.wait_seconds += time.perf_counter() - start
+        future = self._executor.submit(self._write, path, image, png_compression, quality)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _write(self, path, image, png_compression, quality):
+        start = time.perf_counter()
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".npy":
+            np.save(path, image)
+            size = os.path.getsize(path)
+        else:
+            ok, data = cv2.imencode(extension, image, encode_params(extension, png_compression, quality))
+            if not ok:
+                raise IOError(f"编码失败: {path}")
+            with open(path, "wb") as f:
+                f.write(data)
+            size = len(data)
+        with self._lock:
+            self.written += 1
+            self.bytes += size
+            self.encode_seconds += time.perf_counter() - start
+
+    def _done(self, future):
+        self._slots.release()
+        with self._lock:
+            self._futures.discard(future)
+            if future.exception() is not None:
+                self._errors.append(future.exception())
+
+    def flush(self):
+        """等待已提交的全部写完；有写失败时抛出第一个错误"""
+        while True:
+            with self._lock:
+                pending = list(self._futures)
+            if not pending:
+                break
+            for future in pending:
+                future.exception()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
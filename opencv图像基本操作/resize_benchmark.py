@@ -0,0 +1,222 @@
+"""插值方法和滤波的速度/质量基准测试
+
+learning.py 只是把8种插值的放大结果存成图片用眼睛比较（BICUBIC 和 CUBIC 其实是同一个方法）。
+这里对 图像尺寸 x 缩放倍数 x 数据类型 x cv2.setNumThreads 的每个组合测量：
+
+    resize:   7种插值方法的耗时（多次取中位数）和吞吐量(输出百万像素/秒)；
+              质量用往返误差衡量：按 scale 缩放后再用同一方法缩放回原尺寸，与原图比较 PSNR 和 SSIM
+              （都用 NumPy 计算，SSIM 用 7x7 均值窗口，多通道取平均）
+    filters:  learning.py 里的 5x5 高斯模糊、3x3 Sobel(CV_64F 和 CV_16S)、色彩映射的耗时
+
+结果写成 JSON（--json），用 --compare 读入上一次的结果，输出每一项的速度变化，方便比较不同机器和参数。
+
+用法:
+    python resize_benchmark.py --image ROBOCON-GREAT-SMALL.png --sizes 256 1024 --scales 0.5 2 4 --threads 1 4
+    python resize_benchmark.py --json new.json --compare old.json
+"""
+import argparse
+import json
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from image_pipeline import INTERPOLATIONS
+
+DTYPES = {"uint8": np.uint8, "uint16": np.uint16, "float32": np.float32}
+# 各数据类型像素值的范围，PSNR/SSIM 用
+DATA_RANGE = {"uint8": 255.0, "uint16": 65535.0, "float32": 1.0}
+
+
+def psnr(reference, image, data_range=255.0):
+    """峰值信噪比(dB)，完全相同时返回 inf"""
+    mse = np.mean((reference.astype(np.float64) - image.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(data_range ** 2 / mse))
+
+
+def _window_mean(image, window):
+    """每个 window x window 窗口的均值（积分图，只保留完整窗口）"""
+    integral = np.zeros((image.shape[0] + 1, image.shape[1] + 1))
+    np.cumsum(np.cumsum(image, axis=0), axis=1, out=integral[1:, 1:])
+    sums = (integral[window:, window:] - integral[:-window, window:]
+            - integral[window:, :-window] + integral[:-window, :-window])
+    return sums / (window * window)
+
+
+def ssim(reference, image, data_range=255.0, window=7):
+    """结构相似度，window x window 均值窗口、样本协方差（与 skimage 默认参数相同），多通道取平均"""
+    if reference.ndim == 3:
+        return float(np.mean([ssim(reference[..., c], image[..., c], data_range, window)
+                              for c in range(reference.shape[2])]))
+    x = reference.astype(np.float64)
+    y = image.astype(np.float64)
+    c1, c2 = (0.01 * data_range) ** 2, (0.03 * data_range) ** 2
+    n = window * window
+    correction = n / (n - 1)
+    mx, my = _window_mean(x, window), _window_mean(y, window)
+    vx = (_window_mean(x * x, window) - mx * mx) * correction
+    vy = (_window_mean(y * y, window) - my * my) * correction
+    cxy = (_window_mean(x * y, window) - mx * my) * correction
+    s = ((2 * mx * my + c1) * (2 * cxy + c2)) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+    return float(s.mean())
+
+
+def timed(function, repeat):
+    """返回 (结果, 中位耗时ms)"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return result, float(np.median(times))
+
+
+def test_image(source, size, dtype):
+    """把源图缩放到宽 size（保持宽高比）并转换成 dtype（浮点为 0~1）"""
+    height = max(1, int(round(source.shape[0] * size / source.shape[1])))
+    interpolation = cv2.INTER_AREA if size < source.shape[1] else cv2.INTER_CUBIC
+    image = cv2.resize(source, (size, height), interpolation=interpolation)
+    if dtype == "uint8":
+        return image
+    if dtype == "uint16":
+        return image.astype(np.uint16) * 257
+    return image.astype(np.float32) / 255.0
+
+
+def _finite(value):
+    return value if np.isfinite(value) else None
+
+
+def bench_resize(image, dtype, scale, mode, repeat):
+    flag = INTERPOLATIONS[mode]
+    height, width = image.shape[:2]
+    try:
+        scaled, ms = timed(lambda: cv2.resize(image, None, fx=scale, fy=scale, interpolation=flag), repeat)
+        restored = cv2.resize(scaled, (width, height), interpolation=flag)
+    except cv2.error as e:
+        # 部分方法不支持某些数据类型（例如 *_EXACT 只支持8位）
+        return {'error': str(e).strip().splitlines()[-1]}
+    pixels = scaled.shape[0] * scaled.shape[1]
+    return {
+        'ms': round(ms, 3),
+        'mpix_per_s': round(pixels / ms / 1000.0, 2),
+        # 往返后完全相同（例如整数倍放大再缩小的 NEAREST）时 PSNR 为 inf，JSON 里记为 null
+        'psnr': _finite(round(psnr(image, restored, DATA_RANGE[dtype]), 2)),
+        'ssim': round(ssim(image, restored, DATA_RANGE[dtype]), 4),
+    }
+
+
+def bench_filters(image, dtype, repeat):
+    """learning.py 里模糊、Sobel、色彩映射的耗时 {名字: 结果}"""
+    stages = {
+        'blur5': lambda: cv2.GaussianBlur(image, (5, 5), 0),
+        'sobel_64F': lambda: cv2.Sobel(image, cv2.CV_64F, 1, 1, ksize=3),
+    }
+    if dtype == "uint8":
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        stages['sobel_16S'] = lambda: cv2.Sobel(image, cv2.CV_16S, 1, 1, ksize=3)
+        stages['colormap'] = lambda: cv2.applyColorMap(gray, cv2.COLORMAP_RAINBOW)
+    pixels = image.shape[0] * image.shape[1]
+    results = {}
+    for name, function in stages.items():
+        _, ms = timed(function, repeat)
+        results[name] = {'ms': round(ms, 3), 'mpix_per_s': round(pixels / ms / 1000.0, 2)}
+    return results
+
+
+def run_benchmark(source, sizes, scales, dtypes, threads, modes=None, repeat=5):
+    """测试所有组合，返回结果行列表"""
+    modes = modes or list(INTERPOLATIONS)
+    previous_threads = cv2.getNumThreads()
+    rows = []
+    try:
+        for count in threads:
+            cv2.setNumThreads(count)
+            for dtype in dtypes:
+                for size in sizes:
+                    image = test_image(source, size, dtype)
+                    base = {'size': [image.shape[1], image.shape[0]], 'dtype': dtype, 'threads': count}
+                    for scale in scales:
+                        for mode in modes:
+                            row = dict(base, op="resize", mode=mode, scale=scale)
+                            row.update(bench_resize(image, dtype, scale, mode, repeat))
+                            rows.append(row)
+                            print(format_row(row))
+                    for name, result in bench_filters(image, dtype, repeat).items():
+                        row = dict(base, op=name, **result)
+                        rows.append(row)
+                        print(format_row(row))
+    finally:
+        cv2.setNumThreads(previous_threads)
+    return rows
+
+
+def row_key(row):
+    """结果行的标识，用于和上一次的结果对应"""
+    return (row['op'], row.get('mode'), tuple(row['size']), row.get('scale'), row['dtype'], row['threads'])
+
+
+def format_row(row, previous=None):
+    name = f"{row['op']}:{row['mode']} x{row['scale']}" if row['op'] == "resize" else row['op']
+    text = f"{name:<26} {row['size'][0]:>5}x{row['size'][1]:<5} {row['dtype']:<8} {row['threads']:>2}线程 "
+    if 'error' in row:
+        return text + f"不支持: {row['error']}"
+    text += f"{row['ms']:9.3f}ms {row['mpix_per_s']:9.2f}MP/s"
+    if 'psnr' in row:
+        value = float("inf") if row['psnr'] is None else row['psnr']
+        text += f"  PSNR {value:6.2f}dB  SSIM {row['ssim']:.4f}"
+    if previous is not None and previous.get('ms'):
+        text += f"  耗时为上次的 {row['ms'] / previous['ms']:.2f} 倍"
+    return text
+
+
+def compare(rows, path):
+    """和上一次的结果文件逐项比较"""
+    with open(path) as f:
+        previous = {row_key(row): row for row in json.load(f)['results']}
+    print(f"\n与 {path} 比较:")
+    for row in rows:
+        if 'error' not in row and row_key(row) in previous:
+            print(format_row(row, previous[row_key(row)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="插值方法和滤波的速度/质量基准测试")
+    parser.add_argument("--image", default="ROBOCON-GREAT-SMALL.png", help="测试用的源图")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024], help="测试图像宽度")
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.5, 2, 4], help="缩放倍数")
+    parser.add_argument("--dtypes", nargs="+", default=["uint8", "float32"], choices=list(DTYPES))
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, cv2.getNumThreads()],
+                        help="cv2.setNumThreads 的取值")
+    parser.add_argument("--modes", nargs="+", choices=list(INTERPOLATIONS), help="只测这些插值方法")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数，取中位数")
+    parser.add_argument("--json", metavar="PATH", help="把结果写入JSON文件")
+    parser.add_argument("--compare", metavar="PATH", help="与上一次的JSON结果比较")
+    args = parser.parse_args()
+
+    source = cv2.imread(args.image)
+    if source is None:
+        raise IOError(f"无法读取图片: {args.image}")
+    threads = list(dict.fromkeys(args.threads))
+    rows = run_benchmark(source, args.sizes, args.scales, args.dtypes, threads, args.modes, args.repeat)
+    if args.json:
+        meta = {
+            'image': args.image,
+            'repeat': args.repeat,
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'cpus': os.cpu_count(),
+            'platform': platform.platform(),
+            'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with open(args.json, "w") as f:
+            json.dump({'meta': meta, 'results': rows}, f, indent=1)
+    if args.compare:
+        compare(rows, args.compare)
+
+
+if __name__ == "__main__":
+    main()
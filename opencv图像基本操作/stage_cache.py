@@ -0,0 +1,121 @@
+"""流水线中间结果的磁盘缓存
+
+image_pipeline.py 每次运行都从头计算所有 Stage。StageCache 按内容寻址保存每个 Stage 的结果：
+
+    键:     输入图像的键是像素内容(形状、类型、数据)的哈希；
+            Stage 的键是 (操作, 参数, 各输入的键) 的哈希，所以不需要对大的中间结果再算哈希，
+            只改了色彩映射参数时，上游的放大、拼图、模糊的键都不变，只有色彩映射需要重新计算
+    存储:   每个结果一个 .npy 文件（<目录>/<键前两位>/<键>.npy），读取时用 np.load(mmap_mode="r")
+            内存映射，不会把整个数组读进内存；先写临时文件再改名，中断时不会留下写了一半的文件
+    容量:   总大小超过 max_bytes 时按最近使用时间（命中时更新文件的修改时间）删除最旧的文件
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+# 操作的实现改变、以前的缓存结果不再有效时增加这个版本号
+CACHE_VERSION = 1
+
+
+def content_key(image):
+    """图像内容的键"""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{image.dtype.str}{image.shape}".encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+def stage_key(op, params, input_keys):
+    """Stage 结果的键: 操作、参数和输入的键"""
+    text = repr((CACHE_VERSION, op, tuple(params), tuple(input_keys)))
+    return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+
+class StageCache:
+    """按键保存 numpy 数组的目录，总大小不超过 max_bytes（LRU淘汰）"""
+
+    def __init__(self, directory, max_bytes=2 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {}
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if name.endswith(".npy"):
+                    self._sizes[name[:-4]] = os.path.getsize(os.path.join(root, name))
+        self.total = sum(self._sizes.values())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".npy")
+
+    def __contains__(self, key):
+        return key in self._sizes
+
+    def get(self, key):
+        """返回只读的内存映射数组，不存在返回None"""
+        if key not in self._sizes:
+            with self._lock:
+                self.misses += 1
+            return None
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (OSError, ValueError):
+            # 文件被外部删除或损坏，当作没有缓存
+            with self._lock:
+                self.total -= self._sizes.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return array
+
+    def put(self, key, array):
+        """保存结果（可以在工作线程里调用）；单个结果超过 max_bytes 时不保存"""
+        if key in self._sizes or array.nbytes > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(temp, path)
+        with self._lock:
+            if key not in self._sizes:
+                self._sizes[key] = os.path.getsize(path)
+                self.total += self._sizes[key]
+            if self.total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """删除最久没有使用的文件，直到总大小不超过 max_bytes（调用时已持有锁）"""
+        entries = []
+        for key in self._sizes:
+            try:
+                entries.append((os.path.getmtime(self._path(key)), key))
+            except OSError:
+                entries.append((0.0, key))
+        for _, key in sorted(entries):
+            if self.total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self.total -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._sizes):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._sizes.clear()
+            self.total = 0
@@ -0,0 +1,264 @@
+"""分条带处理大图，内存占用不随图像高度增长
+
+learning.py（和 image_pipeline.learning_pipeline）把8张放大4倍（16倍像素）的图、两张拼图和
+CV_64F 的 Sobel 结果（每通道8字节）同时放在内存里，源图稍大内存就不够。这里按拼图的行分成条带，
+每个条带从源图裁出需要的行，依次计算 放大 -> 拼图 -> 模糊 -> 灰度/Sobel -> 色彩映射，
+写出后就丢掉，结果与整图计算逐像素相同：
+
+    放大的重叠:  输出行 y 对应源图行 (y + 0.5) / scale - 0.5，插值还要用到上下几行
+                 （RESIZE_HALO，LANCZOS4 最多）；裁剪的起始行取 scale 分母的倍数，
+                 裁剪后缩放的采样位置和整图缩放完全一致，多算的行丢掉；
+                 开启IPP时 CUBIC 非整数倍缩放在离裁剪边界几十行以内会差1，裁剪时再多留 IPP_CUBIC_MARGIN 行；
+                 NEAREST_EXACT 的定点步长与图像尺寸有关，直接按整图的行号取源图行
+    滤波的重叠:  5x5 高斯模糊上下各需要2行，之后的3x3 Sobel 再需要1行，所以每个条带上下多算3行拼图；
+                 条带贴着图像上下边界时不多算，边界处理(BORDER_REFLECT_101)与整图相同
+    类型:        模糊、灰度、色彩映射都是 uint8；Sobel 用能放下结果的最窄类型
+                 （dx=dy=1, ksize=3 时最大 4x255，int16 足够，比 CV_64F 小4倍），
+                 之后的 convertScaleAbs 结果与 CV_64F 相同
+    输出:        每个结果一个 .npy，按条带顺序追加写入，不在内存里保留整幅结果；
+                 写完后可以用 np.load(path, mmap_mode="r") 内存映射读取
+
+条带行数由 --memory-mb 决定，峰值内存只和图像宽度、条带行数有关。
+
+用法:
+    python tiled_pipeline.py huge.png -o out/ --memory-mb 64
+    python tiled_pipeline.py small.png -o /tmp/tiled --scale 1.5 --strip-rows 7 --check   # 与整图计算比较
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+from fractions import Fraction
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from image_pipeline import INTERPOLATION_ALIASES, INTERPOLATIONS, LEARNING_UPSCALES, learning_pipeline
+
+# 放大时输出行在源图上下各需要多少行（插值核半径 + 1行余量）
+RESIZE_HALO = {
+    "NEAREST": 1,
+    "NEAREST_EXACT": 1,
+    "LINEAR": 2,
+    "LINEAR_EXACT": 2,
+    "AREA": 2,
+    "CUBIC": 3,
+    "LANCZOS4": 5,
+}
+
+# 开启IPP时 INTER_CUBIC 用IPP的实现，非整数倍缩放时离裁剪边界几十个输出行以内的结果与整图可能差1
+# （实测不超过40行），裁剪时上下再多留这么多输出行
+IPP_CUBIC_MARGIN = 64
+
+BLUR_KSIZE = 5
+SOBEL_KSIZE = 3
+# 拼图条带上下多算的行数：模糊半径 + Sobel半径
+FILTER_HALO = BLUR_KSIZE // 2 + SOBEL_KSIZE // 2
+
+
+def sobel_depth(dx=1, dy=1, ksize=SOBEL_KSIZE):
+    """uint8 输入时能放下 Sobel 结果的最窄类型: "16S" 或 "32F" """
+    kx, ky = cv2.getDerivKernels(dx, dy, ksize)
+    bound = np.abs(kx).sum() * np.abs(ky).sum() * 255
+    return "16S" if bound <= np.iinfo(np.int16).max else "32F"
+
+
+def scaled_length(length, scale):
+    """cv2.resize(fx=scale) 的输出长度: cvRound(长度 x 倍数)，与 Python 的 round 一样是四舍六入五成双"""
+    return int(round(length * scale))
+
+
+def scale_step(scale):
+    """裁剪起始行的步长：起始行是它的倍数时，裁剪后缩放与整图缩放的采样位置一致
+
+    起始行 x scale 要是整数（输出行才能对齐），而且是偶数：裁剪到图像底部时输出行数
+    cvRound((h - start) x scale) 才等于 cvRound(h x scale) - start x scale（五成双的舍入与整数部分奇偶有关）
+    """
+    fraction = Fraction(scale).limit_denominator(1000)
+    if abs(float(fraction) - scale) > 1e-9:
+        raise ValueError(f"分条带处理需要有理数的缩放倍数: {scale}")
+    return fraction.denominator * (1 if fraction.numerator % 2 == 0 else 2)
+
+
+@lru_cache(maxsize=16)
+def nearest_exact_rows(height, scale):
+    """整图 INTER_NEAREST_EXACT 缩放时每个输出行取的源图行号（对一列行号做同样的缩放，由OpenCV自己算）"""
+    columns = int(np.ceil(1 / scale)) + 1
+    index = np.repeat(np.arange(height, dtype=np.int32)[:, None], columns, axis=1)
+    return cv2.resize(index, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST_EXACT)[:, 0]
+
+
+def resize_rows(src, scale, interpolation, y0, y1):
+    """整图 cv2.resize(src, fx=fy=scale) 结果的第 y0 到 y1 行，只缩放需要的源图行"""
+    if interpolation == "NEAREST_EXACT":
+        # NEAREST_EXACT 的定点采样步长由整图尺寸算出，裁剪后会有1行的偏差；
+        # 直接取整图每个输出行对应的源图行，只在水平方向缩放
+        sy = nearest_exact_rows(src.shape[0], scale)[y0:y1]
+        width = scaled_length(src.shape[1], scale)
+        return cv2.resize(src[sy], (width, y1 - y0), interpolation=cv2.INTER_NEAREST_EXACT)
+    step = scale_step(scale)
+    halo = RESIZE_HALO[interpolation]
+    if interpolation == "CUBIC" and scale != int(scale) and cv2.ipp.useIPP():
+        halo += int(np.ceil(IPP_CUBIC_MARGIN / scale))
+    # 输出行 y 的采样中心在源图的 (y + 0.5) / scale - 0.5 行，再加上插值核需要的上下几行
+    first = int(np.floor((y0 + 0.5) / scale - 0.5)) - halo
+    last = int(np.ceil((y1 - 0.5) / scale - 0.5)) + halo
+    start = max(0, first) // step * step
+    # 裁剪的行数也取 step 的倍数，缩放后的行数是整数；到底部时与整图一样在 h 处截止
+    end = min(src.shape[0], start + -(-(last + 1 - start) // step) * step)
+    rows = cv2.resize(src[start:end], None, fx=scale, fy=scale, interpolation=INTERPOLATIONS[interpolation])
+    # start 是 step 的倍数，start x scale 是整数
+    fraction = Fraction(scale).limit_denominator(1000)
+    offset = start * fraction.numerator // fraction.denominator
+    rows = rows[y0 - offset:y1 - offset]
+    if len(rows) != y1 - y0:
+        raise ValueError(f"{interpolation} x{scale}: 第 {y0}~{y1} 行只得到 {len(rows)} 行")
+    return rows
+
+
+class NpyWriter:
+    """按行顺序追加写入的 .npy 文件"""
+
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self._file = open(path, "wb")
+        np.lib.format.write_array_header_1_0(self._file, {
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': self.shape,
+        })
+
+    def write(self, rows):
+        if rows.shape[1:] != self.shape[1:] or rows.dtype != self.dtype:
+            raise ValueError(f"{self.path}: 行的形状/类型不对 {rows.shape} {rows.dtype}")
+        self._file.write(np.ascontiguousarray(rows).data)
+        self.rows += len(rows)
+
+    def close(self):
+        self._file.close()
+        if self.rows != self.shape[0]:
+            raise IOError(f"{self.path}: 只写了 {self.rows}/{self.shape[0]} 行")
+
+
+def strip_rows_for(width, memory_mb):
+    """按内存预算估算每个条带的行数（拼图一行的各种中间结果约 3 x 8 字节/像素）"""
+    return max(8, (memory_mb << 20) // (width * 3 * 8))
+
+
+def run_tiled(image, output_dir, scale=4, colormap="RAINBOW", memory_mb=64, strip_rows=None, outputs=None):
+    """分条带计算 learning.py 的处理链，结果写到 output_dir/<名字>.npy；返回 {名字: 路径}
+
+    outputs 为需要写出的结果名字，默认全部（与 learning_pipeline 相同的20个）
+    """
+    height, width = image.shape[:2]
+    big_h, big_w = scaled_length(height, scale), scaled_length(width, scale)
+    depth = sobel_depth()
+    colormap = getattr(cv2, "COLORMAP_" + colormap)
+    channels = image.shape[2:]
+    os.makedirs(output_dir, exist_ok=True)
+
+    groups = [LEARNING_UPSCALES[:4], LEARNING_UPSCALES[4:]]
+    shapes = {f"big_{name}": ((big_h, big_w) + channels, np.uint8) for name in LEARNING_UPSCALES}
+    for i in (1, 2):
+        mosaic = (2 * big_h, 2 * big_w)
+        shapes.update({
+            f"imgbig{i}": (mosaic + channels, np.uint8),
+            f"imgbig{i}_smooth": (mosaic + channels, np.uint8),
+            f"imgbig{i}_gray": (mosaic, np.uint8),
+            f"imgbig{i}_grad": (mosaic + channels, np.int16 if depth == "16S" else np.float32),
+            f"imgbig{i}_color": (mosaic + (3,), np.uint8),
+            f"imgbig{i}_grad_color": (mosaic + (3,), np.uint8),
+        })
+    outputs = list(shapes) if outputs is None else list(outputs)
+    writers = {name: NpyWriter(os.path.join(output_dir, name + ".npy"), *shapes[name]) for name in outputs}
+
+    rows = strip_rows or strip_rows_for(2 * big_w, memory_mb)
+    try:
+        for i, group in enumerate(groups, 1):
+            big = f"imgbig{i}"
+            cells = [INTERPOLATION_ALIASES.get(name, name) for name in group]
+            mosaic_h = 2 * big_h
+            for y0 in range(0, mosaic_h, rows):
+                y1 = min(mosaic_h, y0 + rows)
+                top, bottom = max(0, y0 - FILTER_HALO), min(mosaic_h, y1 + FILTER_HALO)
+
+                # 拼图的 top 到 bottom 行：第 r 行格子的两张放大图左右拼接
+                parts = []
+                for r in (0, 1):
+                    start, end = max(top, r * big_h), min(bottom, (r + 1) * big_h)
+                    if start < end:
+                        parts.append(np.hstack([resize_rows(image, scale, cell, start - r * big_h, end - r * big_h)
+                                                for cell in cells[2 * r:2 * r + 2]]))
+                strip = np.vstack(parts) if len(parts) > 1 else parts[0]
+                smooth = cv2.GaussianBlur(strip, (BLUR_KSIZE, BLUR_KSIZE), 0)
+                keep = slice(y0 - top, y1 - top)
+                gray = cv2.cvtColor(smooth[keep], cv2.COLOR_BGR2GRAY) if smooth.ndim == 3 else smooth[keep]
+                # Sobel 要用到条带上下1行模糊结果，先在整个条带上算再截取
+                grad = cv2.Sobel(smooth, getattr(cv2, "CV_" + depth), 1, 1, ksize=SOBEL_KSIZE)[keep]
+                results = {
+                    big: strip[keep],
+                    f"{big}_smooth": smooth[keep],
+                    f"{big}_gray": gray,
+                    f"{big}_grad": grad,
+                }
+                if f"{big}_color" in writers:
+                    results[f"{big}_color"] = cv2.applyColorMap(gray, colormap)
+                if f"{big}_grad_color" in writers:
+                    results[f"{big}_grad_color"] = cv2.applyColorMap(cv2.convertScaleAbs(grad), colormap)
+                # 单张放大图就是拼图里对应的格子
+                for c, name in enumerate(group):
+                    row, column = divmod(c, 2)
+                    start, end = max(y0, row * big_h), min(y1, (row + 1) * big_h)
+                    if f"big_{name}" in writers and start < end:
+                        results[f"big_{name}"] = strip[start - top:end - top, column * big_w:(column + 1) * big_w]
+                for name, result in results.items():
+                    if name in writers:
+                        writers[name].write(result)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {name: writer.path for name, writer in writers.items()}
+
+
+def compare_with_pipeline(image, paths, scale=4, colormap="RAINBOW"):
+    """与整图计算的 learning_pipeline 逐像素比较，返回不一致的结果名字（整图要放进内存，只适合小图）"""
+    full = learning_pipeline(scale, colormap).run(image, outputs=list(paths))
+    return [name for name, path in paths.items() if not np.array_equal(np.load(path, mmap_mode="r"), full[name])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分条带处理 learning.py 的处理链，内存占用不随图像高度增长")
+    parser.add_argument("image", help="源图片")
+    parser.add_argument("-o", "--output", default="tiled", help="输出目录（每个结果一个 .npy）")
+    parser.add_argument("--scale", type=float, default=4, help="放大倍数")
+    parser.add_argument("--colormap", default="RAINBOW", help="色彩映射（cv2.COLORMAP_* 去掉前缀）")
+    parser.add_argument("--memory-mb", type=int, default=64, help="每个条带中间结果的内存预算(MB)")
+    parser.add_argument("--strip-rows", type=int, default=0, help="条带行数，0表示按内存预算计算")
+    parser.add_argument("--outputs", nargs="+", help="只写出这些结果（默认全部）")
+    parser.add_argument("--check", action="store_true", help="写完后与整图计算的 learning_pipeline 逐像素比较")
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        raise IOError(f"无法读取图片: {args.image}")
+    start = time.perf_counter()
+    paths = run_tiled(image, args.output, args.scale, args.colormap, args.memory_mb, args.strip_rows or None,
+                      args.outputs)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss 在 Linux 上单位是KB，macOS 上是字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+    print(f"写出 {len(paths)} 个结果到 {args.output}, {elapsed:.2f}s, 峰值内存 {peak:.0f}MB")
+    if args.check:
+        mismatched = compare_with_pipeline(image, paths, args.scale, args.colormap)
+        print(f"与整图计算不一致: {', '.join(mismatched)}" if mismatched else "与整图计算逐像素相同")
+        if mismatched:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
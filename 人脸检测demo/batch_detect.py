@@ -0,0 +1,258 @@
+"""离线批量人脸检测
+
+humanFaceDetector.py 只能处理摄像头画面。这里用同样的 CascadeClassifier 参数
+(scaleFactor=1.1, minNeighbors=8, minSize=(50,80)) 批量处理视频和图片：
+
+    分片:   视频按 --chunk-frames 帧切成若干段，图片每 --images-per-task 张一组，
+            每段/每组是一个任务，分给进程池；每个工作进程只加载一次检测器，
+            并且 cv2.setNumThreads(1)，避免多个进程的OpenCV线程互相抢核
+    内存:   工作进程逐帧读取、只保留检测结果；主进程最多同时提交 进程数x2 个任务，
+            结果按完成顺序写出，不在内存里堆积
+    输出:   .jsonl 每个有人脸的帧一行 {"source", "frame", "time", "faces": [[x,y,w,h], ...]}
+            .csv   每张人脸一行 source,frame,time,x,y,w,h
+    续跑:   每个任务的结果写完后在 <输出>.progress 里记一行(任务, 输出文件长度)。
+            --resume 时把输出截断到最后记录的长度（丢掉中断时写了一半的任务），跳过已完成的任务
+
+用法:
+    python batch_detect.py videos/ photos/ -o faces.jsonl --workers 8
+    python batch_detect.py videos/ -o faces.csv --every 5 --resume
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".webm")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+DEFAULT_CASCADE = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml") \
+    if hasattr(cv2, "data") else "haarcascade_frontalface_default.xml"
+
+# 与 humanFaceDetector.py 相同的检测参数
+DETECT_PARAMS = {'scaleFactor': 1.1, 'minNeighbors': 8, 'minSize': (50, 80)}
+
+CSV_FIELDS = ["source", "frame", "time", "x", "y", "w", "h"]
+
+# 工作进程中的检测器
+_cascade = None
+
+
+def _worker_init(cascade_path):
+    global _cascade
+    cv2.setNumThreads(1)
+    _cascade = cv2.CascadeClassifier(cascade_path)
+    if _cascade.empty():
+        raise IOError(f"无法加载检测器: {cascade_path}")
+
+
+def _detect(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    faces = _cascade.detectMultiScale(gray, **DETECT_PARAMS)
+    return [[int(v) for v in face] for face in faces]
+
+
+def find_inputs(paths):
+    """展开目录（递归），返回排序后的 (视频列表, 图片列表)"""
+    videos, images = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+        else:
+            files = [path]
+        for file in files:
+            extension = os.path.splitext(file)[1].lower()
+            if extension in VIDEO_EXTENSIONS:
+                videos.append(file)
+            elif extension in IMAGE_EXTENSIONS:
+                images.append(file)
+    return sorted(set(videos)), sorted(set(images))
+
+
+def make_tasks(videos, images, chunk_frames=300, images_per_task=64):
+    """生成任务: ("video", 路径, 起始帧, 结束帧) / ("images", 路径列表)
+
+    帧数未知的视频（部分格式读不到帧数）整个作为一个任务
+    """
+    for path in videos:
+        cap = cv2.VideoCapture(path)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+        cap.release()
+        if frame_count <= 0:
+            yield ("video", path, 0, None)
+            continue
+        for start in range(0, frame_count, chunk_frames):
+            yield ("video", path, start, min(start + chunk_frames, frame_count))
+    for start in range(0, len(images), images_per_task):
+        yield ("images", tuple(images[start:start + images_per_task]))
+
+
+def task_key(task):
+    """任务在进度文件中的标识，输入和参数不变时每次运行都相同"""
+    if task[0] == "video":
+        _, path, start, end = task
+        return f"video:{path}:{start}:{end}"
+    return f"images:{task[1][0]}:{len(task[1])}"
+
+
+def run_task(task, every=1):
+    """工作进程中执行一个任务，返回 (帧数, 记录列表)；记录只包含检测到人脸的帧"""
+    records = []
+    if task[0] == "images":
+        frames = 0
+        for path in task[1]:
+            image = cv2.imread(path)
+            if image is None:
+                # 读不出的图片不算处理过的帧
+                continue
+            frames += 1
+            faces = _detect(image)
+            if faces:
+                records.append({'source': path, 'frame': 0, 'time': 0.0, 'faces': faces})
+        return frames, records
+
+    _, path, start, end = task
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    index = start
+    frames = 0
+    try:
+        while end is None or index < end:
+            # 按整个视频的帧号抽帧，分块处理时抽到的帧与不分块相同
+            if index % every:
+                # 跳过的帧只 grab 不解码
+                if not cap.grab():
+                    break
+                index += 1
+                continue
+            ret, image = cap.read()
+            if not ret:
+                break
+            frames += 1
+            faces = _detect(image)
+            if faces:
+                records.append({'source': path, 'frame': index, 'time': round(index / fps, 3) if fps else 0.0,
+                                'faces': faces})
+            index += 1
+    finally:
+        cap.release()
+    return frames, records
+
+
+def format_records(records, output_format):
+    """把一个任务的记录格式化为要追加到输出文件的文本"""
+    if output_format == "jsonl":
+        return "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for record in records:
+        for face in record['faces']:
+            writer.writerow([record['source'], record['frame'], record['time'], *face])
+    return buffer.getvalue()
+
+
+def load_progress(progress_path):
+    """读取进度文件，返回 (已完成的任务集合, 输出文件的有效长度)"""
+    done, offset = set(), 0
+    if not os.path.exists(progress_path):
+        return done, offset
+    with open(progress_path, encoding="utf-8") as f:
+        for line in f:
+            key, _, size = line.rstrip("\n").rpartition("\t")
+            if key and size.isdigit():
+                done.add(key)
+                offset = int(size)
+    return done, offset
+
+
+def run_batch(inputs, output, workers=None, every=1, chunk_frames=300, images_per_task=64, resume=False,
+              cascade_path=DEFAULT_CASCADE):
+    """批量检测 inputs 中的视频和图片，结果写入 output；返回统计字典"""
+    output_format = "csv" if output.lower().endswith(".csv") else "jsonl"
+    progress_path = output + ".progress"
+    videos, images = find_inputs(inputs)
+    tasks = list(make_tasks(videos, images, chunk_frames, images_per_task))
+
+    done, offset = load_progress(progress_path) if resume else (set(), 0)
+    if resume and os.path.exists(output):
+        # 丢掉中断时写了一半的任务的结果
+        with open(output, "r+b") as f:
+            f.truncate(offset)
+    else:
+        for path in (output, progress_path):
+            if os.path.exists(path):
+                os.remove(path)
+    pending = [task for task in tasks if task_key(task) not in done]
+    print(f"{len(videos)} 个视频, {len(images)} 张图片, {len(tasks)} 个任务, 其中 {len(tasks) - len(pending)} 个已完成")
+
+    workers = workers or os.cpu_count() or 1
+    stats = {'tasks': 0, 'frames': 0, 'detections': 0}
+    start = time.perf_counter()
+    with open(output, "a", encoding="utf-8", newline="") as out, \
+            open(progress_path, "a", encoding="utf-8") as progress, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                initializer=_worker_init, initargs=(cascade_path,)) as executor:
+        if output_format == "csv" and out.tell() == 0:
+            out.write(",".join(CSV_FIELDS) + "\n")
+        queue = iter(pending)
+        in_flight = {}
+        while True:
+            # 最多同时提交 进程数x2 个任务，结果写出后再提交新的
+            while len(in_flight) < workers * 2:
+                task = next(queue, None)
+                if task is None:
+                    break
+                in_flight[executor.submit(run_task, task, every)] = task
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = in_flight.pop(future)
+                try:
+                    frames, records = future.result()
+                except Exception as e:
+                    print(f"任务失败 {task_key(task)}: {e}", file=sys.stderr)
+                    continue
+                out.write(format_records(records, output_format))
+                out.flush()
+                # 结果落盘后再记录进度，续跑时截断到这个长度
+                progress.write(f"{task_key(task)}\t{out.tell()}\n")
+                progress.flush()
+                stats['tasks'] += 1
+                stats['frames'] += frames
+                stats['detections'] += sum(len(record['faces']) for record in records)
+
+    elapsed = time.perf_counter() - start
+    stats['seconds'] = round(elapsed, 2)
+    stats['fps'] = round(stats['frames'] / elapsed, 1) if elapsed else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量人脸检测（视频和图片）")
+    parser.add_argument("inputs", nargs="+", help="视频/图片文件或目录（递归查找）")
+    parser.add_argument("-o", "--output", required=True, help="输出文件，.jsonl 或 .csv")
+    parser.add_argument("--workers", type=int, default=0, help="进程数，0表示CPU核数")
+    parser.add_argument("--every", type=int, default=1, help="视频每隔多少帧检测一帧")
+    parser.add_argument("--chunk-frames", type=int, default=300, help="视频切分成任务的帧数")
+    parser.add_argument("--images-per-task", type=int, default=64, help="每个任务处理的图片数")
+    parser.add_argument("--resume", action="store_true", help="跳过上次已完成的任务，继续写入输出文件")
+    parser.add_argument("--cascade", default=DEFAULT_CASCADE, help="级联检测器XML路径")
+    args = parser.parse_args()
+
+    stats = run_batch(args.inputs, args.output, args.workers or None, max(1, args.every), args.chunk_frames,
+                      args.images_per_task, args.resume, args.cascade)
+    print(f"完成 {stats['tasks']} 个任务, {stats['frames']} 帧, {stats['detections']} 张人脸, "
+          f"{stats['seconds']}s, {stats['fps']} 帧/秒")
+
+
+if __name__ == "__main__":
+    main()
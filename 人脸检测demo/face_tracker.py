@@ -0,0 +1,116 @@
+"""多尺度ROI跟踪的人脸检测
+
+每帧都在完整分辨率的灰度图上 detectMultiScale(scaleFactor=1.1)，要从最小窗口一直缩放到整幅图，
+大部分时间花在没有人脸的背景和不可能出现的尺度上。FaceTracker 把检测分成两种：
+
+    全图扫描: 每 scan_interval 帧一次（或者跟丢时），先把灰度图缩小到 scan_scale 再检测，
+              用来发现新出现的人脸，结果映射回原分辨率
+    ROI搜索:  其余帧只在上一帧每张人脸外扩 roi_margin 的区域里检测，
+              minSize/maxSize 取上一帧框大小的 (1 - size_tolerance) ~ (1 + size_tolerance)，
+              只需要检测很少几个尺度
+
+一张人脸连续 max_misses 帧在ROI里找不到才删除，偶尔漏检时框不会闪烁。
+"""
+import cv2
+import numpy as np
+
+
+class FaceTracker:
+    """cascade 可以是 cv2.CascadeClassifier，也可以是任何有同样 detectMultiScale 接口的检测器"""
+
+    def __init__(self, cascade, scan_interval=10, scan_scale=0.5, roi_margin=0.5, size_tolerance=0.3,
+                 max_misses=2, scale_factor=1.1, min_neighbors=8, min_size=(50, 80)):
+        self.cascade = cascade
+        self.scan_interval = max(1, scan_interval)
+        self.scan_scale = scan_scale
+        self.roi_margin = roi_margin
+        self.size_tolerance = size_tolerance
+        self.max_misses = max_misses
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+        self.faces = []   # [[x, y, w, h], 连续漏检次数]
+        self.frame_index = 0
+        self.counts = {'scan': 0, 'roi': 0}
+
+    def full_scan(self, gray):
+        """缩小后全图检测，返回原分辨率下的框 (N, 4)"""
+        scale = self.scan_scale
+        small = gray if scale == 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        min_size = (max(1, int(self.min_size[0] * scale)), max(1, int(self.min_size[1] * scale)))
+        faces = self.cascade.detectMultiScale(small, scaleFactor=self.scale_factor,
+                                              minNeighbors=self.min_neighbors, minSize=min_size)
+        return np.round(np.reshape(faces, (-1, 4)) / scale).astype(int)
+
+    def search_roi(self, gray, box):
+        """在上一帧框的外扩区域里按相近尺寸检测，返回最接近原位置的框，找不到返回None"""
+        x, y, w, h = box
+        height, width = gray.shape[:2]
+        x0 = max(0, int(x - w * self.roi_margin))
+        y0 = max(0, int(y - h * self.roi_margin))
+        x1 = min(width, int(x + w * (1 + self.roi_margin)))
+        y1 = min(height, int(y + h * (1 + self.roi_margin)))
+        low, high = 1 - self.size_tolerance, 1 + self.size_tolerance
+        min_size = (max(self.min_size[0], int(w * low)), max(self.min_size[1], int(h * low)))
+        max_size = (int(w * high) + 1, int(h * high) + 1)
+        if x1 - x0 < min_size[0] or y1 - y0 < min_size[1]:
+            return None
+
+        faces = self.cascade.detectMultiScale(gray[y0:y1, x0:x1], scaleFactor=self.scale_factor,
+                                              minNeighbors=self.min_neighbors, minSize=min_size, maxSize=max_size)
+        faces = np.reshape(faces, (-1, 4))
+        if len(faces) == 0:
+            return None
+        faces = faces + [x0, y0, 0, 0]
+        # 多个候选时取中心离上一帧最近的
+        centers = faces[:, :2] + faces[:, 2:] / 2
+        best = np.argmin(np.sum((centers - [x + w / 2, y + h / 2]) ** 2, axis=1))
+        return faces[best]
+
+    def detect(self, gray):
+        """处理一帧灰度图，返回原分辨率下的人脸框 [(x, y, w, h), ...]"""
+        scan = not self.faces or self.frame_index % self.scan_interval == 0
+        self.frame_index += 1
+
+        if scan:
+            self.counts['scan'] += 1
+            found = self.full_scan(gray)
+            # 已经在跟踪的人脸保留（漏检计数照常增加），新出现的人脸加入
+            matched = set()
+            for face in self.faces:
+                index = _best_overlap(face[0], found, matched)
+                if index is None:
+                    face[1] += 1
+                else:
+                    face[0], face[1] = list(found[index]), 0
+                    matched.add(index)
+            self.faces += [[list(box), 0] for i, box in enumerate(found) if i not in matched]
+        else:
+            self.counts['roi'] += 1
+            for face in self.faces:
+                box = self.search_roi(gray, face[0])
+                if box is None:
+                    face[1] += 1
+                else:
+                    face[0], face[1] = list(box), 0
+
+        self.faces = [face for face in self.faces if face[1] <= self.max_misses]
+        return [tuple(int(v) for v in face[0]) for face in self.faces]
+
+
+def _best_overlap(box, candidates, used, min_iou=0.3):
+    """candidates 中与 box 重叠(IoU)最大且未被使用的下标，没有足够重叠的返回None"""
+    best, best_iou = None, min_iou
+    x, y, w, h = box
+    for i, (cx, cy, cw, ch) in enumerate(candidates):
+        if i in used:
+            continue
+        iw = min(x + w, cx + cw) - max(x, cx)
+        ih = min(y + h, cy + ch) - max(y, cy)
+        if iw <= 0 or ih <= 0:
+            continue
+        iou = iw * ih / (w * h + cw * ch - iw * ih)
+        if iou > best_iou:
+            best, best_iou = i, iou
+    return best
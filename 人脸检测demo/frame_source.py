@@ -0,0 +1,137 @@
+"""后台线程采集，只保留最新一帧
+
+原来 cap.read() 和检测、显示在同一个线程：等待摄像头的时间和检测时间叠加在一起，
+检测慢于摄像头帧率时，驱动缓冲区里积压的旧帧会被一帧一帧读出来，画面越来越滞后。
+
+LatestFrameSource 在后台线程不断读取，只保留最新的一帧（附带采集时间），
+read() 总是拿到最新的帧，检测期间来不及处理的帧直接丢弃（计入 dropped）。
+
+source 可以是：
+    摄像头编号       0 / "0"
+    视频文件         "test.mp4"
+    图片序列         目录、通配符 "frames/*.png"，或 VideoCapture 支持的 "img_%04d.png"
+视频文件和图片序列按 fps 模拟实时采集（视频默认用文件自身的帧率），
+realtime=False 时不丢帧：后台线程等上一帧被取走后才读下一帧，用于离线处理每一帧。
+"""
+import glob
+import os
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+# image: BGR图像；index: 源中的帧序号；timestamp: 采集完成时的 time.perf_counter()
+Frame = namedtuple("Frame", ["image", "index", "timestamp"])
+
+
+def _image_files(source):
+    """source 是目录或通配符时返回排序后的图片文件列表，否则返回None"""
+    if os.path.isdir(source):
+        pattern = os.path.join(source, "*")
+    elif glob.has_magic(source):
+        pattern = source
+    else:
+        return None
+    return sorted(path for path in glob.glob(pattern) if path.lower().endswith(IMAGE_EXTENSIONS))
+
+
+class LatestFrameSource:
+    """后台线程采集，read() 返回最新一帧"""
+
+    def __init__(self, source=0, fps=None, realtime=True, loop=False):
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        self.source = source
+        self.realtime = realtime
+        self.loop = loop
+        self.live = isinstance(source, int)  # 摄像头本身按自己的帧率出帧，不需要模拟
+        self.captured = 0
+        self.dropped = 0
+
+        self._files = None if self.live else _image_files(source)
+        self._cap = None
+        if self._files is None:
+            self._cap = cv2.VideoCapture(source)
+            if not self._cap.isOpened():
+                raise IOError(f"无法打开视频源: {source}")
+        elif not self._files:
+            raise IOError(f"没有找到图片: {source}")
+        if not self.live and not fps and self._cap is not None:
+            fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps or 30.0
+
+        self._frame = None     # 最新一帧，还没被取走
+        self._finished = False
+        self._stopped = threading.Event()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="capture", daemon=True)
+        self._thread.start()
+
+    def _grab(self, index):
+        """从第 index 帧开始读取，返回 (图像, 帧序号)；源结束时图像为None。读不出来的图片跳过"""
+        if self._files is not None:
+            while index < len(self._files):
+                image = cv2.imread(self._files[index])
+                if image is not None:
+                    return image, index
+                index += 1
+            return None, index
+        ret, image = self._cap.read()
+        return (image if ret else None), index
+
+    def _rewind(self):
+        if self._cap is not None:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def _run(self):
+        index = 0
+        start = time.perf_counter()
+        try:
+            while not self._stopped.is_set():
+                if not self.live and self.realtime:
+                    # 按帧率模拟实时采集
+                    delay = start + self.captured / self.fps - time.perf_counter()
+                    if delay > 0 and self._stopped.wait(delay):
+                        break
+
+                image, index = self._grab(index)
+                if image is None and self.loop and self.captured > 0:
+                    self._rewind()
+                    image, index = self._grab(0)
+                if image is None:
+                    break
+                frame = Frame(image, index, time.perf_counter())
+                index += 1
+
+                with self._condition:
+                    if not self.realtime:
+                        # 不丢帧：等上一帧被取走
+                        self._condition.wait_for(lambda: self._frame is None or self._stopped.is_set())
+                    if self._frame is not None:
+                        self.dropped += 1
+                    self._frame = frame
+                    self.captured += 1
+                    self._condition.notify_all()
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    def read(self, timeout=None):
+        """等待并返回最新一帧（Frame），源结束或超时返回None"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._frame is not None or self._finished, timeout)
+            frame, self._frame = self._frame, None
+            self._condition.notify_all()
+            return frame
+
+    def release(self):
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._thread.join()
+        if self._cap is not None:
+            self._cap.release()
@@ -1,37 +1,81 @@
+import argparse
+import time
+
 import cv2
+import numpy as np
+
+from face_tracker import FaceTracker
+from frame_source import LatestFrameSource
+
+parser=argparse.ArgumentParser(description="摄像头人脸检测")
+parser.add_argument("--track",action="store_true",help="跟踪模式：周期性缩小后全图扫描，其余帧只搜索上一帧人脸附近（默认每帧完整检测）")
+parser.add_argument("--scan-interval",type=int,default=10,help="跟踪模式下每隔多少帧做一次全图扫描")
+parser.add_argument("--scan-scale",type=float,default=0.5,help="跟踪模式下全图扫描前把图像缩小的比例")
+parser.add_argument("--source",default="0",help="摄像头编号、视频文件、图片目录或通配符（如 frames/*.png）")
+parser.add_argument("--fps",type=float,default=0,help="视频/图片序列模拟采集的帧率，0表示视频自身帧率（图片序列30）")
+parser.add_argument("--loop",action="store_true",help="视频/图片序列播放到结尾后从头开始")
+parser.add_argument("--headless",action="store_true",help="不显示窗口，结束时输出帧率和采集到检测完成的延迟")
+args=parser.parse_args()
 
 # 加载人脸检测器对象 括号内为模型的路径
 face_cascade=cv2.CascadeClassifier(cv2.data.haarcascades+"haarcascade_frontalface_default.xml")
 
-# 打开电脑自带摄像头 0表示第一个摄像头
-cap=cv2.VideoCapture(0) 
+# 跟踪模式（--track）：周期性缩小后全图扫描，其余帧只在上一帧人脸附近按相近尺寸检测（见 face_tracker.py）
+tracker=FaceTracker(face_cascade,scan_interval=args.scan_interval,scan_scale=args.scan_scale) if args.track else None
 
+# 后台线程采集，只保留最新一帧，检测总是处理最新的画面（见 frame_source.py）
+# 0表示电脑自带的第一个摄像头
+cap=LatestFrameSource(args.source,fps=args.fps,loop=args.loop)
+
+fps=0.0
+last=time.perf_counter()
+started=last
+latencies=[]  # 每帧从采集完成到检测完成的时间(ms)
 while True:
-    # 读取一帧图像
-    ret, frame=cap.read()#read()返回boolean和numpy
-    if not ret:
+    # 读取最新一帧，源结束时返回None
+    captured=cap.read()
+    if captured is None:
         break
+    frame=captured.image
 
     # 转为灰度图（人脸检测用灰度更快更准）
     gray=cv2.cvtColor(frame,cv2.COLOR_BGR2GRAY)
 
     # 检测人脸
-    faces=face_cascade.detectMultiScale(
-        gray,             # 灰度图
-        scaleFactor=1.1,  # 每次图像缩小比例（越小检测越精细）
-        minNeighbors=8,   # 每个候选矩形需要保留的邻居数（越大越严格） 测试下来8比较合适
-        minSize=(50,80)  # 最小人脸尺寸
-    )
+    if tracker is not None:
+        faces=tracker.detect(gray)
+    else:
+        faces=face_cascade.detectMultiScale(
+            gray,             # 灰度图
+            scaleFactor=1.1,  # 每次图像缩小比例（越小检测越精细）
+            minNeighbors=8,   # 每个候选矩形需要保留的邻居数（越大越严格） 测试下来8比较合适
+            minSize=(50,80)  # 最小人脸尺寸
+        )
+    latencies.append((time.perf_counter()-captured.timestamp)*1000)
 
     # 在人脸区域画矩形框 （x,y）为左上角坐标，（x+w,y+h）为右下角坐标，（0,255,0）bgr颜色，2为线宽
     for (x,y,w,h) in faces:
         cv2.rectangle(frame,(x,y),(x+w,y+h),(0,255,0),2)
 
+    # 显示帧率（滑动平均）
+    now=time.perf_counter()
+    fps=0.9*fps+0.1/(now-last) if fps else 1.0/(now-last)
+    last=now
+    if args.headless:
+        continue
+    cv2.putText(frame,f"FPS: {fps:.1f}",(10,30),cv2.FONT_HERSHEY_SIMPLEX,0.8,(0,255,0),2)
+
     cv2.imshow("Face Detection",frame)
-    
+
     # 按'q'键退出
     if cv2.waitKey(1)&0xFF==ord('q'):
         break
 
 cap.release()
-cv2.destroyAllWindows()
+if latencies:
+    elapsed=time.perf_counter()-started
+    p50,p95=np.percentile(latencies,[50,95])
+    print(f"处理 {len(latencies)} 帧, {len(latencies)/elapsed:.1f} fps, 采集 {cap.captured} 帧, 丢弃 {cap.dropped} 帧")
+    print(f"采集到检测完成延迟: p50={p50:.1f}ms p95={p95:.1f}ms")
+if not args.headless:
+    cv2.destroyAllWindows()
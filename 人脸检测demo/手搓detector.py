@@ -0,0 +1,258 @@
+"""手搓 Haar 级联人脸检测器
+
+加载 humanFaceDetector.py 使用的同一个 haarcascade_frontalface_default.xml，
+不调用 cv2.CascadeClassifier，用 NumPy 自己实现检测过程，方便查看和调整每一步：
+
+    积分图:   np.cumsum 计算像素和与平方和的积分图，任意矩形的和只需要4次查表
+    窗口:     每个尺度下所有 24x24 窗口的左上角一次性展开成一维下标数组
+    级联:     每一级把本级所有弱分类器对所有存活窗口一起计算（查表 -> 矩形和 -> 加权 -> 归一化 -> 比较阈值），
+              累加叶子值后用掩码去掉没通过的窗口，只有存活的窗口进入下一级，没有逐窗口的Python循环
+    多尺度:   与 detectMultiScale 相同，按 scaleFactor 缩小图像而不是放大特征，最后用 groupRectangles 合并
+
+特征值的计算与OpenCV一致：矩形和按权重相加，再除以窗口内部(去掉1像素边框)的
+sqrt(面积 x 平方和 - 和^2)；弱分类器是单节点决策树（特征值 < 阈值 取左叶子，否则取右叶子）。
+
+stage_counts 记录最近一次检测（所有尺度合计）的窗口总数和每一级之后存活的窗口数，用来观察哪几级在淘汰窗口。
+
+用法（与 cv2.CascadeClassifier.detectMultiScale 的速度和结果对比）:
+    python 手搓detector.py --image face.png --sizes 320 640 1280
+"""
+import argparse
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+
+import cv2
+import numpy as np
+
+DEFAULT_CASCADE = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml") \
+    if hasattr(cv2, "data") else "haarcascade_frontalface_default.xml"
+
+THRESHOLD_EPS = 1e-5    # OpenCV 读入级阈值时减去的余量
+GROUP_EPS = 0.2         # groupRectangles 的相似度参数，与 detectMultiScale 相同
+MAX_GATHER = 1 << 22    # 一次查表的元素上限，限制临时数组的内存
+
+
+def _numbers(node):
+    return [float(v) for v in node.text.split()]
+
+
+class HaarCascade:
+    """从 OpenCV 新格式(opencv-cascade-classifier)的 HAAR 级联XML加载的检测器
+
+    只支持单节点(stump)弱分类器和非倾斜特征，frontalface_default 就是这种结构
+    """
+
+    def __init__(self, path=DEFAULT_CASCADE):
+        root = ET.parse(path).getroot()
+        cascade = root.find("cascade")
+        if cascade is None or cascade.findtext("featureType", "").strip() != "HAAR":
+            raise ValueError(f"不是HAAR级联文件: {path}")
+        self.window = (int(cascade.findtext("width")), int(cascade.findtext("height")))
+
+        # 特征：每个特征最多3个矩形 (x, y, w, h) 和对应权重，不足3个的矩形权重为0
+        features = cascade.find("features")
+        self.rects = np.zeros((len(features), 3, 4), dtype=np.int64)
+        self.weights = np.zeros((len(features), 3), dtype=np.float64)
+        for i, feature in enumerate(features):
+            if feature.findtext("tilted", "0").strip() not in ("0", ""):
+                raise ValueError("不支持倾斜特征")
+            for j, rect in enumerate(feature.find("rects")):
+                x, y, w, h, weight = _numbers(rect)
+                self.rects[i, j] = (x, y, w, h)
+                self.weights[i, j] = weight
+
+        # 级：弱分类器的特征编号、阈值、左右叶子值和级阈值
+        self.stages = []
+        for stage in cascade.find("stages"):
+            nodes, leaves = [], []
+            for weak in stage.find("weakClassifiers"):
+                internal = _numbers(weak.find("internalNodes"))
+                if len(internal) != 4:
+                    raise ValueError("只支持单节点弱分类器")
+                nodes.append(internal)
+                leaves.append(_numbers(weak.find("leafValues")))
+            nodes, leaves = np.array(nodes), np.array(leaves)
+            self.stages.append({
+                'threshold': float(stage.findtext("stageThreshold")) - THRESHOLD_EPS,
+                'features': nodes[:, 2].astype(np.int64),
+                'thresholds': nodes[:, 3],
+                'left': leaves[:, 0],
+                'right': leaves[:, 1],
+            })
+        self.stage_counts = []
+        self._offsets = {}
+
+    def _stage_offsets(self, stride):
+        """积分图每行 stride 个元素时，每一级每个特征矩形4个角相对窗口左上角的一维偏移 (K, 3, 4)"""
+        if stride not in self._offsets:
+            x, y, w, h = (self.rects[..., i] for i in range(4))
+            corners = np.stack([y * stride + x, y * stride + x + w,
+                                (y + h) * stride + x, (y + h) * stride + x + w], axis=-1)
+            self._offsets[stride] = [corners[stage['features']] for stage in self.stages]
+        return self._offsets[stride]
+
+    @staticmethod
+    def integral(image):
+        """(H+1, W+1) 的像素和与平方和积分图（float64 对这个范围的整数是精确的）"""
+        height, width = image.shape
+        pixels = image.astype(np.float64)
+        sums = np.zeros((height + 1, width + 1))
+        squares = np.zeros((height + 1, width + 1))
+        np.cumsum(np.cumsum(pixels, axis=0), axis=1, out=sums[1:, 1:])
+        np.cumsum(np.cumsum(pixels * pixels, axis=0), axis=1, out=squares[1:, 1:])
+        return sums, squares
+
+    def scan(self, image, step=1):
+        """在一幅(已缩放的)灰度图上以 step 为步长评估所有窗口，返回通过全部级的窗口左上角 (N, 2) [x, y]"""
+        height, width = image.shape
+        win_w, win_h = self.window
+        if width <= win_w or height <= win_h:
+            return np.empty((0, 2), dtype=np.int64)
+        sums, squares = self.integral(image)
+        stride = width + 1
+        flat_sums, flat_squares = sums.ravel(), squares.ravel()
+
+        # 所有窗口左上角在积分图中的一维下标（与OpenCV相同，不含最后一行/列的位置）
+        ys, xs = np.meshgrid(np.arange(0, height - win_h, step), np.arange(0, width - win_w, step), indexing="ij")
+        base = (ys * stride + xs).ravel()
+
+        # 方差归一化：窗口内部去掉1像素边框的区域
+        norm = np.array([stride + 1, stride + win_w - 1, (win_h - 1) * stride + 1, (win_h - 1) * stride + win_w - 1])
+        area = (win_w - 2) * (win_h - 2)
+
+        def rect_sum(flat, corners):
+            return flat[corners[..., 3]] - flat[corners[..., 1]] - flat[corners[..., 2]] + flat[corners[..., 0]]
+
+        corners = base[:, None] + norm
+        total = rect_sum(flat_sums, corners)
+        nf = area * rect_sum(flat_squares, corners) - total * total
+        inv_nf = np.where(nf > 0, 1.0 / np.sqrt(np.maximum(nf, 1e-12)), 1.0)
+
+        self.stage_counts = [len(base)]
+        for stage, offsets in zip(self.stages, self._stage_offsets(stride)):
+            if len(base) == 0:
+                self.stage_counts.append(0)
+                continue
+            weights = self.weights[stage['features']]
+            # 分块计算，(K, 3, 4, N) 的查表结果不超过 MAX_GATHER 个元素
+            chunk = max(256, MAX_GATHER // offsets.size)
+            keep = np.empty(len(base), dtype=bool)
+            for start in range(0, len(base), chunk):
+                part = base[start:start + chunk]
+                rect_sums = rect_sum(flat_sums, offsets + part[:, None, None, None])  # (N, K, 3)
+                values = np.einsum("nkr,kr->nk", rect_sums, weights) * inv_nf[start:start + chunk, None]
+                leaves = np.where(values < stage['thresholds'], stage['left'], stage['right'])
+                keep[start:start + chunk] = leaves.sum(axis=1) >= stage['threshold']
+            base, inv_nf = base[keep], inv_nf[keep]
+            self.stage_counts.append(len(base))
+        return np.stack([base % stride, base // stride], axis=1)
+
+    def detectMultiScale(self, image, scaleFactor=1.1, minNeighbors=3, minSize=(0, 0), maxSize=None):
+        """与 cv2.CascadeClassifier.detectMultiScale 相同的接口，返回 (N, 4) 的 [x, y, w, h]"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        height, width = gray.shape
+        win_w, win_h = self.window
+        max_w, max_h = maxSize if maxSize and maxSize[0] > 0 else (width, height)
+
+        candidates = []
+        counts = np.zeros(len(self.stages) + 1, dtype=np.int64)
+        factor = 1.0
+        while True:
+            window = (int(round(win_w * factor)), int(round(win_h * factor)))
+            scaled = (int(round(width / factor)), int(round(height / factor)))
+            if scaled[0] <= win_w or scaled[1] <= win_h or window[0] > max_w or window[1] > max_h:
+                break
+            if window[0] >= minSize[0] and window[1] >= minSize[1]:
+                small = cv2.resize(gray, scaled, interpolation=cv2.INTER_LINEAR_EXACT)
+                # 小尺度(缩放不到2倍)时隔一个像素取窗口，与OpenCV相同
+                step = 1 if factor > 2 else 2
+                for x, y in self.scan(small, step):
+                    candidates.append([int(round(x * factor)), int(round(y * factor)), window[0], window[1]])
+                counts += self.stage_counts
+            factor *= scaleFactor
+        self.stage_counts = counts.tolist()
+
+        if not candidates:
+            return np.empty((0, 4), dtype=np.int32)
+        if minNeighbors <= 0:
+            return np.array(candidates, dtype=np.int32)
+        grouped, _ = cv2.groupRectangles(candidates, minNeighbors, GROUP_EPS)
+        return np.reshape(grouped, (-1, 4)).astype(np.int32)
+
+
+def _iou(a, b):
+    iw = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    ih = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    return iw * ih / (a[2] * a[3] + b[2] * b[3] - iw * ih)
+
+
+def match_detections(ours, theirs, min_iou=0.5):
+    """两组框按 IoU 贪心配对，返回配对数"""
+    used = set()
+    matched = 0
+    for box in ours:
+        scores = [(_iou(box, other), j) for j, other in enumerate(theirs) if j not in used]
+        if scores and max(scores)[0] >= min_iou:
+            used.add(max(scores)[1])
+            matched += 1
+    return matched
+
+
+def benchmark(images, sizes, cascade_path=DEFAULT_CASCADE, repeat=3, params=None):
+    """按不同图像宽度对比本检测器和 cv2.CascadeClassifier 的耗时(ms)和检测结果"""
+    params = params or {'scaleFactor': 1.1, 'minNeighbors': 8, 'minSize': (50, 80)}
+    ours = HaarCascade(cascade_path)
+    theirs = cv2.CascadeClassifier(cascade_path)
+    if theirs.empty():
+        raise IOError(f"无法加载检测器: {cascade_path}")
+
+    rows = []
+    for path in images:
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise IOError(f"无法读取图片: {path}")
+        for size in sizes:
+            scaled = cv2.resize(image, (size, int(round(image.shape[0] * size / image.shape[1]))),
+                                interpolation=cv2.INTER_AREA)
+            row = {'image': path, 'size': list(scaled.shape[::-1])}
+            for name, detector in (("numpy", ours), ("opencv", theirs)):
+                times = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    faces = detector.detectMultiScale(scaled, **params)
+                    times.append((time.perf_counter() - start) * 1000.0)
+                row[name] = {'ms': round(min(times), 2), 'faces': np.reshape(faces, (-1, 4)).tolist()}
+            row['matched'] = match_detections(row['numpy']['faces'], row['opencv']['faces'])
+            row['speed_ratio'] = round(row['numpy']['ms'] / max(row['opencv']['ms'], 1e-6), 1)
+            row['stage_counts'] = ours.stage_counts
+            rows.append(row)
+            print(f"{os.path.basename(path)} {row['size'][0]}x{row['size'][1]}: "
+                  f"numpy {row['numpy']['ms']:.1f}ms {len(row['numpy']['faces'])}个, "
+                  f"opencv {row['opencv']['ms']:.1f}ms {len(row['opencv']['faces'])}个, "
+                  f"一致 {row['matched']}个, 慢 {row['speed_ratio']}倍")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy Haar级联检测器与OpenCV对比")
+    parser.add_argument("--image", nargs="+", required=True, help="测试图片")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[320, 640, 1280], help="测试的图像宽度")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快一次")
+    parser.add_argument("--cascade", default=DEFAULT_CASCADE, help="级联检测器XML路径")
+    parser.add_argument("--min-neighbors", type=int, default=8)
+    parser.add_argument("--json", metavar="PATH", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    params = {'scaleFactor': 1.1, 'minNeighbors': args.min_neighbors, 'minSize': (50, 80)}
+    rows = benchmark(args.image, args.sizes, args.cascade, args.repeat, params)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""多连接 asyncio 服务器（无界面）
+
+demo.py 一次只服务一台 iPhone，并且在它断开后退出。这里用 asyncio 同时接受多台设备，
+每个连接保存自己的状态（帧计数、错误计数、协商的协议和选项），
+手掌检测交给所有连接共享的进程池，设备断开重连不需要重启服务器。
+
+协议与 demo.py 相同（见 protocol.py），旧版停等客户端和v2窗口客户端都可以连接。
+
+用法:
+    python async_server.py --port 9999 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import socket
+import time
+
+from buffer_pool import BufferPool
+from frame_log import log, setup_logging
+from hand_distance import failed_result
+from inference_pool import InferencePool
+from protocol import (CREDIT, DEFAULT_WINDOW, DEPTH_BUFFER_SIZE, FRAME_HEADER, HELLO, MAGIC, RGB_BUFFER_SIZE,
+                      SIZE_PREFIX, Frame, accept_hello, parse_frame_header, parse_hello, parse_options,
+                      parse_size_prefix, reject_hello)
+from result_message import encode_result
+from wire_formats import DEFAULT_FORMATS, frame_sizes
+
+HOST = "0.0.0.0"
+PORT = 9999
+RECV_TIMEOUT = 10
+MAX_CONSECUTIVE_ERRORS = 5
+STATS_INTERVAL = 10.0
+
+
+class ClientState:
+    """单个连接的状态"""
+
+    def __init__(self, address):
+        self.address = address
+        self.version = 1
+        self.window = 1
+        self.options = dict(DEFAULT_FORMATS)  # 协商的传输格式
+        self.frame_count = 0
+        self.error_count = 0
+        self.consecutive_errors = 0
+        self.connected_at = time.time()
+        self.last_frame_at = None
+
+    def summary(self):
+        elapsed = max(time.time() - self.connected_at, 1e-6)
+        return (f"{self.address} v{self.version} 窗口{self.window}: "
+                f"{self.frame_count} 帧, {self.error_count} 个错误, {self.frame_count / elapsed:.1f} fps")
+
+
+async def recv_into_exact(loop, sock, view, timeout=RECV_TIMEOUT):
+    """异步版 recv_into_exact，读满view返回True，连接中断返回False"""
+    received = 0
+    while received < len(view):
+        count = await asyncio.wait_for(loop.sock_recv_into(sock, view[received:]), timeout)
+        if count == 0:
+            return False
+        received += count
+    return True
+
+
+async def recv_exact(loop, sock, size, timeout=RECV_TIMEOUT):
+    """异步接收size字节的小数据（帧头、握手），失败返回None"""
+    buffer = bytearray(size)
+    if not await recv_into_exact(loop, sock, memoryview(buffer), timeout):
+        return None
+    return bytes(buffer)
+
+
+class ClientSession:
+    """一个iPhone连接：握手、接收帧、把检测任务交给进程池、按顺序回复结果"""
+
+    def __init__(self, server, sock, address):
+        self.server = server
+        self.sock = sock
+        self.loop = server.loop
+        self.state = ClientState(address)
+        self.rgb_pool = BufferPool(RGB_BUFFER_SIZE, 2)
+        self.depth_pool = BufferPool(DEPTH_BUFFER_SIZE, 2)
+        self._pending_size = None
+        self._next_id = 0
+
+    async def handshake(self):
+        """识别协议版本；v2客户端完成握手
+
+        HELLO 无效时抛出 ValueError/TypeError，由 run() 回复拒绝
+        """
+        head = await recv_exact(self.loop, self.sock, SIZE_PREFIX.size)
+        if head is None:
+            return False
+
+        if head != MAGIC:
+            # 旧版客户端，第一个4字节就是RGB大小
+            self._pending_size = head
+            return True
+
+        rest = await recv_exact(self.loop, self.sock, HELLO.size - len(MAGIC))
+        if rest is None:
+            return False
+        version, window, options_size = parse_hello(head + rest)
+        options_data = await recv_exact(self.loop, self.sock, options_size) if options_size else b""
+        if options_data is None:
+            return False
+
+        granted, self.state.options, reply = accept_hello(window, parse_options(options_data),
+                                                          self.server.max_window)
+        await self.loop.sock_sendall(self.sock, reply)
+        self.state.version = version
+        self.state.window = granted
+        return True
+
+    async def recv_payload(self, size, pool):
+        view = pool.acquire(size)
+        if not await recv_into_exact(self.loop, self.sock, view):
+            pool.release(view)
+            return None
+        return view
+
+    async def read_frame(self):
+        """接收一帧，连接中断或数据错误返回None"""
+        if self.state.version == 1:
+            size_data = self._pending_size or await recv_exact(self.loop, self.sock, SIZE_PREFIX.size)
+            self._pending_size = None
+            if size_data is None:
+                return None
+            rgb_data = await self.recv_payload(parse_size_prefix(size_data), self.rgb_pool)
+            if rgb_data is None:
+                return None
+            await self.loop.sock_sendall(self.sock, SIZE_PREFIX.pack(1))
+
+            depth_data = None
+            try:
+                size_data = await recv_exact(self.loop, self.sock, SIZE_PREFIX.size)
+                if size_data is not None:
+                    depth_data = await self.recv_payload(parse_size_prefix(size_data), self.depth_pool)
+            finally:
+                if depth_data is None:
+                    self.rgb_pool.release(rgb_data)
+            if depth_data is None:
+                return None
+            await self.loop.sock_sendall(self.sock, SIZE_PREFIX.pack(1))
+
+            frame = Frame(self._next_id, time.time(), rgb_data, depth_data)
+            self._next_id += 1
+            return frame
+
+        header = await recv_exact(self.loop, self.sock, FRAME_HEADER.size)
+        if header is None:
+            return None
+        frame_id, timestamp, rgb_size, depth_size = parse_frame_header(header)
+        rgb_data = await self.recv_payload(rgb_size, self.rgb_pool)
+        if rgb_data is None:
+            return None
+        depth_data = await self.recv_payload(depth_size, self.depth_pool)
+        if depth_data is None:
+            self.rgb_pool.release(rgb_data)
+            return None
+        return Frame(frame_id, timestamp, rgb_data, depth_data)
+
+    async def submit(self, frame):
+        """把一帧交给进程池，返回future；数据拷贝进共享内存槽后立即归还缓冲区
+
+        没有空闲槽时 InferencePool.submit 会等待，所以在线程中调用，不阻塞事件循环
+        """
+        try:
+            rgb_size, depth_size = frame_sizes(self.state.options)
+            future = await self.loop.run_in_executor(None, self.server.pool.submit, frame, rgb_size,
+                                                     depth_size, self.state.options)
+        finally:
+            self.rgb_pool.release(frame.rgb_data)
+            self.depth_pool.release(frame.depth_data)
+        return asyncio.wrap_future(future)
+
+    async def receive_loop(self, in_flight):
+        """不断接收帧并提交检测，队列满时自然形成背压
+
+        run() 只在 result_loop 结束后才取消接收，这时不再放入结束标记：
+        没有人取队列，队列满时 put 会永远等下去
+        """
+        try:
+            while True:
+                frame = await self.read_frame()
+                if frame is None:
+                    break
+                await in_flight.put((frame, await self.submit(frame)))
+        except (asyncio.TimeoutError, ConnectionError, OSError, ValueError) as e:
+            log.warning("%s 接收出错: %s", self.state.address, e)
+        except Exception:
+            log.exception("%s 接收时发生意外错误", self.state.address)
+        # 正常结束或出错都要通知 result_loop，否则它会一直等下去；它还在取队列，put 不会卡住
+        await in_flight.put(None)
+
+    async def result_loop(self, in_flight):
+        """按接收顺序等待检测结果，更新状态并回复CREDIT"""
+        while True:
+            item = await in_flight.get()
+            if item is None:
+                return
+            frame, future = item
+            try:
+                result = await future
+            except Exception as e:
+                result = failed_result(str(e))
+
+            state = self.state
+            state.last_frame_at = time.time()
+            if result['ok']:
+                state.frame_count += 1
+                state.consecutive_errors = 0
+                self.server.total_frames += 1
+                for i, hand_info in enumerate(result['hands']):
+                    log.debug("%s 第 %d 帧 手掌 %d: 距离 %.3f 米", state.address, frame.frame_id, i + 1,
+                              hand_info['distance'])
+            else:
+                state.error_count += 1
+                state.consecutive_errors += 1
+                log.warning("%s 第 %d 帧处理失败: %s", state.address, frame.frame_id, result['error'])
+
+            if state.version != 1:
+                # 握手时声明了 result_format 的客户端随CREDIT收到检测结果
+                payload = encode_result(frame.frame_id, result, state.options['result_format'])
+                credit = CREDIT.pack(frame.frame_id, 1 if result['ok'] else 0, len(payload))
+                await self.loop.sock_sendall(self.sock, credit + payload)
+
+            if state.consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                log.warning("%s 连续错误过多，断开连接", state.address)
+                return
+
+    async def run(self):
+        log.info("已连接: %s", self.state.address)
+        try:
+            try:
+                if not await self.handshake():
+                    log.warning("%s 协议握手失败", self.state.address)
+                    return
+            except (ValueError, TypeError) as e:
+                log.warning("%s 协议握手失败: %s", self.state.address, e)
+                await self.loop.sock_sendall(self.sock, reject_hello(str(e)))
+                return
+            # 接收和检测重叠进行：窗口内的帧在进程池中排队，旧版客户端也能预取下一帧
+            in_flight = asyncio.Queue(maxsize=self.state.window + 1)
+            receiver = asyncio.create_task(self.receive_loop(in_flight))
+            try:
+                await self.result_loop(in_flight)
+            finally:
+                receiver.cancel()
+        except (asyncio.TimeoutError, ConnectionError, OSError) as e:
+            log.warning("%s 连接出错: %s", self.state.address, e)
+        except Exception:
+            log.exception("%s 连接时发生意外错误", self.state.address)
+        finally:
+            self.sock.close()
+            log.info("连接已关闭: %s", self.state.summary())
+
+
+class HandDistanceServer:
+    """接受任意数量的连接，所有连接共享一个检测进程池"""
+
+    def __init__(self, host=HOST, port=PORT, workers=None, max_window=DEFAULT_WINDOW, log_level="INFO"):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.max_window = max_window
+        self.log_level = log_level
+        self.sessions = set()
+        self.total_frames = 0
+        self.loop = None
+        self.pool = None
+
+    async def report_stats(self):
+        last_frames = 0
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            fps = (self.total_frames - last_frames) / STATS_INTERVAL
+            last_frames = self.total_frames
+            log.info("当前连接 %d 个, 总吞吐 %.1f fps", len(self.sessions), fps)
+            for session in self.sessions:
+                log.info("  %s", session.state.summary())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        # 每个检测进程各自创建 MediaPipe Hands，帧数据通过共享内存传递
+        self.pool = InferencePool(self.workers, log_level=self.log_level)
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(128)
+        listener.setblocking(False)
+        log.info("服务器启动在 %s:%d，检测进程 %d 个", self.host, self.port, self.workers)
+
+        stats_task = asyncio.create_task(self.report_stats())
+        try:
+            while True:
+                sock, address = await self.loop.sock_accept(listener)
+                sock.setblocking(False)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                session = ClientSession(self, sock, address)
+                self.sessions.add(session)
+                task = asyncio.create_task(session.run())
+                task.add_done_callback(lambda _, s=session: self.sessions.discard(s))
+        finally:
+            stats_task.cancel()
+            listener.close()
+            self.pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多连接手掌距离服务器（无界面）")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None, help="检测进程数，默认等于CPU核数")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="v2客户端最大窗口")
+    parser.add_argument("--log-level", default="INFO", help="日志级别 DEBUG/INFO/WARNING/ERROR")
+    args = parser.parse_args()
+
+    setup_logging(args.log_level)
+    server = HandDistanceServer(args.host, args.port, args.workers, args.window, args.log_level)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        log.info("正在退出...")
+
+
+if __name__ == "__main__":
+    main()
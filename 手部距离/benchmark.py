@@ -0,0 +1,141 @@
+"""性能测试
+
+stages: 不经过网络，对合成帧或采集文件直接运行 demo.py 的处理流程
+        (process_rgb_data / 深度清理 / MediaPipe / 绘制)，统计每个阶段的耗时分布
+e2e:    用 load_client.py 对正在运行的服务器加压，可以依次测试多个并发路数，
+        统计吞吐和采集到结果延迟的 p50/p95/p99，用来找服务器的吞吐上限
+
+用法:
+    python benchmark.py stages --frames 200
+    python benchmark.py stages --capture session.hdc --json stages.json
+    python demo.py --headless &   或   python async_server.py --workers 4 &
+    python benchmark.py e2e --streams 1 2 4 8 --fps 30 --protocol 2 --json e2e.json
+"""
+import argparse
+import json
+import time
+
+import cv2
+
+from demo import compose_frame, infer_frame
+from frame_log import FrameMetrics, log, percentiles, setup_logging
+from hand_tracker import HandTracker
+from load_client import CaptureSource, SyntheticSource, run_streams
+from protocol import DEFAULT_WINDOW, Frame
+
+
+def bench_stages(source, frames=200, warmup=10, render=True, tracker=None):
+    """逐帧运行检测和绘制，返回每个阶段的耗时分位数(毫秒)和帧率
+
+    tracker: HandTracker，测试检测-跟踪调度时使用
+    """
+    timings = {}
+    errors = 0
+    elapsed = 0.0
+    for i in range(warmup + frames):
+        rgb_data, depth_data = source.next_frame()
+        frame = Frame(i, time.time(), rgb_data, depth_data)
+        metrics = FrameMetrics(i, len(rgb_data), len(depth_data))
+        try:
+            result = infer_frame(frame, source.options, metrics=metrics, draw=render, tracker=tracker)
+            if render:
+                compose_frame(result)
+                metrics.mark("render")
+        except (ValueError, cv2.error) as e:
+            # 预热帧的错误不计入统计
+            if i >= warmup:
+                errors += 1
+            log.warning("第 %d 帧处理失败: %s", i, e)
+            continue
+        if i < warmup:
+            continue
+        elapsed += metrics.total_ms()
+        for stage, ms in metrics.timings.items():
+            timings.setdefault(stage, []).append(ms)
+        timings.setdefault("total", []).append(metrics.total_ms())
+
+    return {
+        'frames': frames,
+        'errors': errors,
+        'fps': (frames - errors) / (elapsed / 1000.0) if elapsed else 0.0,
+        'stages_ms': {stage: dict(percentiles(values), mean=sum(values) / len(values))
+                      for stage, values in timings.items()},
+    }
+
+
+def bench_e2e(host, port, make_source, streams_list=(1,), fps=30.0, duration=10.0, protocol=2,
+              window=DEFAULT_WINDOW, result_format="binary", warmup=2.0):
+    """依次以不同的并发路数运行负载客户端，返回每一档的汇总结果
+
+    warmup: 正式测试前先运行的秒数（服务器检测进程启动、模型加载），结果丢弃
+    """
+    if warmup > 0:
+        run_streams(host, port, make_source, max(streams_list), fps, warmup, protocol, window, result_format)
+    runs = []
+    for streams in streams_list:
+        total, _ = run_streams(host, port, make_source, streams, fps, duration, protocol, window, result_format)
+        log.info("%d 路: %.1f fps, 延迟 %s", streams, total['fps'], _format(total['latency_ms']))
+        runs.append(total)
+    return runs
+
+
+def _format(stats):
+    return " ".join(f"{key}={value:.1f}" for key, value in stats.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="手掌距离服务器性能测试")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    stages = sub.add_parser("stages", help="分阶段耗时（不经过网络）")
+    stages.add_argument("--frames", type=int, default=200)
+    stages.add_argument("--warmup", type=int, default=10)
+    stages.add_argument("--no-render", action="store_true", help="不计算绘制阶段")
+    stages.add_argument("--track", type=int, default=0, metavar="K", help="使用检测-跟踪调度，每K帧完整检测一次")
+
+    e2e = sub.add_parser("e2e", help="端到端吞吐和延迟（需要先启动服务器）")
+    e2e.add_argument("--host", default="127.0.0.1")
+    e2e.add_argument("--port", type=int, default=9999)
+    e2e.add_argument("--streams", type=int, nargs="+", default=[1], help="依次测试的并发路数")
+    e2e.add_argument("--fps", type=float, default=30.0, help="每路目标帧率，0表示不限速")
+    e2e.add_argument("--duration", type=float, default=10.0, help="每一档的运行时间(秒)")
+    e2e.add_argument("--protocol", type=int, choices=(1, 2), default=2)
+    e2e.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+    e2e.add_argument("--result-format", default="binary")
+    e2e.add_argument("--warmup", type=float, default=2.0, help="预热时间(秒)，结果不计入")
+
+    for sub_parser in (stages, e2e):
+        sub_parser.add_argument("--capture", metavar="PATH", help="使用采集文件中的帧，而不是合成帧")
+        sub_parser.add_argument("--rgb-format", default="auto")
+        sub_parser.add_argument("--depth-format", default="f32")
+        sub_parser.add_argument("--depth-compression", default="none")
+        sub_parser.add_argument("--json", metavar="PATH", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    setup_logging("INFO")
+    formats = {'rgb_format': args.rgb_format, 'depth_format': args.depth_format,
+               'depth_compression': args.depth_compression}
+    if args.capture:
+        make_source = lambda: CaptureSource(args.capture)
+    else:
+        make_source = lambda: SyntheticSource(formats)
+
+    if args.mode == "stages":
+        tracker = HandTracker(args.track) if args.track > 0 else None
+        report = bench_stages(make_source(), args.frames, args.warmup, not args.no_render, tracker)
+        if tracker:
+            report['tracker'] = dict(tracker.counts, tier=tracker.tier)
+        log.info("%d 帧, %.1f fps, 失败 %d 帧", report['frames'], report['fps'], report['errors'])
+        for stage, stats in report['stages_ms'].items():
+            log.info("  %-8s %s", stage, _format(stats))
+    else:
+        report = bench_e2e(args.host, args.port, make_source, args.streams, args.fps, args.duration,
+                           args.protocol, args.window, args.result_format, args.warmup)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
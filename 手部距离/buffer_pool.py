@@ -0,0 +1,58 @@
+"""接收缓冲区池
+
+每帧的RGB(640x480 BGRA约1.2MB)和深度(256x192 float32约196KB)数据直接用
+socket.recv_into 读进预先分配的 bytearray，不再 data += chunk 反复拼接。
+接收得到的是 memoryview，np.frombuffer 可以直接在上面建立数组视图；
+一帧处理完成后把 memoryview 还给缓冲区池，供下一帧复用。
+"""
+import threading
+import time
+
+from frame_log import log
+
+
+class BufferPool:
+    """固定数量的可复用 bytearray 缓冲区"""
+
+    def __init__(self, size=0, count=4):
+        self.size = size    # 单个缓冲区容量，遇到更大的数据会自动增长
+        self.count = count  # 池中最多保留的空闲缓冲区数量
+        self._free = [bytearray(size) for _ in range(count)] if size else []
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        """取出一个至少size字节的缓冲区，返回长度正好为size的memoryview"""
+        with self._lock:
+            while self._free:
+                buffer = self._free.pop()
+                if len(buffer) >= size:
+                    return memoryview(buffer)[:size]
+                # 数据比缓冲区大（例如分辨率变化），丢弃旧缓冲区
+            self.size = max(self.size, size)
+        return memoryview(bytearray(self.size))[:size]
+
+    def release(self, view):
+        """归还 acquire 得到的memoryview（或底层bytearray）"""
+        if view is None:
+            return
+        buffer = view.obj if isinstance(view, memoryview) else view
+        with self._lock:
+            if len(self._free) < self.count and len(buffer) >= self.size:
+                self._free.append(buffer)
+
+
+def recv_into_exact(connection, view, timeout=10):
+    """用recv_into把数据直接读进view，读满返回True，连接中断或超时返回False"""
+    size = len(view)
+    received = 0
+    start_time = time.time()
+    while received < size:
+        count = connection.recv_into(view[received:], size - received)
+        if count == 0:
+            log.warning("连接中断，已接收 %d/%d 字节", received, size)
+            return False
+        received += count
+        if time.time() - start_time > timeout:
+            log.warning("接收数据超时，已接收 %d/%d 字节", received, size)
+            return False
+    return True
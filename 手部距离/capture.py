@@ -0,0 +1,189 @@
+"""RGB+深度数据流的录制和回放
+
+没有带LiDAR的iPhone时也能复现现场数据、离线测试和调优处理流程：
+录制时把每帧原样（协商后的传输格式，不解码）追加写入采集文件，
+回放时用 mmap 映射文件，按录制时的节奏或尽可能快地把帧交给原来的处理流程，
+帧数据是指向映射内存的 memoryview，不拷贝。
+
+文件格式 (小端):
+    文件头: magic b'HDCAP1\\0\\0' + uint32 元数据长度 + JSON元数据(协议版本、传输格式等)
+    每帧:   帧头(与 protocol.FRAME_HEADER 相同: 帧号, 时间戳, RGB长度, 深度长度) + RGB数据 + 深度数据
+    索引:   帧数 x uint64 帧记录偏移
+    文件尾: uint64 索引偏移 + uint32 帧数 + magic b'HDIX'
+
+录制中断（没有写入索引）的文件回放时会顺序扫描帧头重建索引。
+"""
+import json
+import mmap
+import struct
+import time
+
+import numpy as np
+
+from frame_log import log
+from protocol import FRAME_HEADER, Frame
+from wire_formats import DEFAULT_FORMATS
+
+CAPTURE_MAGIC = b"HDCAP1\0\0"
+INDEX_MAGIC = b"HDIX"
+CAPTURE_HEADER = struct.Struct("<8sI")   # magic, 元数据长度
+CAPTURE_FOOTER = struct.Struct("<QI4s")  # 索引偏移, 帧数, magic
+
+
+class CaptureWriter:
+    """把帧追加写入采集文件，close() 时写入索引"""
+
+    def __init__(self, path, options=None, version=1):
+        self.path = path
+        self._file = open(path, "wb")
+        metadata = json.dumps({'version': version, 'options': options or dict(DEFAULT_FORMATS),
+                               'created': time.time()}).encode("utf-8")
+        self._file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, len(metadata)) + metadata)
+        self._offset = CAPTURE_HEADER.size + len(metadata)
+        self._offsets = []
+
+    def write(self, frame):
+        """写入一帧；frame 的数据可以是 memoryview，直接写入文件不经过拷贝"""
+        self._offsets.append(self._offset)
+        rgb_size, depth_size = len(frame.rgb_data), len(frame.depth_data)
+        self._file.write(FRAME_HEADER.pack(frame.frame_id, frame.timestamp, rgb_size, depth_size))
+        self._file.write(frame.rgb_data)
+        self._file.write(frame.depth_data)
+        self._offset += FRAME_HEADER.size + rgb_size + depth_size
+
+    def close(self):
+        if self._file.closed:
+            return
+        index = np.asarray(self._offsets, dtype="<u8")
+        self._file.write(index.tobytes())
+        self._file.write(CAPTURE_FOOTER.pack(self._offset, len(self._offsets), INDEX_MAGIC))
+        self._file.close()
+        log.info("录制完成: %s, %d 帧", self.path, len(self._offsets))
+
+
+class RecordingChannel:
+    """包装一个协议通道，接收到的每一帧同时写入采集文件"""
+
+    def __init__(self, channel, path):
+        self.channel = channel
+        self.version = channel.version
+        self.window = channel.window
+        self.options = channel.options
+        self.eof = False
+        self.writer = CaptureWriter(path, channel.options, channel.version)
+
+    @property
+    def header_at(self):
+        return self.channel.header_at
+
+    def recv_frame(self):
+        frame = self.channel.recv_frame()
+        if frame is not None:
+            self.writer.write(frame)
+        return frame
+
+    def finish(self, frame, success=True, payload=b""):
+        self.channel.finish(frame, success, payload)
+
+    def close(self):
+        self.writer.close()
+
+
+class ReplayChannel:
+    """从采集文件回放帧，接口与协议通道相同 (recv_frame / finish / options)
+
+    speed: 1.0 按录制时的节奏回放，2.0 两倍速，0 不等待尽可能快
+    loop: 回放到结尾后从头开始
+    """
+
+    version = 0
+    window = 1
+
+    def __init__(self, path, speed=1.0, loop=False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.eof = False
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        magic, metadata_size = CAPTURE_HEADER.unpack_from(self._map, 0)
+        if magic != CAPTURE_MAGIC:
+            raise ValueError(f"不是采集文件: {path}")
+        self._data_start = CAPTURE_HEADER.size + metadata_size
+        metadata = json.loads(bytes(self._view[CAPTURE_HEADER.size:self._data_start]).decode("utf-8"))
+        self.options = dict(DEFAULT_FORMATS, **metadata.get('options', {}))
+        self.offsets = self._read_index()
+        self._next = 0
+        self._clock_start = None
+        self._first_timestamp = None
+        self.header_at = None  # 最近一帧"到达"（按节奏等待结束）的时间(perf_counter)
+        log.info("回放 %s: %d 帧, 传输格式 %s", path, len(self.offsets), self.options)
+
+    def _read_index(self):
+        size = len(self._map)
+        if size >= self._data_start + CAPTURE_FOOTER.size:
+            index_offset, count, magic = CAPTURE_FOOTER.unpack_from(self._map, size - CAPTURE_FOOTER.size)
+            if magic == INDEX_MAGIC and index_offset + count * 8 + CAPTURE_FOOTER.size == size:
+                return np.frombuffer(self._map, dtype="<u8", count=count, offset=index_offset).copy()
+
+        # 没有索引（录制中断），顺序扫描帧头，忽略结尾不完整的帧
+        log.warning("采集文件没有索引，扫描帧头重建: %s", self.path)
+        offsets = []
+        offset = self._data_start
+        while offset + FRAME_HEADER.size <= size:
+            _, _, rgb_size, depth_size = FRAME_HEADER.unpack_from(self._map, offset)
+            end = offset + FRAME_HEADER.size + rgb_size + depth_size
+            if end > size:
+                break
+            offsets.append(offset)
+            offset = end
+        return np.asarray(offsets, dtype="<u8")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def frame_at(self, index):
+        """第index帧，数据是映射内存上的memoryview"""
+        offset = int(self.offsets[index])
+        frame_id, timestamp, rgb_size, depth_size = FRAME_HEADER.unpack_from(self._map, offset)
+        rgb_start = offset + FRAME_HEADER.size
+        depth_start = rgb_start + rgb_size
+        return Frame(frame_id, timestamp, self._view[rgb_start:depth_start],
+                     self._view[depth_start:depth_start + depth_size])
+
+    def recv_frame(self):
+        """返回下一帧；回放结束返回None并设置 eof"""
+        if self._next >= len(self.offsets):
+            if not self.loop or not len(self.offsets):
+                self.eof = True
+                return None
+            self._next = 0
+            self._clock_start = None
+        frame = self.frame_at(self._next)
+        self._next += 1
+
+        if self.speed > 0:
+            # 按录制时的帧间隔等待
+            if self._clock_start is None:
+                self._clock_start = time.perf_counter()
+                self._first_timestamp = frame.timestamp
+            due = self._clock_start + (frame.timestamp - self._first_timestamp) / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.header_at = time.perf_counter()
+        return frame
+
+    def finish(self, frame, success=True, payload=b""):
+        """回放不需要归还缓冲区或回复客户端"""
+
+    def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # 仍有帧引用映射内存，映射在这些帧被回收后释放
+            pass
+        self._file.close()
@@ -1,555 +1,418 @@
+import argparse
 import socket
 import numpy as np
 import cv2
 import signal
 import sys
-import mediapipe as mp
-import struct
-import time
+import threading
+from collections import namedtuple
+from hand_distance import (check_rgb_image, clean_depth_image, close_hands, debug_image_data,
+                           decode_depth_data, detect_hands_and_calculate_distance, failed_result,
+                           process_rgb_data, summarize_result)
+from capture import RecordingChannel, ReplayChannel
+from depth_preprocess import DepthCleaner
+from frame_log import FrameMetrics, MetricsReporter, log, setup_logging
+from hand_tracker import HandTracker
+from inference_pool import InferencePool, InferenceStream
+from pipeline import StagedPipeline
+from protocol import DEFAULT_WINDOW, PROTOCOL_VERSION, accept_channel
+from registration import registration_for
+from renderer import DEFAULT_DISPLAY_RANGE, FrameRenderer
+from result_message import encode_result
+from wire_formats import DEFAULT_FORMATS, RgbDecoder, frame_sizes
 
 HOST = "0.0.0.0"
 PORT = 9999
 
+# 深度图和RGB图的尺寸由连接协商（见 wire_formats.frame_sizes），默认 640x480 / 256x192
+max_consecutive_errors = 5
+
+# 回复给客户端的 elapsed_ms 只包括这些阶段（与多进程模式的 analyze_frame 相同，不含接收）
+PROCESSING_STAGES = ("decode", "depth", "detect")
+
+# 一帧的检测结果，交给显示阶段
+FrameResult = namedtuple("FrameResult", ["frame_id", "rgb_image", "depth_clean", "valid_after_clean",
+                                         "hand_distances", "results", "metrics", "registration"])
+
+# 显示画面绘制，画布在帧之间复用；main 中按 --display-range 重新创建
+frame_renderer = FrameRenderer()
+
 # 全局变量用于清理
 server = None
 conn = None
 
 
 
-# MediaPipe 手掌检测
-mp_hands = mp.solutions.hands
-mp_drawing = mp.solutions.drawing_utils
-hands = mp_hands.Hands(
-    static_image_mode=False,
-    max_num_hands=2,
-    min_detection_confidence=0.3,  # 降低检测置信度阈值
-    min_tracking_confidence=0.3,   # 降低跟踪置信度阈值
-    model_complexity=1             # 使用更复杂的模型
-)
-
 def cleanup():
     """清理socket连接"""
     global server, conn
     if conn:
         try:
             conn.close()
-            print("连接已关闭")
+            log.info("连接已关闭")
         except:
             pass
     if server:
         try:
             server.close()
-            print("服务器已关闭")
+            log.info("服务器已关闭")
         except:
             pass
-    if hands:
-        hands.close()
+    close_hands()
 
 def signal_handler(sig, frame):
     """信号处理器，用于优雅退出"""
-    print("\n正在退出...")
+    log.info("正在退出...")
     cleanup()
     sys.exit(0)
 
-def detect_hands_and_calculate_distance(rgb_image, depth_image):
-    """检测手掌并计算距离"""
-    # 转换BGR到RGB
-    rgb_rgb = cv2.cvtColor(rgb_image, cv2.COLOR_BGR2RGB)
+def infer_frame(frame, formats=DEFAULT_FORMATS, cleaner=None, metrics=None, draw=True, tracker=None, decoder=None):
+    """解码RGB和深度数据、清理深度、检测手掌；数据有问题时抛出ValueError
+
+    formats: 握手时协商的传输格式（channel.options）
+    cleaner: 深度清理器（DepthCleaner），为None时使用默认范围
+    metrics: 本帧的 FrameMetrics（串行模式下已记录接收耗时），为None时新建
+    draw: 是否在RGB图像上绘制手掌关键点，无界面模式下为False
+    tracker: 检测-跟踪调度器（HandTracker），为None时每帧完整检测
+    decoder: 连接的RGB解码器（RgbDecoder），为None时使用本进程按格式和分辨率缓存的解码器
+    """
+    (rgb_width, rgb_height), (depth_width, depth_height) = frame_sizes(formats)
+    rgb_data = frame.rgb_data
+    depth_data = frame.depth_data
+    if metrics is None:
+        metrics = FrameMetrics(frame.frame_id, len(rgb_data), len(depth_data))
     
-    # 检测手掌
-    results = hands.process(rgb_rgb)
+    # 调试数据
+    debug_image_data(rgb_data, "RGB")
     
-    hand_distances = []
+    # 处理RGB数据
+    rgb_image = process_rgb_data(rgb_data, rgb_width, rgb_height, formats['rgb_format'], decoder)
+    if rgb_image is None:
+        raise ValueError("RGB数据处理失败")
     
-    # 添加调试信息
-    if results.multi_hand_landmarks:
-        print(f"检测到 {len(results.multi_hand_landmarks)} 个手掌")
-        
-        for i, hand_landmarks in enumerate(results.multi_hand_landmarks):
-            # 获取手掌中心点（手腕）
-            wrist = hand_landmarks.landmark[mp_hands.HandLandmark.WRIST]
-            
-            # 转换到图像坐标
-            h, w = rgb_image.shape[:2]
-            wrist_x = int(wrist.x * w)
-            wrist_y = int(wrist.y * h)
-            
-            print(f"手掌 {i+1} 位置: ({wrist_x}, {wrist_y})")
-            
-            # 确保坐标在有效范围内
-            print(f"手掌 {i+1} 坐标检查: RGB坐标({wrist_x}, {wrist_y}), 深度图尺寸{depth_image.shape}")
-            
-            # 计算对应的深度图坐标
-            depth_x = int(wrist_x * depth_image.shape[1] / rgb_image.shape[1])
-            depth_y = int(wrist_y * depth_image.shape[0] / rgb_image.shape[0])
-            
-            print(f"手掌 {i+1} 映射到深度图坐标: ({depth_x}, {depth_y})")
-            
-            if 0 <= depth_x < depth_image.shape[1] and 0 <= depth_y < depth_image.shape[0]:
-                # 从雷达的相应位置获取深度值
-                depth_value = depth_image[depth_y, depth_x]
-                
-                print(f"手掌 {i+1} 雷达深度值: {depth_value}")
-                
-                # 过滤无效深度值
-                if not np.isnan(depth_value) and not np.isinf(depth_value) and depth_value > 0:
-                    hand_distances.append({
-                        'distance': depth_value,
-                        'position': (wrist_x, wrist_y),
-                        'depth_position': (depth_x, depth_y)
-                    })
-                    print(f"手掌 {i+1} 距离: {depth_value:.3f}m - 从雷达位置({depth_x}, {depth_y})获取成功")
-                else:
-                    print(f"手掌 {i+1} 雷达深度值无效: {depth_value}")
-                    # 尝试获取周围点的深度值
-                    print("尝试获取雷达周围点的深度值...")
-                    valid_neighbors = []
-                    for dy in [-3, -2, -1, 0, 1, 2, 3]:
-                        for dx in [-3, -2, -1, 0, 1, 2, 3]:
-                            new_x = depth_x + dx
-                            new_y = depth_y + dy
-                            if 0 <= new_x < depth_image.shape[1] and 0 <= new_y < depth_image.shape[0]:
-                                neighbor_depth = depth_image[new_y, new_x]
-                                if not np.isnan(neighbor_depth) and not np.isinf(neighbor_depth) and neighbor_depth > 0:
-                                    valid_neighbors.append(neighbor_depth)
-                                    print(f"  有效雷达周围点({new_x}, {new_y}): {neighbor_depth}")
-                    
-                    # 如果有有效的周围点，使用平均值
-                    if valid_neighbors:
-                        avg_depth = np.mean(valid_neighbors)
-                        hand_distances.append({
-                            'distance': avg_depth,
-                            'position': (wrist_x, wrist_y),
-                            'depth_position': (depth_x, depth_y)
-                        })
-                        print(f"手掌 {i+1} 使用雷达周围点平均距离: {avg_depth:.3f}m")
-                    else:
-                        print(f"手掌 {i+1} 雷达周围没有有效深度数据")
-            else:
-                print(f"手掌 {i+1} 深度图坐标超出范围: ({depth_x}, {depth_y})")
-                print(f"深度图有效范围: 0-{depth_image.shape[1]} x 0-{depth_image.shape[0]}")
-            
-            # 在RGB图像上绘制手掌关键点
-            mp_drawing.draw_landmarks(rgb_image, hand_landmarks, mp_hands.HAND_CONNECTIONS)
-    else:
-        print("未检测到手掌")
+    error = check_rgb_image(rgb_image, rgb_width, rgb_height)
+    if error:
+        raise ValueError(error)
+    metrics.mark("decode")
     
-    return rgb_image, hand_distances, results
-
-def receive_data_with_size(connection, timeout=10):
-    """接收带大小信息的数据，增加超时和错误处理"""
-    try:
-        # 设置接收超时
-        connection.settimeout(timeout)
-        
-        # 接收数据大小（4字节）
-        size_data = connection.recv(4)
-        if not size_data or len(size_data) < 4:
-            print(f"接收数据大小失败: 收到 {len(size_data) if size_data else 0} 字节")
-            return None
-        
-        data_size = struct.unpack('<I', size_data)[0]
-        print(f"期望接收数据大小: {data_size} 字节")
-        
-        # 检查数据大小是否合理
-        if data_size > 10 * 1024 * 1024:  # 10MB限制
-            print(f"数据大小过大: {data_size} 字节")
-            return None
-        
-        # 接收实际数据
-        data = b""
-        start_time = time.time()
-        
-        while len(data) < data_size:
-            remaining = data_size - len(data)
-            chunk = connection.recv(min(remaining, 8192))  # 每次最多接收8KB
-            
-            if not chunk:
-                print(f"连接中断，已接收 {len(data)}/{data_size} 字节")
-                return None
-            
-            data += chunk
-            
-            # 检查是否超时
-            if time.time() - start_time > timeout:
-                print(f"接收数据超时，已接收 {len(data)}/{data_size} 字节")
-                return None
-        
-        print(f"成功接收数据: {len(data)} 字节")
-        return data
-        
-    except socket.timeout:
-        print("接收数据超时")
-        return None
-    except Exception as e:
-        print(f"接收数据时出错: {e}")
-        return None
-
-def send_ack(connection, success=True):
-    """发送确认消息给客户端"""
-    try:
-        ack = struct.pack('<I', 1 if success else 0)
-        connection.send(ack)
-        print(f"发送确认: {'成功' if success else '失败'}")
-    except Exception as e:
-        print(f"发送确认失败: {e}")
-
-def debug_image_data(data, name="image"):
-    """调试图像数据"""
-    if len(data) > 0:
-        print(f"{name} 数据统计:")
-        print(f"  总字节数: {len(data)}")
-        print(f"  前10个字节: {data[:10]}")
-        print(f"  数据类型: {type(data)}")
-        
-        # 转换为numpy数组检查
-        try:
-            arr = np.frombuffer(data, dtype=np.uint8)
-            print(f"  数组形状: {arr.shape}")
-            print(f"  数组范围: {arr.min()} - {arr.max()}")
-            print(f"  数组均值: {arr.mean():.2f}")
-            
-            # 检查数据是否全为0或全为255（可能的数据问题）
-            if arr.min() == arr.max():
-                print(f"  警告: 数据全为 {arr.min()}")
-            elif arr.std() < 1.0:
-                print(f"  警告: 数据变化很小 (标准差: {arr.std():.2f})")
-        except Exception as e:
-            print(f"  数组转换失败: {e}")
-    else:
-        print(f"{name} 数据为空")
-
-def process_rgb_data(rgb_data, expected_width=640, expected_height=480):
-    """处理RGB数据，支持多种格式"""
-    try:
-        rgb_array = np.frombuffer(rgb_data, dtype=np.uint8)
-        total_pixels = len(rgb_array)
-        
-        print(f"RGB数据处理: 总像素数 {total_pixels}")
-        
-        # 检查不同的格式可能性
-        if total_pixels == expected_width * expected_height * 4:  # BGRA/RGBA
-            print("检测到4通道格式 (BGRA/RGBA)")
-            rgb_image = rgb_array.reshape((expected_height, expected_width, 4))
-            
-            # 尝试BGRA格式
-            try:
-                bgr_image = cv2.cvtColor(rgb_image, cv2.COLOR_BGRA2BGR)
-                print("成功转换为BGR (BGRA格式)")
-                return bgr_image
-            except:
-                pass
-            
-            # 尝试RGBA格式
-            try:
-                bgr_image = cv2.cvtColor(rgb_image, cv2.COLOR_RGBA2BGR)
-                print("成功转换为BGR (RGBA格式)")
-                return bgr_image
-            except:
-                pass
-                
-        elif total_pixels == expected_width * expected_height * 3:  # BGR/RGB
-            print("检测到3通道格式 (BGR/RGB)")
-            rgb_image = rgb_array.reshape((expected_height, expected_width, 3))
-            
-            # 尝试RGB格式
-            try:
-                bgr_image = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR)
-                print("成功转换为BGR (RGB格式)")
-                return bgr_image
-            except:
-                pass
-            
-            # 假设已经是BGR格式
-            print("假设为BGR格式")
-            return rgb_image
-            
-        else:
-            print(f"未知格式: 期望 {expected_width}x{expected_height} 的3或4通道图像")
-            print(f"实际像素数: {total_pixels}")
-            return None
-            
-    except Exception as e:
-        print(f"RGB数据处理失败: {e}")
-        return None
-
-# 注册信号处理器
-signal.signal(signal.SIGINT, signal_handler)
+    # 处理深度数据
+    depth_image = decode_depth_data(depth_data, depth_width, depth_height,
+                                    formats['depth_format'], formats['depth_compression'])
+    if depth_image is None:
+        raise ValueError("深度数据大小不匹配")
+    
+    # 处理无效深度值
+    depth_clean, valid_after_clean = clean_depth_image(depth_image, cleaner)
+    metrics.valid_ratio = valid_after_clean / depth_clean.size
+    metrics.mark("depth")
+    
+    # 检测手掌并计算距离，坐标配准按分辨率和客户端内参缓存
+    registration = registration_for((rgb_width, rgb_height), (depth_width, depth_height), formats)
+    rgb_with_hands, hand_distances, results = detect_hands_and_calculate_distance(rgb_image, depth_clean, draw, tracker,
+                                                                                  registration)
+    metrics.hands_found = len(hand_distances)
+    metrics.mark("detect")
+    
+    return FrameResult(frame.frame_id, rgb_with_hands, depth_clean, valid_after_clean, hand_distances, results,
+                       metrics, registration)
 
-# 建立 TCP 服务器
-server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-server.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-server.bind((HOST, PORT))
-server.listen(1)
-print(f"服务器启动在 {HOST}:{PORT}")
-print("等待 iPhone 连接...")
+def compose_frame(result):
+    """绘制距离信息，返回用于显示的RGB图和深度雷达图（复用画布，见 renderer.py）"""
+    return frame_renderer.render(result)
 
-# 设置超时时间
-server.settimeout(30)
-try:
-    conn, addr = server.accept()
-    print(f"已连接: {addr}")
-    # 设置TCP保活 (macOS兼容)
-    conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-    # macOS使用不同的TCP保活选项名称
-    try:
-        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
-        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
-        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
-    except AttributeError:
-        # macOS可能不支持这些选项，使用默认值
-        print("使用默认TCP保活设置")
-except socket.timeout:
-    print("连接超时，没有设备连接")
-    cleanup()
-    sys.exit(1)
-except Exception as e:
-    print(f"接受连接时出错: {e}")
-    cleanup()
-    sys.exit(1)
+def render_frame(result):
+    """绘制距离信息并显示RGB和深度雷达图"""
+    rgb_display, depth_display = compose_frame(result)
+    cv2.imshow("RGB Camera", rgb_display)
+    cv2.imshow("Depth Radar", depth_display)
+    result.metrics.mark("render")
 
-# 深度图和RGB图的尺寸
-depth_width, depth_height = 256, 192
-rgb_width, rgb_height = 640, 480  # 降低分辨率，减少网络压力
+def connection_decoder(options, buffers=3):
+    """按连接协商的RGB格式和分辨率创建解码器，之后每帧复用"""
+    (width, height), _ = frame_sizes(options)
+    return RgbDecoder(options['rgb_format'], width, height, buffers)
 
-try:
+def run_serial(channel, cleaner=None, reporter=None, tracker=None):
+    """串行模式：接收、检测、显示依次在主线程完成"""
+    reporter = reporter or MetricsReporter()
+    decoder = connection_decoder(channel.options, buffers=1)
     frame_count = 0
     consecutive_errors = 0
-    max_consecutive_errors = 5
     
     while True:
-        print(f"\n等待接收第 {frame_count + 1} 帧数据...")
-        
-        # 接收RGB数据
-        rgb_data = receive_data_with_size(conn)
-        if not rgb_data:
-            consecutive_errors += 1
-            print(f"RGB数据接收失败 (错误 {consecutive_errors}/{max_consecutive_errors})")
-            if consecutive_errors >= max_consecutive_errors:
-                print("连续错误过多，退出程序")
+        # 接收一帧 (RGB + 深度)
+        frame = channel.recv_frame()
+        if frame is None:
+            if channel.eof:
+                log.info("回放结束")
                 break
-            continue
-        
-        # 发送RGB接收确认
-        send_ack(conn, True)
-        
-        # 接收深度数据
-        depth_data = receive_data_with_size(conn)
-        if not depth_data:
             consecutive_errors += 1
-            print(f"深度数据接收失败 (错误 {consecutive_errors}/{max_consecutive_errors})")
+            log.warning("帧数据接收失败 (错误 %d/%d)", consecutive_errors, max_consecutive_errors)
             if consecutive_errors >= max_consecutive_errors:
-                print("连续错误过多，退出程序")
+                log.error("连续错误过多，退出程序")
                 break
             continue
+        # 从帧头到达开始计时，"recv" 只是数据传输的时间
+        metrics = FrameMetrics(frame.frame_id, len(frame.rgb_data), len(frame.depth_data), channel.header_at)
+        metrics.mark("recv")
         
-        # 发送深度接收确认
-        send_ack(conn, True)
-        
-        print(f"接收到 RGB: {len(rgb_data)} 字节, 深度: {len(depth_data)} 字节")
-        
-        # 调试数据
-        debug_image_data(rgb_data, "RGB")
-        
+        frame_ok = False
         try:
-            # 处理RGB数据
-            rgb_image = process_rgb_data(rgb_data, rgb_width, rgb_height)
-            
-            if rgb_image is None:
-                print("RGB数据处理失败")
-                consecutive_errors += 1
-                continue
-            
-            # 验证转换后的图像
-            if rgb_image.shape != (rgb_height, rgb_width, 3):
-                print(f"RGB图像形状错误: {rgb_image.shape}")
-                consecutive_errors += 1
-                continue
-            
-            # 检查图像是否有效
-            if np.any(np.isnan(rgb_image)) or np.any(np.isinf(rgb_image)):
-                print("RGB数据包含无效值")
-                consecutive_errors += 1
-                continue
-            
-            # 检查图像是否全黑或全白
-            if rgb_image.mean() < 5 or rgb_image.mean() > 250:
-                print(f"RGB图像可能有问题 (均值: {rgb_image.mean():.2f})")
-                consecutive_errors += 1
-                continue
-            
-            # 处理深度数据
-            depth_array = np.frombuffer(depth_data, dtype=np.float32)
-            expected_depth_size = depth_height * depth_width
-            
-            if len(depth_array) != expected_depth_size:
-                print(f"深度数据大小不匹配: 期望 {expected_depth_size}, 实际 {len(depth_array)}")
-                consecutive_errors += 1
-                continue
-            
-            depth_image = depth_array.reshape((depth_height, depth_width))
-            
-            # 处理无效深度值
-            depth_clean = np.copy(depth_image)
-            
-            # 统计深度数据
-            valid_depth_count = np.sum((depth_clean > 0) & ~np.isnan(depth_clean) & ~np.isinf(depth_clean))
-            total_pixels = depth_clean.size
-            print(f"深度数据统计: 有效像素 {valid_depth_count}/{total_pixels} ({valid_depth_count/total_pixels*100:.1f}%)")
-            
-            # 如果有效深度数据太少，尝试不同的处理方法
-            if valid_depth_count < total_pixels * 0.1:  # 少于10%的有效数据
-                print("警告: 有效深度数据太少，尝试调整处理...")
-                # 尝试不同的阈值
-                depth_clean[depth_clean < 0.1] = 0  # 过滤太近的距离
-                depth_clean[depth_clean > 5.0] = 0  # 过滤太远的距离
-            
-            depth_clean[np.isnan(depth_clean)] = 0
-            depth_clean[np.isinf(depth_clean)] = 0
-            depth_clean[depth_clean < 0] = 0
-            
-            # 检查处理后的深度数据
-            valid_after_clean = np.sum(depth_clean > 0)
-            print(f"清理后有效深度像素: {valid_after_clean}/{total_pixels} ({valid_after_clean/total_pixels*100:.1f}%)")
-            
-            # 如果还是没有有效数据，显示警告
-            if valid_after_clean == 0:
-                print("错误: 没有有效的深度数据！")
-            else:
-                print(f"深度数据范围: {depth_clean[depth_clean > 0].min():.3f} - {depth_clean[depth_clean > 0].max():.3f}")
-            
-            # 检测手掌并计算距离
-            print(f"RGB图像尺寸: {rgb_image.shape}")
-            print(f"深度图像尺寸: {depth_clean.shape}")
-            print(f"深度数据范围: {depth_clean.min():.3f} - {depth_clean.max():.3f}")
-            
-            rgb_with_hands, hand_distances, results = detect_hands_and_calculate_distance(rgb_image, depth_clean)
-            
-
-            
-            # 调整图像大小以便显示
-            rgb_display = cv2.resize(rgb_with_hands, (640, 480))
-            
-            # 归一化深度图用于显示
-            depth_norm = cv2.normalize(depth_clean, None, 0, 255, cv2.NORM_MINMAX)
-            depth_uint8 = depth_norm.astype(np.uint8)
-            depth_display = cv2.resize(depth_uint8, (640, 480))
-            
-            # 在深度图上添加信息
-            cv2.putText(depth_display, "Depth Radar", (10, 30), 
-                      cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            
-            # 显示有效深度数据比例
-            valid_ratio = valid_after_clean / total_pixels * 100
-            cv2.putText(depth_display, f"Valid: {valid_ratio:.1f}%", (10, 60), 
-                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            
-            # 在深度图上标记手掌位置并显示距离
-            for hand_info in hand_distances:
-                pos = hand_info['position']
-                distance = hand_info['distance']
-                depth_pos = hand_info.get('depth_position', None)
-                
-                if depth_pos:
-                    # 使用实际的深度图坐标
-                    depth_x, depth_y = depth_pos
-                else:
-                    # 回退到坐标映射
-                    depth_x = int(pos[0] * depth_width / rgb_width)
-                    depth_y = int(pos[1] * depth_height / rgb_height)
-                
-                # 将深度图坐标映射到显示坐标
-                display_depth_x = int(depth_x * 640 / depth_width)
-                display_depth_y = int(depth_y * 480 / depth_height)
-                
-                # 在深度图上绘制圆圈和距离信息
-                if 0 <= display_depth_x < depth_display.shape[1] and 0 <= display_depth_y < depth_display.shape[0]:
-                    # 绘制白色圆圈
-                    cv2.circle(depth_display, (display_depth_x, display_depth_y), 15, (255, 255, 255), 3)
-                    
-                    # 显示距离信息
-                    text = f"{distance:.2f}m"
-                    cv2.putText(depth_display, text, 
-                              (display_depth_x + 20, display_depth_y), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                    
-                    # 在RGB图像上也标记对应位置
-                    display_rgb_x = int(pos[0] * 640 / rgb_width)
-                    display_rgb_y = int(pos[1] * 480 / rgb_height)
-                    
-                    if 0 <= display_rgb_x < rgb_display_with_info.shape[1] and 0 <= display_rgb_y < rgb_display_with_info.shape[0]:
-                        cv2.circle(rgb_display_with_info, (display_rgb_x, display_rgb_y), 8, (0, 255, 0), 2)
-                        cv2.circle(rgb_display_with_info, (display_rgb_x, display_rgb_y), 3, (0, 255, 0), -1)
-            
-            # 在RGB图像右上角直接显示距离信息
-            rgb_display_with_info = rgb_display.copy()
-            
-            # 显示手掌距离信息
-            if hand_distances:
-                for i, hand_info in enumerate(hand_distances):
-                    distance = hand_info['distance']
-                    
-                    # 根据距离设置颜色
-                    if distance < 0.5:
-                        color = (0, 255, 0)  # 绿色
-                    elif distance < 1.0:
-                        color = (0, 255, 255)  # 黄色
-                    else:
-                        color = (0, 0, 255)  # 红色
-                    
-                    # 在右上角显示距离
-                    text = f"Hand {i+1}: {distance:.2f}m"
-                    cv2.putText(rgb_display_with_info, text, 
-                              (rgb_display.shape[1] - 200, 30 + i * 25), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-            else:
-                # 检查是否有手掌检测但深度数据无效
-                if results.multi_hand_landmarks:
-                    # 有手掌检测但没有有效距离数据
-                    cv2.putText(rgb_display_with_info, "Hand detected", 
-                              (rgb_display.shape[1] - 200, 30), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-                    cv2.putText(rgb_display_with_info, "No depth data", 
-                              (rgb_display.shape[1] - 200, 55), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-                else:
-                    # 显示未检测到手掌
-                    cv2.putText(rgb_display_with_info, "No hand detected", 
-                              (rgb_display.shape[1] - 200, 30), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.7, (128, 128, 128), 2)
-            
-            # 显示图像
-            cv2.imshow("RGB Camera", rgb_display_with_info)
-            cv2.imshow("Depth Radar", depth_display)
-            
-            # 打印检测到的手掌信息
-            if hand_distances:
-                for i, hand_info in enumerate(hand_distances):
-                    print(f"手掌 {i+1}: 距离 {hand_info['distance']:.3f} 米, 位置 {hand_info['position']}")
-            else:
-                print("未检测到手掌")
+            result = infer_frame(frame, channel.options, cleaner, metrics, tracker=tracker, decoder=decoder)
+            render_frame(result)
             
             frame_count += 1
             consecutive_errors = 0  # 重置错误计数
-            print(f"成功显示第 {frame_count} 帧")
+            frame_ok = True
+            reporter.report(metrics)
             
         except Exception as e:
             consecutive_errors += 1
-            print(f"处理图像时出错: {e}")
-            print(f"错误计数: {consecutive_errors}/{max_consecutive_errors}")
+            log.warning("处理图像时出错: %s (错误 %d/%d)", e, consecutive_errors, max_consecutive_errors)
             if consecutive_errors >= max_consecutive_errors:
-                print("连续错误过多，退出程序")
+                log.error("连续错误过多，退出程序")
                 break
             continue
+        finally:
+            # 归还窗口额度（旧版协议已在接收时回复ACK）
+            channel.finish(frame, frame_ok)
         
         if cv2.waitKey(1) & 0xFF == ord("q"):
             break
-            
-except Exception as e:
-    print(f"程序出错: {e}")
-    import traceback
-    traceback.print_exc()
-finally:
-    cleanup()
-    cv2.destroyAllWindows()
+
+def run_headless(channel, cleaner=None, reporter=None, tracker=None):
+    """无界面模式：不绘制、不显示，检测结果随CREDIT返回给客户端
+
+    v2客户端在握手选项中声明 result_format ("json" / "binary")，见 result_message.py；
+    旧版客户端和 result_format 为 "none" 时只回复状态。
+    """
+    reporter = reporter or MetricsReporter()
+    result_format = channel.options.get('result_format', "none")
+    decoder = connection_decoder(channel.options, buffers=1)
+    consecutive_errors = 0
+    
+    while True:
+        frame = channel.recv_frame()
+        if frame is None:
+            if channel.eof:
+                log.info("回放结束")
+                break
+            consecutive_errors += 1
+            log.warning("帧数据接收失败 (错误 %d/%d)", consecutive_errors, max_consecutive_errors)
+            if consecutive_errors >= max_consecutive_errors:
+                log.error("连续错误过多，退出程序")
+                break
+            continue
+        # 从帧头到达开始计时，"recv" 只是数据传输的时间
+        metrics = FrameMetrics(frame.frame_id, len(frame.rgb_data), len(frame.depth_data), channel.header_at)
+        metrics.mark("recv")
+        
+        try:
+            result = infer_frame(frame, channel.options, cleaner, metrics, draw=False, tracker=tracker,
+                                 decoder=decoder)
+            message = summarize_result(result.hand_distances, result.results, metrics.valid_ratio)
+            consecutive_errors = 0
+        except Exception as e:
+            consecutive_errors += 1
+            log.warning("处理图像时出错: %s (错误 %d/%d)", e, consecutive_errors, max_consecutive_errors)
+            message = failed_result(str(e))
+        
+        # 与 run_pooled（analyze_frame）相同，只算解码到检测的处理时间
+        message['elapsed_ms'] = sum(metrics.timings.get(stage, 0.0) for stage in PROCESSING_STAGES)
+        channel.finish(frame, message['ok'], encode_result(frame.frame_id, message, result_format))
+        metrics.mark("reply")
+        reporter.report(metrics)
+        
+        if consecutive_errors >= max_consecutive_errors:
+            log.error("连续错误过多，退出程序")
+            break
+
+def run_pooled(channel, pool, reporter=None, depth_range=None):
+    """无界面多进程模式：接收线程把帧交给检测进程池，结果线程按帧顺序回复客户端
+
+    v2客户端最多有"窗口"个帧在处理中；旧版客户端收到ACK就会发送下一帧，
+    同时处理的帧数受进程池的共享内存槽数限制。
+    """
+    reporter = reporter or MetricsReporter()
+    result_format = channel.options.get('result_format', "none")
+    max_in_flight = channel.window if channel.version == PROTOCOL_VERSION else pool.slot_count
+    rgb_size, depth_size = frame_sizes(channel.options)
+    stream = InferenceStream(pool, channel.options, rgb_size, depth_size, depth_range, max_in_flight)
+    
+    def reply():
+        for frame, metrics, result in stream.results():
+            metrics.mark("infer")
+            metrics.valid_ratio = result['valid_ratio']
+            metrics.hands_found = len(result['hands'])
+            if not result['ok']:
+                log.warning("第 %d 帧处理失败: %s", frame.frame_id, result['error'])
+            channel.finish(frame, result['ok'], encode_result(frame.frame_id, result, result_format))
+            reporter.report(metrics)
+    
+    replier = threading.Thread(target=reply, name="reply", daemon=True)
+    replier.start()
+    consecutive_errors = 0
+    try:
+        while True:
+            frame = channel.recv_frame()
+            if frame is None:
+                if channel.eof:
+                    log.info("回放结束")
+                    break
+                consecutive_errors += 1
+                log.warning("帧数据接收失败 (错误 %d/%d)", consecutive_errors, max_consecutive_errors)
+                if consecutive_errors >= max_consecutive_errors:
+                    log.error("连续错误过多，退出程序")
+                    break
+                continue
+            consecutive_errors = 0
+            metrics = FrameMetrics(frame.frame_id, len(frame.rgb_data), len(frame.depth_data), channel.header_at)
+            metrics.mark("recv")
+            stream.submit(frame, metrics)
+    finally:
+        stream.close()
+        replier.join()
+
+def run_pipeline(channel, queue_size=1, drop_oldest=True, cleaner=None, reporter=None, tracker=None):
+    """流水线模式：接收线程、检测线程和主线程显示通过有界队列连接"""
+    reporter = reporter or MetricsReporter()
+    # 解码和深度清理的缓冲区只在检测线程里使用，交给显示线程的是拷贝（见 infer）
+    decoder = connection_decoder(channel.options, buffers=1)
+    
+    def render(result):
+        if result is not None:
+            render_frame(result)
+            reporter.report(result.metrics)
+        return cv2.waitKey(1) & 0xFF != ord("q")
+    
+    def infer(frame):
+        result = infer_frame(frame, channel.options, cleaner, tracker=tracker, decoder=decoder)
+        # 显示队列满时丢弃旧结果，检测线程不等显示线程，轮换多少个缓冲区都可能在显示时被覆盖；
+        # 交给显示线程前拷贝RGB图和深度图
+        return result._replace(rgb_image=result.rgb_image.copy(), depth_clean=result.depth_clean.copy())
+    
+    pipeline = StagedPipeline(channel.recv_frame, infer, render, channel.finish,
+                              queue_size=queue_size, drop_oldest=drop_oldest,
+                              max_consecutive_errors=max_consecutive_errors,
+                              end_of_stream=lambda: channel.eof)
+    pipeline.run()
+
+def accept_client():
+    """建立 TCP 服务器并等待 iPhone 连接，返回协议通道"""
+    global server, conn
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    server.bind((HOST, PORT))
+    server.listen(1)
+    log.info("服务器启动在 %s:%d", HOST, PORT)
+    log.info("等待 iPhone 连接...")
+    
+    # 设置超时时间
+    server.settimeout(30)
+    try:
+        conn, addr = server.accept()
+        log.info("已连接: %s", addr)
+        # 设置TCP保活 (macOS兼容)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # macOS使用不同的TCP保活选项名称
+        try:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+        except AttributeError:
+            # macOS可能不支持这些选项，使用默认值
+            log.info("使用默认TCP保活设置")
+        
+        # 根据客户端的第一个4字节识别协议版本
+        channel = accept_channel(conn, DEFAULT_WINDOW)
+        if channel is None:
+            log.error("协议握手失败")
+            cleanup()
+            sys.exit(1)
+        return channel
+    except socket.timeout:
+        log.error("连接超时，没有设备连接")
+        cleanup()
+        sys.exit(1)
+    except Exception as e:
+        log.error("接受连接时出错: %s", e)
+        cleanup()
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="手掌检测与距离测量 (Mac端)")
+    parser.add_argument("--pipeline", action="store_true", help="接收/检测/显示分线程流水线运行")
+    parser.add_argument("--headless", action="store_true", help="无界面模式，检测结果随CREDIT返回客户端")
+    parser.add_argument("--queue-size", type=int, default=1, help="流水线检测队列长度")
+    parser.add_argument("--no-drop", action="store_true", help="检测队列满时阻塞接收，而不是丢弃最旧的帧")
+    parser.add_argument("--depth-min", type=float, default=0.0, help="有效深度下限(米，不含)")
+    parser.add_argument("--depth-max", type=float, default=float("inf"), help="有效深度上限(米，不含)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="无界面模式下的检测进程数，0表示在本进程检测（多进程时不支持 --track）")
+    parser.add_argument("--track", type=int, default=0, metavar="K",
+                        help="每K帧完整检测一次，其余帧光流/ROI跟踪；0表示每帧完整检测")
+    parser.add_argument("--target-ms", type=float, default=30.0, help="跟踪模式下检测耗时目标，超出时降低模型档位")
+    parser.add_argument("--record", metavar="PATH", help="把接收到的帧录制到采集文件")
+    parser.add_argument("--replay", metavar="PATH", help="从采集文件回放，不等待iPhone连接")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="回放速度倍数，0表示不等待尽可能快")
+    parser.add_argument("--replay-loop", action="store_true", help="回放到结尾后从头开始")
+    parser.add_argument("--display-range", type=float, nargs=2, default=DEFAULT_DISPLAY_RANGE,
+                        metavar=("MIN", "MAX"), help="深度雷达图着色的固定深度范围(米)")
+    parser.add_argument("--log-level", default="INFO", help="日志级别 DEBUG/INFO/WARNING/ERROR，DEBUG 输出逐帧细节")
+    parser.add_argument("--metrics-interval", type=float, default=5.0, help="帧率和各阶段耗时汇总间隔(秒)")
+    args = parser.parse_args()
+    if args.workers and not args.headless:
+        parser.error("--workers 只能用于 --headless 模式")
+    if args.workers and args.track:
+        parser.error("--workers 多进程模式不支持 --track 跟踪")
+    if args.display_range[1] <= args.display_range[0]:
+        parser.error("--display-range 的上限必须大于下限")
+    
+    setup_logging(args.log_level)
+    reporter = MetricsReporter(args.metrics_interval)
+    global frame_renderer
+    frame_renderer = FrameRenderer(depth_range=args.display_range)
+    
+    tracker = HandTracker(args.track, target_ms=args.target_ms) if args.track > 0 else None
+    
+    # 注册信号处理器
+    signal.signal(signal.SIGINT, signal_handler)
+    
+    if args.replay:
+        channel = ReplayChannel(args.replay, args.replay_speed, args.replay_loop)
+    else:
+        channel = accept_client()
+    if args.record:
+        channel = RecordingChannel(channel, args.record)
+    # 深度清理器按连接协商的深度图尺寸预分配缓冲区，每帧复用；
+    # 各模式都在同一个线程里清理和使用结果（流水线模式交给显示线程的是拷贝），一个缓冲区就够
+    depth_width, depth_height = frame_sizes(channel.options)[1]
+    cleaner = DepthCleaner((depth_height, depth_width), args.depth_min, args.depth_max, buffers=1)
+    try:
+        if args.headless and args.workers:
+            pool = InferencePool(args.workers, log_level=args.log_level)
+            try:
+                run_pooled(channel, pool, reporter, (args.depth_min, args.depth_max))
+            finally:
+                pool.close()
+        elif args.headless:
+            run_headless(channel, cleaner, reporter, tracker)
+        elif args.pipeline:
+            run_pipeline(channel, args.queue_size, not args.no_drop, cleaner, reporter, tracker)
+        else:
+            run_serial(channel, cleaner, reporter, tracker)
+    except Exception:
+        log.exception("程序出错")
+    finally:
+        cleanup()
+        if args.record or args.replay:
+            channel.close()
+        if tracker:
+            log.info("检测/ROI/光流帧数: %s", tracker.counts)
+            tracker.close()
+        if not args.headless:
+            cv2.destroyAllWindows()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""深度图预处理
+
+原来每帧先 np.copy 深度图，再分别用 isnan / isinf / <0 / <0.1 / >5.0 做布尔索引赋值，
+两次 np.sum 计数，再对布尔索引出来的副本求 min/max —— 十几次整图遍历和多个临时数组。
+
+DepthCleaner 预先分配输出缓冲区和掩码，所有步骤都用 out= / where= 写进这些缓冲区：
+一次比较得到有效掩码（NaN、inf 和超出范围的值自然为False），一次计数，
+一次写出清理结果，最小/最大值直接在掩码上归约，每帧不再分配整图大小的临时数组。
+NumPy 无法把这些步骤真正融合成一次遍历，但每一步都是连续内存上的单次向量化遍历。
+"""
+from collections import namedtuple
+
+import numpy as np
+
+DepthStats = namedtuple("DepthStats", ["valid_count", "total", "min_depth", "max_depth"])
+
+
+class DepthCleaner:
+    """把无效深度置0并统计有效像素和深度范围
+
+    min_depth / max_depth: 有效深度范围(米)，min_depth < d < max_depth 视为有效
+    sparse_ratio / sparse_range: 有效像素少于 sparse_ratio 时改用 sparse_range 过滤
+        太近和太远的距离（与原来的行为一致），sparse_range=None 时不做这一步
+    buffers: 轮换使用的输出缓冲区个数。流水线模式下显示线程还在读上一帧的结果时，
+        检测线程会写入下一个缓冲区
+    """
+
+    def __init__(self, shape=(192, 256), min_depth=0.0, max_depth=np.inf,
+                 sparse_ratio=0.1, sparse_range=(0.1, 5.0), buffers=3):
+        self.shape = tuple(shape)
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.sparse_ratio = sparse_ratio
+        self.sparse_range = sparse_range
+        self._outputs = [np.zeros(self.shape, dtype=np.float32) for _ in range(max(1, buffers))]
+        self._next = 0
+        self._valid = np.zeros(self.shape, dtype=bool)
+        self._scratch = np.zeros(self.shape, dtype=bool)
+
+    def _range_mask(self, depth_image, low, high):
+        """valid = low < d < high；NaN比较结果为False，inf在high有限或为inf时都被排除"""
+        np.greater(depth_image, low, out=self._valid)
+        np.less(depth_image, high, out=self._scratch)
+        np.logical_and(self._valid, self._scratch, out=self._valid)
+        return np.count_nonzero(self._valid)
+
+    def clean(self, depth_image):
+        """返回 (清理后的深度图, DepthStats)；深度图是内部缓冲区，下一轮会被复用"""
+        if depth_image.shape != self.shape:
+            raise ValueError(f"深度图尺寸 {depth_image.shape} 与预分配尺寸 {self.shape} 不一致")
+
+        total = depth_image.size
+        valid_count = self._range_mask(depth_image, self.min_depth, self.max_depth)
+
+        # 有效数据太少时收紧范围，过滤太近和太远的距离（low <= d <= high）
+        if self.sparse_range and valid_count < total * self.sparse_ratio:
+            low, high = self.sparse_range
+            np.greater_equal(depth_image, low, out=self._scratch)
+            np.logical_and(self._valid, self._scratch, out=self._valid)
+            np.less_equal(depth_image, high, out=self._scratch)
+            np.logical_and(self._valid, self._scratch, out=self._valid)
+            valid_count = np.count_nonzero(self._valid)
+
+        output = self._outputs[self._next]
+        self._next = (self._next + 1) % len(self._outputs)
+        output.fill(0)
+        np.copyto(output, depth_image, where=self._valid)
+
+        if valid_count:
+            min_depth = float(np.min(output, where=self._valid, initial=np.inf))
+            max_depth = float(np.max(output, where=self._valid, initial=-np.inf))
+        else:
+            min_depth = max_depth = 0.0
+        return output, DepthStats(valid_count, total, min_depth, max_depth)
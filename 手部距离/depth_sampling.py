@@ -0,0 +1,76 @@
+"""向量化的手部深度采样
+
+原来只取手腕一个像素的深度，无效时再用Python双重循环遍历周围7x7邻域。
+这里一次NumPy调用取出所有手、全部21个关键点周围窗口内的深度，
+屏蔽无效值（NaN、inf、<=0、越界）后按手统计中位数、截尾均值和有效点数。
+"""
+import warnings
+
+import numpy as np
+
+NUM_LANDMARKS = 21
+
+
+def landmarks_to_array(multi_hand_landmarks):
+    """把 MediaPipe 的 multi_hand_landmarks 转成 (手数, 21, 2) 的归一化坐标数组"""
+    if not multi_hand_landmarks:
+        return np.empty((0, NUM_LANDMARKS, 2), dtype=np.float32)
+    return np.array([[(lm.x, lm.y) for lm in hand.landmark] for hand in multi_hand_landmarks],
+                    dtype=np.float32)
+
+
+def _window_offsets(radius):
+    """(2r+1)^2 个窗口偏移量，形状 (K, 2)，顺序为 (dx, dy)"""
+    steps = np.arange(-radius, radius + 1)
+    dy, dx = np.meshgrid(steps, steps, indexing="ij")
+    return np.stack((dx.ravel(), dy.ravel()), axis=1)
+
+
+def sample_landmark_depths(depth_image, points, radius=3, trim=0.2):
+    """采样每只手所有关键点周围窗口内的深度
+
+    depth_image: (H, W) float32 深度图，单位米
+    points: (手数, 关键点数, 2) 深度图像素坐标 (x, y)
+    radius: 窗口半径，窗口大小为 (2r+1)x(2r+1)
+    trim: 截尾均值两端各去掉的比例
+
+    返回 dict，每项都是长度为手数的数组:
+        median / trimmed_mean: 有效深度的中位数和截尾均值，没有有效值时为NaN
+        valid_count: 有效深度样本数
+    """
+    points = np.asarray(points)
+    num_hands = points.shape[0]
+    if num_hands == 0:
+        empty = np.empty(0, dtype=np.float32)
+        return {'median': empty, 'trimmed_mean': empty, 'valid_count': np.empty(0, dtype=np.int64)}
+
+    height, width = depth_image.shape
+    centers = np.floor(points).astype(np.int64)                          # (N, L, 2)
+    coords = centers[:, :, None, :] + _window_offsets(radius)[None, None]  # (N, L, K, 2)
+    xs = coords[..., 0]
+    ys = coords[..., 1]
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+
+    # 越界坐标先夹到边界上读取，再用inside屏蔽
+    values = depth_image[np.clip(ys, 0, height - 1), np.clip(xs, 0, width - 1)].astype(np.float32)
+    valid = inside & np.isfinite(values) & (values > 0)
+
+    samples = np.where(valid, values, np.nan).reshape(num_hands, -1)
+    valid_count = valid.reshape(num_hands, -1).sum(axis=1)
+
+    with warnings.catch_warnings():
+        # 某只手没有任何有效样本时 nanmedian 会警告，结果为NaN即可
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(samples, axis=1)
+
+    # 截尾均值：排序后NaN在末尾，前 valid_count 个为有效值
+    ordered = np.sort(samples, axis=1)
+    cut = np.floor(valid_count * trim).astype(np.int64)
+    index = np.arange(ordered.shape[1])[None, :]
+    keep = (index >= cut[:, None]) & (index < (valid_count - cut)[:, None])
+    kept = keep.sum(axis=1)
+    total = np.where(keep, ordered, 0.0).sum(axis=1)
+    trimmed_mean = np.full(num_hands, np.nan, dtype=np.float32)
+    np.divide(total, kept, out=trimmed_mean, where=kept > 0, casting="unsafe")
+
+    return {'median': median.astype(np.float32), 'trimmed_mean': trimmed_mean, 'valid_count': valid_count}
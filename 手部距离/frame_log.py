@@ -0,0 +1,130 @@
+"""日志和每帧指标
+
+热路径上不再直接 print：每帧的细节用 DEBUG 级别输出（logging 的 %s 参数只有在级别打开时
+才会格式化），错误用 WARNING 并按消息模板限流，避免连接异常时刷屏。
+每帧的关键数据记录在 FrameMetrics 中（数据大小、有效深度比例、检测到的手数、各阶段耗时），
+由 MetricsReporter 每隔一段时间汇总输出一行；需要逐帧细节时用 --log-level DEBUG。
+"""
+import logging
+import threading
+import time
+
+log = logging.getLogger("hand_distance")
+
+
+class RateLimitFilter(logging.Filter):
+    """同一消息模板在 interval 秒内最多输出 burst 条，其余丢弃并在下一条中注明数量"""
+
+    def __init__(self, interval=5.0, burst=3):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows = {}  # (级别, 模板) -> [窗口开始时间, 已输出条数, 已丢弃条数]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or self.interval <= 0:
+            return True
+        with self._lock:
+            return self._allow(record)
+
+    def _allow(self, record):
+        now = time.monotonic()
+        key = (record.levelno, record.msg)
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window else 0
+            self._windows[key] = [now, 1, 0]
+            if suppressed:
+                record.msg = f"{record.msg} (之前 {self.interval:.0f} 秒内省略 {suppressed} 条)"
+            return True
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+def setup_logging(level="INFO", rate_interval=5.0):
+    """配置日志级别和限流；level 可以是 DEBUG / INFO / WARNING / ERROR"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s", "%H:%M:%S"))
+    handler.addFilter(RateLimitFilter(rate_interval))
+    log.handlers[:] = [handler]
+    log.setLevel(level.upper() if isinstance(level, str) else level)
+    log.propagate = False
+
+
+class FrameMetrics:
+    """一帧的紧凑指标记录；mark(stage) 记录距上一次标记的耗时(毫秒)"""
+
+    __slots__ = ("frame_id", "rgb_bytes", "depth_bytes", "valid_ratio", "hands_found",
+                 "timings", "start", "_last")
+
+    def __init__(self, frame_id=0, rgb_bytes=0, depth_bytes=0, start=None):
+        self.frame_id = frame_id
+        self.rgb_bytes = rgb_bytes
+        self.depth_bytes = depth_bytes
+        self.valid_ratio = 0.0
+        self.hands_found = 0
+        self.timings = {}
+        self.start = time.perf_counter() if start is None else start
+        self._last = self.start
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = (now - self._last) * 1000.0
+        self._last = now
+
+    def total_ms(self):
+        return (self._last - self.start) * 1000.0
+
+    def as_dict(self):
+        return {
+            'frame_id': self.frame_id,
+            'rgb_bytes': self.rgb_bytes,
+            'depth_bytes': self.depth_bytes,
+            'valid_ratio': round(self.valid_ratio, 4),
+            'hands_found': self.hands_found,
+            'timings_ms': {stage: round(ms, 3) for stage, ms in self.timings.items()},
+        }
+
+    def __str__(self):
+        stages = " ".join(f"{stage}={ms:.1f}" for stage, ms in self.timings.items())
+        return (f"帧 {self.frame_id}: RGB {self.rgb_bytes}B 深度 {self.depth_bytes}B "
+                f"有效深度 {self.valid_ratio * 100:.1f}% 手 {self.hands_found} | {stages} 总计={self.total_ms():.1f}ms")
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """返回 {'p50': ..., 'p95': ..., 'p99': ...}；没有数据时为空字典"""
+    if not len(values):
+        return {}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    # 最近秩法，不插值
+    return {f"p{point}": ordered[min(last, int(round(point / 100.0 * last)))] for point in points}
+
+
+class MetricsReporter:
+    """逐帧指标以 DEBUG 输出，每 interval 秒以 INFO 输出一行汇总（帧率和各阶段平均耗时）"""
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._window_start = time.monotonic()
+        self._frames = 0
+        self._sums = {}
+
+    def report(self, metrics):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("%s", metrics)
+        self._frames += 1
+        for stage, ms in metrics.timings.items():
+            self._sums[stage] = self._sums.get(stage, 0.0) + ms
+
+        elapsed = time.monotonic() - self._window_start
+        if elapsed >= self.interval:
+            averages = " ".join(f"{stage}={total / self._frames:.1f}" for stage, total in self._sums.items())
+            log.info("%.1f fps, 平均耗时(ms): %s", self._frames / elapsed, averages)
+            self._window_start = time.monotonic()
+            self._frames = 0
+            self._sums = {}
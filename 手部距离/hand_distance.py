@@ -0,0 +1,286 @@
+"""手掌检测与距离计算
+
+demo.py（单连接显示版）和 async_server.py（多连接无界面版）共用的处理函数。
+MediaPipe Hands 实例在第一次使用时才创建，每个进程各有一个。
+"""
+import logging
+import time
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from depth_preprocess import DepthCleaner
+from depth_sampling import landmarks_to_array, sample_landmark_depths
+from frame_log import log
+from hand_tracker import draw_landmark_points
+from registration import registration_for
+from wire_formats import DEFAULT_FORMATS, RgbDecoder, decode_depth
+
+# MediaPipe 手掌检测
+mp_hands = mp.solutions.hands
+mp_drawing = mp.solutions.drawing_utils
+hands = None
+
+# 本进程默认的深度清理器，按深度图尺寸预分配缓冲区
+depth_cleaner = None
+# 指定了有效深度范围的清理器，按 (尺寸, 范围) 缓存
+range_cleaners = {}
+# RGB解码器，按 (格式, 分辨率) 缓存
+rgb_decoders = {}
+
+def get_hands():
+    """返回本进程的 Hands 实例，首次调用时创建"""
+    global hands
+    if hands is None:
+        hands = mp_hands.Hands(
+            static_image_mode=False,
+            max_num_hands=2,
+            min_detection_confidence=0.3,  # 降低检测置信度阈值
+            min_tracking_confidence=0.3,   # 降低跟踪置信度阈值
+            model_complexity=1             # 使用更复杂的模型
+        )
+    return hands
+
+def close_hands():
+    """释放 Hands 实例"""
+    global hands
+    if hands:
+        hands.close()
+        hands = None
+
+def detect_hands_and_calculate_distance(rgb_image, depth_image, draw=True, tracker=None, registration=None):
+    """检测手掌并计算距离
+
+    距离取该手全部21个关键点周围7x7窗口内有效深度的中位数（见 depth_sampling.py），
+    手腕像素无效或手有一部分在画面外时仍然可以得到稳定的距离。
+    draw=False 时不在RGB图像上绘制关键点（无界面模式）
+    tracker: HandTracker（见 hand_tracker.py），大部分帧用跟踪代替完整检测；为None时每帧检测
+    registration: RGB到深度图的坐标配准（见 registration.py），为None时按两幅图像视野相同处理
+    """
+    if tracker is None:
+        # 转换BGR到RGB后检测手掌
+        results = get_hands().process(cv2.cvtColor(rgb_image, cv2.COLOR_BGR2RGB))
+        landmarks = landmarks_to_array(results.multi_hand_landmarks)
+    else:
+        results = tracker.process(rgb_image)
+        landmarks = results.landmarks
+    
+    hand_distances = []
+    
+    # 添加调试信息
+    if results.multi_hand_landmarks:
+        log.debug("检测到 %d 个手掌", len(results.multi_hand_landmarks))
+        
+        # 所有手的关键点一次转换到RGB图和深度图坐标，并一次采样深度
+        h, w = rgb_image.shape[:2]
+        depth_h, depth_w = depth_image.shape[:2]
+        if registration is None:
+            registration = registration_for((w, h), (depth_w, depth_h))
+        rgb_points = landmarks * np.array([w, h], dtype=np.float32)
+        depth_points = registration.rgb_to_depth(rgb_points)
+        depth_stats = sample_landmark_depths(depth_image, depth_points, radius=3)
+        wrist = mp_hands.HandLandmark.WRIST
+        
+        for i, hand_landmarks in enumerate(results.multi_hand_landmarks):
+            # 手掌位置仍以手腕标记
+            wrist_x, wrist_y = (int(v) for v in rgb_points[i, wrist])
+            depth_x, depth_y = (int(v) for v in depth_points[i, wrist])
+            valid_count = int(depth_stats['valid_count'][i])
+            
+            if valid_count > 0:
+                distance = float(depth_stats['median'][i])
+                trimmed_mean = float(depth_stats['trimmed_mean'][i])
+                hand_distances.append({
+                    'hand_id': i,
+                    'distance': distance,
+                    'trimmed_mean': trimmed_mean,
+                    'valid_count': valid_count,
+                    'position': (wrist_x, wrist_y),
+                    'depth_position': (depth_x, depth_y),
+                    'landmarks': landmarks[i]  # (21, 2) 归一化坐标
+                })
+                log.debug("手掌 %d 距离: %.3fm (截尾均值 %.3fm, 有效样本 %d)", i + 1, distance, trimmed_mean, valid_count)
+            else:
+                log.debug("手掌 %d 关键点周围没有有效深度数据", i + 1)
+            
+            # 在RGB图像上绘制手掌关键点
+            if draw and tracker is None:
+                mp_drawing.draw_landmarks(rgb_image, hand_landmarks, mp_hands.HAND_CONNECTIONS)
+            elif draw:
+                draw_landmark_points(rgb_image, rgb_points[i])
+    else:
+        log.debug("未检测到手掌")
+    
+    return rgb_image, hand_distances, results
+
+def debug_image_data(data, name="image"):
+    """调试图像数据（只在DEBUG级别下统计，避免每帧遍历整幅图像）"""
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+    if len(data) > 0:
+        log.debug("%s 数据统计:", name)
+        log.debug("  总字节数: %d", len(data))
+        log.debug("  前10个字节: %s", bytes(data[:10]))
+        log.debug("  数据类型: %s", type(data))
+        
+        # 转换为numpy数组检查
+        try:
+            arr = np.frombuffer(data, dtype=np.uint8)
+            log.debug("  数组形状: %s", arr.shape)
+            log.debug("  数组范围: %d - %d", arr.min(), arr.max())
+            log.debug("  数组均值: %.2f", arr.mean())
+            
+            # 检查数据是否全为0或全为255（可能的数据问题）
+            if arr.min() == arr.max():
+                log.debug("  警告: 数据全为 %d", arr.min())
+            elif arr.std() < 1.0:
+                log.debug("  警告: 数据变化很小 (标准差: %.2f)", arr.std())
+        except Exception as e:
+            log.debug("  数组转换失败: %s", e)
+    else:
+        log.debug("%s 数据为空", name)
+
+def get_rgb_decoder(rgb_format="auto", width=640, height=480):
+    """返回本进程中按 (格式, 分辨率) 缓存的RGB解码器"""
+    key = (rgb_format, width, height)
+    if key not in rgb_decoders:
+        rgb_decoders[key] = RgbDecoder(rgb_format, width, height)
+    return rgb_decoders[key]
+
+def process_rgb_data(rgb_data, expected_width=640, expected_height=480, rgb_format="auto", decoder=None):
+    """把RGB数据解码为BGR图像，数据大小不匹配返回None
+
+    rgb_format 为握手时协商的格式（见 wire_formats.py），"auto" 时按第一帧的字节数识别一次。
+    decoder: 连接自己的 RgbDecoder，为None时使用本进程按格式和分辨率缓存的解码器。
+    返回的图像是解码器的内部缓冲区，会在之后的帧中被复用
+    """
+    if decoder is None:
+        decoder = get_rgb_decoder(rgb_format, expected_width, expected_height)
+    bgr_image = decoder.decode(rgb_data)
+    if bgr_image is None:
+        log.warning("RGB数据大小不匹配: 期望 %dx%d 的 %s 数据, 实际 %d 字节",
+                    expected_width, expected_height, rgb_format, len(rgb_data))
+    return bgr_image
+
+def check_rgb_image(rgb_image, expected_width=640, expected_height=480):
+    """检查转换后的RGB图像，有问题时返回错误描述，否则返回None"""
+    # 验证转换后的图像
+    if rgb_image.shape != (expected_height, expected_width, 3):
+        return f"RGB图像形状错误: {rgb_image.shape}"
+    
+    # 检查图像是否有效
+    if np.any(np.isnan(rgb_image)) or np.any(np.isinf(rgb_image)):
+        return "RGB数据包含无效值"
+    
+    # 检查图像是否全黑或全白
+    if rgb_image.mean() < 5 or rgb_image.mean() > 250:
+        return f"RGB图像可能有问题 (均值: {rgb_image.mean():.2f})"
+    
+    return None
+
+def decode_depth_data(depth_data, width=256, height=192, depth_format="f32", compression="none"):
+    """把深度数据解码为 height x width 的float32深度图（f32未压缩时不拷贝），大小不匹配返回None"""
+    try:
+        depth_image = decode_depth(depth_data, depth_format, compression, width, height)
+    except Exception as e:
+        log.warning("深度数据解码失败: %s", e)
+        return None
+    
+    if depth_image is None:
+        log.warning("深度数据大小不匹配: 期望 %dx%d 的 %s 数据, 实际 %d 字节",
+                    width, height, depth_format, len(depth_data))
+    return depth_image
+
+def clean_depth_image(depth_image, cleaner=None):
+    """处理无效深度值，返回清理后的深度图和有效像素数
+
+    cleaner: DepthCleaner，决定有效深度范围；默认使用本进程按尺寸预分配的清理器。
+    返回的深度图是清理器的内部缓冲区，会在之后的帧中被复用
+    """
+    global depth_cleaner
+    if cleaner is None:
+        if depth_cleaner is None or depth_cleaner.shape != depth_image.shape:
+            depth_cleaner = DepthCleaner(depth_image.shape)
+        cleaner = depth_cleaner
+    
+    depth_clean, stats = cleaner.clean(depth_image)
+    valid_after_clean = stats.valid_count
+    total_pixels = stats.total
+    log.debug("清理后有效深度像素: %d/%d (%.1f%%)", valid_after_clean, total_pixels,
+              valid_after_clean / total_pixels * 100)
+    
+    # 如果还是没有有效数据，显示警告
+    if valid_after_clean == 0:
+        log.warning("没有有效的深度数据！")
+    else:
+        log.debug("深度数据范围: %.3f - %.3f", stats.min_depth, stats.max_depth)
+    
+    return depth_clean, valid_after_clean
+
+def summarize_result(hand_distances, results, valid_ratio):
+    """把检测结果整理成只含基本类型的字典，可以跨进程传递，也可以直接编码为JSON"""
+    return {
+        'ok': True,
+        'error': None,
+        'hands_detected': len(results.multi_hand_landmarks or []),
+        'valid_ratio': float(valid_ratio),
+        'hands': [
+            {
+                'hand_id': int(hand_info['hand_id']),
+                'distance': float(hand_info['distance']),
+                'trimmed_mean': float(hand_info['trimmed_mean']),
+                'valid_count': int(hand_info['valid_count']),
+                'position': tuple(int(v) for v in hand_info['position']),
+                'depth_position': tuple(int(v) for v in hand_info['depth_position']),
+                'landmarks': hand_info['landmarks'].round(4).tolist(),
+            }
+            for hand_info in hand_distances
+        ],
+        'elapsed_ms': 0.0,
+    }
+
+def failed_result(error):
+    """处理失败时的结果字典，结构与 summarize_result 相同"""
+    return {'ok': False, 'error': error, 'hands_detected': 0, 'valid_ratio': 0.0, 'hands': [], 'elapsed_ms': 0.0}
+
+def get_range_cleaner(shape, depth_range):
+    """返回本进程中有效深度范围为 depth_range=(下限, 上限) 的清理器"""
+    key = (tuple(shape), tuple(depth_range))
+    if key not in range_cleaners:
+        range_cleaners[key] = DepthCleaner(shape, *depth_range)
+    return range_cleaners[key]
+
+def analyze_frame(rgb_data, depth_data, rgb_size=(640, 480), depth_size=(256, 192), formats=None,
+                  depth_range=None):
+    """不绘制任何画面，只计算手掌距离；返回可以跨进程传递的结果字典
+
+    formats: 握手时协商的传输格式（可以带有相机内参，见 registration.py），默认为旧版客户端的原始格式
+    depth_range: 有效深度范围 (下限, 上限)，为None时使用默认清理器
+    """
+    formats = formats or DEFAULT_FORMATS
+    rgb_width, rgb_height = rgb_size
+    depth_width, depth_height = depth_size
+    start = time.perf_counter()
+    
+    rgb_image = process_rgb_data(rgb_data, rgb_width, rgb_height, formats['rgb_format'])
+    if rgb_image is None:
+        return failed_result("RGB数据处理失败")
+    error = check_rgb_image(rgb_image, rgb_width, rgb_height)
+    if error:
+        return failed_result(error)
+    
+    depth_image = decode_depth_data(depth_data, depth_width, depth_height,
+                                    formats['depth_format'], formats['depth_compression'])
+    if depth_image is None:
+        return failed_result("深度数据大小不匹配")
+    cleaner = get_range_cleaner(depth_image.shape, depth_range) if depth_range else None
+    depth_clean, valid_after_clean = clean_depth_image(depth_image, cleaner)
+    
+    registration = registration_for(rgb_size, depth_size, formats)
+    _, hand_distances, results = detect_hands_and_calculate_distance(rgb_image, depth_clean, draw=False,
+                                                                     registration=registration)
+    
+    result = summarize_result(hand_distances, results, valid_after_clean / depth_clean.size)
+    result['elapsed_ms'] = (time.perf_counter() - start) * 1000.0
+    return result
@@ -0,0 +1,199 @@
+"""手部检测-跟踪调度
+
+原来每帧都对完整的640x480图像运行 hands.process (model_complexity=1)，检测是最大的开销，
+而相邻帧里通常是同样的手、几乎在同样的位置。HandTracker 按下面的顺序选择每帧的处理方式：
+
+    detect: 完整检测（手掌检测+关键点模型），每 detect_interval 帧一次，或者跟踪丢失时
+    flow:   光流(calcOpticalFlowPyrLK)跟踪上一帧的21个关键点，几乎不占时间
+    roi:    只在预测的手部区域（外扩 roi_margin）上运行模型；每 refine_interval 帧一次
+            用来纠正光流漂移，光流质量不够时也用它，预测位置用匀速模型外推
+
+处理耗时的滑动平均超过 target_ms 时降低档位（model_complexity 和检测分辨率），
+明显低于目标时恢复，见 DEFAULT_TIERS。
+"""
+import time
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from depth_sampling import NUM_LANDMARKS, landmarks_to_array
+from frame_log import log
+
+mp_hands = mp.solutions.hands
+
+# (model_complexity, 图像缩放比例)，从精确到省时
+DEFAULT_TIERS = ((1, 1.0), (0, 1.0), (0, 0.75), (0, 0.5))
+
+TIER_COOLDOWN = 30  # 切换档位后至少经过的帧数，避免来回抖动
+
+
+class TrackedHands:
+    """跟踪结果，用法与 Hands.process 的结果相同：multi_hand_landmarks 为空表示没有手
+
+    landmarks: (手数, 21, 2) 归一化坐标；multi_hand_landmarks 的每一项是其中一只手
+    source: 本帧的处理方式 "detect" / "roi" / "flow"
+    """
+
+    def __init__(self, landmarks, source):
+        self.landmarks = landmarks
+        self.multi_hand_landmarks = list(landmarks) if len(landmarks) else None
+        self.source = source
+
+
+class HandTracker:
+    """检测-跟踪调度器，每个数据流一个（内部保存上一帧的状态）"""
+
+    def __init__(self, detect_interval=5, refine_interval=2, min_quality=0.6, target_ms=30.0,
+                 tiers=DEFAULT_TIERS, roi_margin=0.3, max_num_hands=2,
+                 min_detection_confidence=0.3, min_tracking_confidence=0.3):
+        self.detect_interval = max(1, detect_interval)
+        self.refine_interval = max(1, refine_interval)
+        self.min_quality = min_quality  # 一只手成功跟踪的关键点比例下限
+        self.target_ms = target_ms
+        self.tiers = tiers
+        self.roi_margin = roi_margin
+        self.max_num_hands = max_num_hands
+        self.min_detection_confidence = min_detection_confidence
+        self.min_tracking_confidence = min_tracking_confidence
+
+        self.tier = 0
+        self.frame_ms = None  # 处理耗时的指数滑动平均
+        self.counts = {'detect': 0, 'roi': 0, 'flow': 0}
+        self._hands = {}
+        self._cooldown = 0
+        self._prev_gray = None
+        self._landmarks = np.empty((0, NUM_LANDMARKS, 2), dtype=np.float32)
+        self._velocity = np.empty((0, 2), dtype=np.float32)
+        self._since_detect = 0
+
+    def _get_hands(self, complexity, roi):
+        """按(模型复杂度, 是否ROI)缓存 Hands 实例；都用静态模式，帧间跟踪由本类负责"""
+        key = (complexity, roi)
+        if key not in self._hands:
+            self._hands[key] = mp_hands.Hands(
+                static_image_mode=True,
+                max_num_hands=1 if roi else self.max_num_hands,
+                min_detection_confidence=self.min_detection_confidence,
+                min_tracking_confidence=self.min_tracking_confidence,
+                model_complexity=complexity
+            )
+        return self._hands[key]
+
+    def close(self):
+        for hands in self._hands.values():
+            hands.close()
+        self._hands = {}
+
+    def process(self, bgr_image):
+        """处理一帧BGR图像，返回 TrackedHands"""
+        start = time.perf_counter()
+        complexity, scale = self.tiers[self.tier]
+        image = bgr_image
+        if scale != 1.0:
+            image = cv2.resize(bgr_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        landmarks = None
+        source = "detect"
+        if len(self._landmarks) and self._since_detect < self.detect_interval:
+            landmarks = self._track_flow(gray)
+            source = "flow"
+            if landmarks is None or (self._since_detect + 1) % self.refine_interval == 0:
+                # 光流不可靠时用匀速模型外推上一帧的位置
+                predicted = landmarks if landmarks is not None else self._landmarks + self._velocity[:, None, :]
+                landmarks = self._refine_roi(image, predicted, complexity)
+                source = "roi"
+
+        if landmarks is None:
+            landmarks = self._detect(image, complexity)
+            source = "detect"
+            self._since_detect = 0
+        else:
+            self._since_detect += 1
+
+        if len(landmarks) == len(self._landmarks):
+            self._velocity = (landmarks - self._landmarks).mean(axis=1)
+        else:
+            self._velocity = np.zeros((len(landmarks), 2), dtype=np.float32)
+        self._landmarks = landmarks
+        self._prev_gray = gray
+        self.counts[source] += 1
+        self._adapt((time.perf_counter() - start) * 1000.0)
+        return TrackedHands(landmarks, source)
+
+    def _detect(self, image, complexity):
+        results = self._get_hands(complexity, False).process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        return landmarks_to_array(results.multi_hand_landmarks)
+
+    def _track_flow(self, gray):
+        """光流跟踪上一帧的关键点；任意一只手跟踪到的点太少时返回None"""
+        if self._prev_gray is None or self._prev_gray.shape != gray.shape:
+            return None
+        height, width = gray.shape
+        size = np.array([width, height], dtype=np.float32)
+        points = (self._landmarks.reshape(-1, 1, 2) * size).astype(np.float32)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, points, None,
+                                                    winSize=(15, 15), maxLevel=2)
+        if moved is None:
+            return None
+
+        tracked = status.reshape(len(self._landmarks), NUM_LANDMARKS).astype(bool)
+        if tracked.mean(axis=1).min() < self.min_quality:
+            return None
+        moved = moved.reshape(len(self._landmarks), NUM_LANDMARKS, 2) / size
+        # 没跟踪到的点按同一只手其它点的中位位移移动
+        shift = moved - self._landmarks
+        for hand in range(len(moved)):
+            if not tracked[hand].all():
+                median_shift = np.median(shift[hand][tracked[hand]], axis=0)
+                moved[hand][~tracked[hand]] = self._landmarks[hand][~tracked[hand]] + median_shift
+        return moved.astype(np.float32)
+
+    def _refine_roi(self, image, predicted, complexity):
+        """在每只手的预测区域上重新运行模型；任意一只手丢失时返回None"""
+        height, width = image.shape[:2]
+        size = np.array([width, height], dtype=np.float32)
+        hands = self._get_hands(complexity, True)
+        refined = []
+        for points in predicted * size:
+            low, high = points.min(axis=0), points.max(axis=0)
+            center = (low + high) / 2
+            half = max(high - low) * (0.5 + self.roi_margin)
+            x0, y0 = np.maximum(np.floor(center - half), 0).astype(int)
+            x1, y1 = np.minimum(np.ceil(center + half), size).astype(int)
+            if x1 - x0 < 32 or y1 - y0 < 32:
+                return None
+
+            crop = np.ascontiguousarray(image[y0:y1, x0:x1])
+            results = hands.process(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+            if not results.multi_hand_landmarks:
+                return None
+            crop_points = landmarks_to_array(results.multi_hand_landmarks)[0]
+            refined.append((crop_points * [x1 - x0, y1 - y0] + [x0, y0]) / size)
+        return np.array(refined, dtype=np.float32).reshape(-1, NUM_LANDMARKS, 2)
+
+    def _adapt(self, frame_ms):
+        """按处理耗时调整档位"""
+        self.frame_ms = frame_ms if self.frame_ms is None else 0.9 * self.frame_ms + 0.1 * frame_ms
+        if self._cooldown > 0:
+            self._cooldown -= 1
+            return
+        if self.frame_ms > self.target_ms and self.tier < len(self.tiers) - 1:
+            self.tier += 1
+        elif self.frame_ms < self.target_ms * 0.5 and self.tier > 0:
+            self.tier -= 1
+        else:
+            return
+        self._cooldown = TIER_COOLDOWN
+        log.info("检测档位调整为 %d (model_complexity=%d, 缩放 %.2f)，平均耗时 %.1fms",
+                 self.tier, *self.tiers[self.tier], self.frame_ms)
+
+
+def draw_landmark_points(image, points):
+    """在图像上绘制一只手的关键点和骨架；points 为 (21, 2) 像素坐标"""
+    pixels = [tuple(int(v) for v in point) for point in points]
+    for start, end in mp_hands.HAND_CONNECTIONS:
+        cv2.line(image, pixels[start], pixels[end], (224, 224, 224), 2)
+    for pixel in pixels:
+        cv2.circle(image, pixel, 3, (0, 0, 255), -1)
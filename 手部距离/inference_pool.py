@@ -0,0 +1,134 @@
+"""多进程检测后端
+
+MediaPipe Hands 在一个进程里只能用到一小部分CPU核。InferencePool 启动N个工作进程，
+每个进程各有一个 Hands 实例（hand_distance.get_hands 在进程内懒加载）。
+
+帧数据不经过 pickle：池预先创建若干块共享内存（槽），提交时把RGB和深度数据拷贝进一个空闲槽，
+任务参数里只有槽名和数据长度，工作进程直接在共享内存上解码；结果字典很小，照常 pickle 返回。
+没有空闲槽时 submit 等待，槽数默认是进程数的2倍（每个进程一帧在处理、一帧在排队）。
+
+InferenceStream 负责一个数据流：按提交顺序取回结果，保证回复给客户端的顺序与帧顺序一致。
+"""
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from frame_log import setup_logging
+from hand_distance import analyze_frame, failed_result
+from protocol import DEPTH_BUFFER_SIZE, RGB_BUFFER_SIZE
+
+SLOT_SIZE = RGB_BUFFER_SIZE + DEPTH_BUFFER_SIZE
+
+# 工作进程中：共享内存名 -> SharedMemory
+_worker_slots = {}
+
+
+def _worker_init(names, log_level):
+    # spawn 出的工作进程与主进程共用同一个 resource_tracker，共享内存由主进程 close() 时删除，
+    # 主进程异常退出时由 resource_tracker 清理
+    setup_logging(log_level)
+    for name in names:
+        _worker_slots[name] = shared_memory.SharedMemory(name=name)
+
+
+def _analyze_slot(name, rgb_size, depth_size, rgb_dims, depth_dims, formats, depth_range):
+    """工作进程中执行：直接在共享内存槽上分析一帧"""
+    buffer = _worker_slots[name].buf
+    return analyze_frame(buffer[:rgb_size], buffer[rgb_size:rgb_size + depth_size],
+                         rgb_dims, depth_dims, formats, depth_range)
+
+
+class InferencePool:
+    """检测进程池 + 共享内存槽"""
+
+    def __init__(self, workers=None, slots=None, log_level="INFO"):
+        self.workers = workers or os.cpu_count() or 1
+        self.slot_count = slots or self.workers * 2
+        self._slots = [shared_memory.SharedMemory(create=True, size=SLOT_SIZE) for _ in range(self.slot_count)]
+        self._free = deque(self._slots)
+        self._available = threading.Semaphore(self.slot_count)
+        self._lock = threading.Lock()
+        # spawn 方式启动工作进程，每个进程各自创建 MediaPipe Hands
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_worker_init,
+                                            initargs=([slot.name for slot in self._slots], log_level))
+
+    def submit(self, frame, rgb_dims=(640, 480), depth_dims=(256, 192), formats=None, depth_range=None):
+        """把一帧拷贝进空闲槽并提交检测，没有空闲槽时等待；返回 concurrent.futures.Future
+
+        返回后 frame 的缓冲区就可以归还或复用
+        """
+        rgb_size, depth_size = len(frame.rgb_data), len(frame.depth_data)
+        if rgb_size + depth_size > SLOT_SIZE:
+            # 超出槽大小（分辨率比预期大），退回到 pickle 传递
+            return self.executor.submit(analyze_frame, bytes(frame.rgb_data), bytes(frame.depth_data),
+                                        rgb_dims, depth_dims, formats, depth_range)
+
+        self._available.acquire()
+        with self._lock:
+            slot = self._free.popleft()
+        try:
+            slot.buf[:rgb_size] = frame.rgb_data
+            slot.buf[rgb_size:rgb_size + depth_size] = frame.depth_data
+            future = self.executor.submit(_analyze_slot, slot.name, rgb_size, depth_size,
+                                          rgb_dims, depth_dims, formats, depth_range)
+        except Exception:
+            self._release(slot)
+            raise
+        future.add_done_callback(lambda _: self._release(slot))
+        return future
+
+    def _release(self, slot):
+        with self._lock:
+            self._free.append(slot)
+        self._available.release()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()
+        self._slots = []
+
+
+class InferenceStream:
+    """一个数据流的检测请求；results() 按提交顺序产出结果
+
+    max_in_flight: 已提交但还没取出结果的帧数上限，超出时 submit 阻塞
+    """
+
+    def __init__(self, pool, formats=None, rgb_dims=(640, 480), depth_dims=(256, 192), depth_range=None,
+                 max_in_flight=4):
+        self.pool = pool
+        self.formats = formats
+        self.rgb_dims = rgb_dims
+        self.depth_dims = depth_dims
+        self.depth_range = depth_range
+        self._pending = queue.Queue(max(1, max_in_flight))
+
+    def submit(self, frame, context=None):
+        """提交一帧；context 原样随结果返回（例如 FrameMetrics）"""
+        future = self.pool.submit(frame, self.rgb_dims, self.depth_dims, self.formats, self.depth_range)
+        self._pending.put((frame, context, future))
+
+    def close(self):
+        """之前提交的帧都取出后 results() 结束"""
+        self._pending.put(None)
+
+    def results(self):
+        """按提交顺序产出 (frame, context, 结果字典)"""
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            frame, context, future = item
+            try:
+                result = future.result()
+            except Exception as e:
+                result = failed_result(str(e))
+            yield frame, context, result
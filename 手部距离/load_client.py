@@ -0,0 +1,318 @@
+"""合成负载客户端
+
+模拟 iPhone_ViewController.swift 的发送端，没有真机时用来给 demo.py / async_server.py 加压：
+同时运行N路数据流，每路按目标帧率发送合成的或从采集文件回放的RGB+深度帧，
+记录每帧从"采集"(开始发送)到收到服务器回复的延迟。
+
+    v1: 与真机相同的停等协议，每段数据后等待4字节ACK。服务器收到深度数据就回ACK，
+        所以延迟只包含传输，不包含检测；服务器串行处理时检测耗时体现在帧率上。
+    v2: 窗口协议，服务器检测完成后才回复CREDIT，延迟是完整的采集到结果时间。
+
+用法:
+    python load_client.py --streams 4 --fps 30 --duration 20 --protocol 2
+    python load_client.py --capture session.hdc --fps 0
+"""
+import argparse
+import json
+import socket
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from capture import ReplayChannel
+from frame_log import log, percentiles, setup_logging
+from protocol import CREDIT, DEFAULT_WINDOW, FRAME_HEADER, HELLO, MAGIC, SIZE_PREFIX, pack_hello, recv_exact
+from result_message import decode_result
+from wire_formats import DEFAULT_FORMATS, encode_depth, encode_rgb
+
+
+class SyntheticSource:
+    """合成帧：移动的亮色方块 + 随机纹理，深度为带噪声的倾斜平面
+
+    预先生成 count 帧并编码为传输格式，发送时循环使用，客户端自身几乎不占CPU
+    """
+
+    def __init__(self, formats=None, count=30, rgb_size=(640, 480), depth_size=(256, 192), seed=0):
+        self.options = dict(DEFAULT_FORMATS, **(formats or {}))
+        self.options.update(rgb_size=list(rgb_size), depth_size=list(depth_size))
+        rgb_format = "bgra" if self.options['rgb_format'] == "auto" else self.options['rgb_format']
+        rng = np.random.default_rng(seed)
+        width, height = rgb_size
+        depth_width, depth_height = depth_size
+        base = rng.integers(40, 200, (height, width, 3), dtype=np.uint8)
+        ramp = np.linspace(0.4, 2.0, depth_width, dtype=np.float32)[None, :].repeat(depth_height, axis=0)
+
+        self.frames = []
+        for i in range(count):
+            image = base.copy()
+            x = int((width - 120) * i / max(1, count - 1))
+            cv2.rectangle(image, (x, height // 3), (x + 120, height // 3 + 160), (180, 200, 230), -1)
+            depth = ramp + rng.normal(0, 0.01, ramp.shape).astype(np.float32)
+            depth[rng.random(depth.shape) < 0.05] = np.nan
+            self.frames.append((encode_rgb(image, rgb_format),
+                                encode_depth(depth, self.options['depth_format'], self.options['depth_compression'])))
+        self._next = 0
+
+    def next_frame(self):
+        """返回 (RGB数据, 深度数据)"""
+        frame = self.frames[self._next % len(self.frames)]
+        self._next += 1
+        return frame
+
+
+class CaptureSource:
+    """从采集文件（capture.py）循环读取帧，传输格式与录制时相同"""
+
+    def __init__(self, path):
+        self.replay = ReplayChannel(path, speed=0, loop=True)
+        self.options = {key: self.replay.options[key] for key in DEFAULT_FORMATS}
+
+    def next_frame(self):
+        frame = self.replay.recv_frame()
+        return frame.rgb_data, frame.depth_data
+
+
+class StreamStats:
+    """一路数据流的统计，延迟单位毫秒"""
+
+    def __init__(self):
+        self.sent = 0
+        self.completed = 0
+        self.failed = 0
+        self.latencies = []
+        self.server_ms = []
+        self.started = None
+        self.stopped = None
+        self.error = None  # 没能连上服务器时的错误信息
+
+    def summary(self):
+        # 没连上时 started 为None，吞吐记为0
+        elapsed = (self.stopped or time.perf_counter()) - self.started if self.started is not None else 0.0
+        return {
+            'sent': self.sent,
+            'completed': self.completed,
+            'failed': self.failed,
+            'fps': self.completed / elapsed if elapsed > 0 else 0.0,
+            'latency_ms': percentiles(self.latencies),
+            'server_ms': percentiles(self.server_ms),
+            'error': self.error,
+        }
+
+
+class StreamClient:
+    """一路数据流：连接服务器，按目标帧率发送 source 的帧，直到 stop() 或连接中断
+
+    fps=0 时不限速（v1 每帧等ACK后立即发下一帧，v2 窗口有空位就发）
+    """
+
+    def __init__(self, host, port, source, fps=30.0, protocol=1, window=DEFAULT_WINDOW, result_format="none",
+                 timeout=10):
+        self.host = host
+        self.port = port
+        self.source = source
+        self.fps = fps
+        self.protocol = protocol
+        self.window = window
+        self.result_format = result_format
+        self.timeout = timeout
+        self.stats = StreamStats()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _pace(self, index):
+        """等待到第index帧的发送时间"""
+        if self.fps <= 0:
+            return
+        delay = self.stats.started + index / self.fps - time.perf_counter()
+        if delay > 0:
+            self._stop.wait(delay)
+
+    def run(self):
+        sock = None
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.stats.started = time.perf_counter()
+            if self.protocol == 1:
+                self._run_v1(sock)
+            else:
+                self._run_v2(sock)
+        except (socket.timeout, ConnectionError, OSError) as e:
+            if self.stats.started is None:
+                # 连接失败记在这一路的统计里，不在线程中抛出
+                self.stats.error = f"连接失败: {e}"
+                log.warning("无法连接 %s:%d: %s", self.host, self.port, e)
+            elif not self._stop.is_set():
+                log.warning("数据流中断: %s", e)
+        finally:
+            self.stats.stopped = time.perf_counter()
+            if sock is not None:
+                sock.close()
+
+    def _run_v1(self, sock):
+        index = 0
+        while not self._stop.is_set():
+            self._pace(index)
+            rgb_data, depth_data = self.source.next_frame()
+            start = time.perf_counter()
+            self.stats.sent += 1
+            ok = True
+            for payload in (rgb_data, depth_data):
+                sock.sendall(SIZE_PREFIX.pack(len(payload)))
+                sock.sendall(payload)
+                ack = recv_exact(sock, SIZE_PREFIX.size, self.timeout)
+                if ack is None:
+                    return
+                ok = ok and SIZE_PREFIX.unpack(ack)[0] == 1
+            if ok:
+                self.stats.completed += 1
+                self.stats.latencies.append((time.perf_counter() - start) * 1000.0)
+            else:
+                self.stats.failed += 1
+            index += 1
+
+    def _run_v2(self, sock):
+        options = dict(self.source.options, result_format=self.result_format)
+        sock.sendall(pack_hello(self.window, options))
+        hello = recv_exact(sock, HELLO.size, self.timeout)
+        if hello is None:
+            return
+        magic, _, granted, options_size = HELLO.unpack(hello)
+        if magic != MAGIC:
+            raise ConnectionError("服务器握手回复无效")
+        accepted = json.loads(recv_exact(sock, options_size, self.timeout) or b"{}")
+        if granted == 0:
+            raise ConnectionError(f"服务器拒绝握手: {accepted.get('error', '未知原因')}")
+        result_format = accepted.get('result_format', "none")
+
+        credits = threading.Semaphore(granted)
+        sent_at = {}
+        receiver = threading.Thread(target=self._receive_credits, args=(sock, credits, sent_at, result_format),
+                                    daemon=True)
+        receiver.start()
+
+        index = 0
+        while not self._stop.is_set() and receiver.is_alive():
+            self._pace(index)
+            if not credits.acquire(timeout=0.1):
+                continue
+            rgb_data, depth_data = self.source.next_frame()
+            sent_at[index] = time.perf_counter()
+            sock.sendall(FRAME_HEADER.pack(index, time.time(), len(rgb_data), len(depth_data)))
+            sock.sendall(rgb_data)
+            sock.sendall(depth_data)
+            self.stats.sent += 1
+            index += 1
+
+        # 等待已发送的帧处理完再断开，避免服务器回复时连接已关闭
+        deadline = time.perf_counter() + self.timeout
+        while sent_at and receiver.is_alive() and time.perf_counter() < deadline:
+            time.sleep(0.01)
+
+    def _receive_credits(self, sock, credits, sent_at, result_format):
+        while True:
+            try:
+                credit = recv_exact(sock, CREDIT.size, self.timeout)
+                if credit is None:
+                    return
+                frame_id, status, payload_size = CREDIT.unpack(credit)
+                payload = recv_exact(sock, payload_size, self.timeout) if payload_size else b""
+            except OSError:
+                return
+            start = sent_at.pop(frame_id, None)
+            if status == 1:
+                self.stats.completed += 1
+                if start is not None:
+                    self.stats.latencies.append((time.perf_counter() - start) * 1000.0)
+                if payload:
+                    self.stats.server_ms.append(decode_result(payload, result_format)['elapsed_ms'])
+            else:
+                self.stats.failed += 1
+            credits.release()
+
+
+def run_streams(host, port, make_source, streams=1, fps=30.0, duration=10.0, protocol=1,
+                window=DEFAULT_WINDOW, result_format="none"):
+    """同时运行 streams 路数据流 duration 秒，返回 (汇总, 每路统计)"""
+    clients = [StreamClient(host, port, make_source(), fps, protocol, window, result_format)
+               for _ in range(streams)]
+    for client in clients:
+        client.start()
+    time.sleep(duration)
+    for client in clients:
+        client.stop()
+    for client in clients:
+        client.join(client.timeout + 1)
+
+    per_stream = [client.stats.summary() for client in clients]
+    latencies = [ms for client in clients for ms in client.stats.latencies]
+    server_ms = [ms for client in clients for ms in client.stats.server_ms]
+    total = {
+        'streams': streams,
+        'protocol': protocol,
+        'target_fps': fps,
+        'sent': sum(s['sent'] for s in per_stream),
+        'completed': sum(s['completed'] for s in per_stream),
+        'failed': sum(s['failed'] for s in per_stream),
+        'failed_streams': sum(1 for s in per_stream if s['error']),
+        'fps': sum(s['fps'] for s in per_stream),
+        'latency_ms': percentiles(latencies),
+        'server_ms': percentiles(server_ms),
+    }
+    return total, per_stream
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成负载客户端")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--streams", type=int, default=1, help="同时运行的数据流数")
+    parser.add_argument("--fps", type=float, default=30.0, help="每路目标帧率，0表示不限速")
+    parser.add_argument("--duration", type=float, default=10.0, help="运行时间(秒)")
+    parser.add_argument("--protocol", type=int, choices=(1, 2), default=1)
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW, help="v2请求的窗口大小")
+    parser.add_argument("--rgb-format", default="auto")
+    parser.add_argument("--depth-format", default="f32")
+    parser.add_argument("--depth-compression", default="none")
+    parser.add_argument("--result-format", default="none", help="v2请求随CREDIT返回的检测结果格式")
+    parser.add_argument("--capture", metavar="PATH", help="从采集文件读取帧，而不是合成帧")
+    parser.add_argument("--json", metavar="PATH", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    setup_logging("INFO")
+    formats = {'rgb_format': args.rgb_format, 'depth_format': args.depth_format,
+               'depth_compression': args.depth_compression}
+    if args.capture:
+        make_source = lambda: CaptureSource(args.capture)
+    else:
+        make_source = lambda: SyntheticSource(formats)
+
+    total, per_stream = run_streams(args.host, args.port, make_source, args.streams, args.fps, args.duration,
+                                    args.protocol, args.window, args.result_format)
+    log.info("%d 路数据流, 完成 %d 帧, 失败 %d 帧, 总吞吐 %.1f fps", total['streams'], total['completed'],
+             total['failed'], total['fps'])
+    if total['failed_streams']:
+        log.warning("%d 路数据流没能连上服务器", total['failed_streams'])
+    log.info("延迟(ms): %s", " ".join(f"{k}={v:.1f}" for k, v in total['latency_ms'].items()))
+    if total['server_ms']:
+        log.info("服务器处理(ms): %s", " ".join(f"{k}={v:.1f}" for k, v in total['server_ms'].items()))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'total': total, 'streams': per_stream}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
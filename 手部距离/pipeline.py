@@ -0,0 +1,176 @@
+"""接收 / 检测 / 显示 三级流水线
+
+串行模式下一个线程依次完成接收、检测和显示，任何一步变慢都会拖住网络，延迟越积越多。
+流水线模式把三步拆到不同线程，中间用有界队列连接：
+
+    接收线程 --(检测队列)--> 检测线程 --(显示队列)--> 主线程显示
+
+队列满时默认丢弃最旧的帧（总是处理最新的一帧），端到端延迟不会无限增长；
+关闭丢帧后队列满时接收线程会阻塞，由TCP背压让客户端放慢。
+cv2.imshow/cv2.waitKey 必须在主线程调用，所以显示阶段在调用 run() 的线程执行。
+"""
+import threading
+import time
+from collections import deque
+
+from frame_log import log
+
+_CLOSED = object()
+
+
+class FrameQueue:
+    """有界队列，满时可以丢弃最旧的元素"""
+
+    def __init__(self, maxsize=1, drop_oldest=True, on_drop=None):
+        self.maxsize = max(1, maxsize)
+        self.drop_oldest = drop_oldest
+        self.on_drop = on_drop  # 被丢弃的元素交给它处理（例如归还缓冲区）
+        self.dropped = 0
+        self._items = deque()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        """放入一个元素；队列已关闭时返回False"""
+        dropped = None
+        with self._cond:
+            while len(self._items) >= self.maxsize and not self._closed:
+                if self.drop_oldest:
+                    dropped = self._items.popleft()
+                    self.dropped += 1
+                    break
+                self._cond.wait()
+            if self._closed:
+                return False
+            self._items.append(item)
+            self._cond.notify_all()
+        if dropped is not None and self.on_drop:
+            self.on_drop(dropped)
+        return True
+
+    def get(self, timeout=None):
+        """取出最早的元素；超时返回None，队列关闭且为空时返回 _CLOSED"""
+        with self._cond:
+            deadline = None if timeout is None else time.time() + timeout
+            while not self._items:
+                if self._closed:
+                    return _CLOSED
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        """关闭队列，唤醒所有等待的线程；剩余元素交给on_drop"""
+        with self._cond:
+            self._closed = True
+            remaining = list(self._items)
+            self._items.clear()
+            self._cond.notify_all()
+        if self.on_drop:
+            for item in remaining:
+                self.on_drop(item)
+
+
+class StagedPipeline:
+    """三级流水线
+
+    receive(): 返回下一帧，失败返回None
+    end_of_stream(): receive返回None时调用，返回True表示数据源已经结束（例如回放到结尾）
+    infer(frame): 返回检测结果，数据有问题时抛出异常
+    render(result): 显示结果（没有新结果时以None调用，只处理窗口事件），返回False时停止流水线
+    finish(frame, success): 一帧不再需要时调用（归还缓冲区/回复CREDIT），丢弃的帧也会调用
+    """
+
+    def __init__(self, receive, infer, render, finish, queue_size=1, drop_oldest=True,
+                 max_consecutive_errors=5, end_of_stream=None):
+        self.receive = receive
+        self.end_of_stream = end_of_stream
+        self.infer = infer
+        self.render = render
+        self.finish = finish
+        self.max_consecutive_errors = max_consecutive_errors
+        self.infer_queue = FrameQueue(queue_size, drop_oldest, on_drop=lambda frame: finish(frame, False))
+        # 显示阶段总是只保留最新结果
+        self.render_queue = FrameQueue(1, True)
+        self.processed = 0
+        self.consecutive_errors = 0
+        self._errors_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._input_done = threading.Event()  # 数据源已结束，队列中的帧都已检测完
+
+    def _error(self, message):
+        with self._errors_lock:
+            self.consecutive_errors += 1
+            log.warning("%s (错误 %d/%d)", message, self.consecutive_errors, self.max_consecutive_errors)
+            if self.consecutive_errors >= self.max_consecutive_errors:
+                log.error("连续错误过多，退出程序")
+                self.stop()
+
+    def _receive_loop(self):
+        while not self._stop.is_set():
+            frame = self.receive()
+            if frame is None:
+                if self.end_of_stream and self.end_of_stream():
+                    # 检测线程处理完队列中的帧后结束
+                    self.infer_queue.put(_CLOSED)
+                    break
+                self._error("帧数据接收失败")
+                continue
+            if not self.infer_queue.put(frame):
+                self.finish(frame, False)
+                break
+
+    def _infer_loop(self):
+        while not self._stop.is_set():
+            frame = self.infer_queue.get(timeout=0.1)
+            if frame is _CLOSED:
+                self._input_done.set()
+                break
+            if frame is None:
+                continue
+            frame_ok = False
+            try:
+                result = self.infer(frame)
+                frame_ok = True
+            except Exception as e:
+                self._error(f"处理图像时出错: {e}")
+                continue
+            finally:
+                self.finish(frame, frame_ok)
+            with self._errors_lock:
+                self.consecutive_errors = 0
+            self.render_queue.put(result)
+
+    def stop(self):
+        self._stop.set()
+        self.infer_queue.close()
+        self.render_queue.close()
+
+    def run(self):
+        """启动接收和检测线程，在当前线程执行显示阶段，直到停止"""
+        threads = [
+            threading.Thread(target=self._receive_loop, name="receiver", daemon=True),
+            threading.Thread(target=self._infer_loop, name="inference", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while not self._stop.is_set():
+                result = self.render_queue.get(timeout=0.01)
+                if result is _CLOSED:
+                    break
+                if result is None and self._input_done.is_set():
+                    break
+                keep_running = self.render(result)
+                if result is not None:
+                    self.processed += 1
+                if keep_running is False:
+                    break
+        finally:
+            self.stop()
+            log.info("流水线结束: 处理 %d 帧, 检测队列丢弃 %d 帧, 显示队列丢弃 %d 帧",
+                     self.processed, self.infer_queue.dropped, self.render_queue.dropped)
@@ -0,0 +1,352 @@
+"""iPhone <-> Mac 数据传输协议
+
+v1 (旧版客户端, 停等模式):
+    每帧依次发送 4字节大小前缀('<I') + RGB数据, 等待服务器回复4字节ACK,
+    再发送 4字节大小前缀 + 深度数据, 再等待ACK。
+
+v2 (窗口模式):
+    连接建立后客户端先发送握手 HELLO:
+        magic b'HDP2' + uint16 版本 + uint16 期望窗口 + uint32 选项长度 + JSON选项
+    服务器回复相同结构的 HELLO, 其中窗口为实际授予的窗口大小,
+    JSON选项为实际使用的传输格式 (见 wire_formats.py)。
+    握手无效 (版本不对、选项不是JSON对象等) 时服务器回复窗口为0的 HELLO,
+    JSON选项为 {"error": 原因}, 然后关闭连接。
+    之后每帧只发送一个帧头, 紧接着RGB数据和深度数据:
+        uint32 帧号 + float64 采集时间戳 + uint32 RGB长度 + uint32 深度长度
+    服务器每处理完一帧回复一个 CREDIT, 归还一个窗口额度:
+        uint32 帧号 + uint32 状态(1成功/0失败) + uint32 附加数据长度 (+ 附加数据)
+    附加数据为握手选项 result_format 指定格式的检测结果 (见 result_message.py), "none" 时为空。
+    客户端最多可以有"窗口"个帧尚未收到 CREDIT, 不必逐帧等待往返。
+
+旧版客户端第一个4字节是RGB大小, 不会超过10MB限制, 而 b'HDP2' 按 '<I' 解析约为 844MB,
+所以服务器只需看第一个4字节就能区分两种协议。
+"""
+import json
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from buffer_pool import BufferPool, recv_into_exact
+from frame_log import log
+from wire_formats import DEFAULT_FORMATS, negotiate_formats
+
+MAGIC = b"HDP2"
+PROTOCOL_VERSION = 2
+DEFAULT_WINDOW = 4
+MAX_WINDOW = 16
+MAX_PAYLOAD_SIZE = 10 * 1024 * 1024  # 10MB限制
+MAX_OPTIONS_SIZE = 64 * 1024         # 握手JSON选项的长度上限
+RGB_BUFFER_SIZE = 640 * 480 * 4      # BGRA
+DEPTH_BUFFER_SIZE = 256 * 192 * 4    # float32
+
+SIZE_PREFIX = struct.Struct("<I")
+HELLO = struct.Struct("<4sHHI")        # magic, 版本, 窗口, 选项长度
+FRAME_HEADER = struct.Struct("<IdII")  # 帧号, 时间戳, RGB长度, 深度长度
+CREDIT = struct.Struct("<III")         # 帧号, 状态, 附加数据长度
+
+Frame = namedtuple("Frame", ["frame_id", "timestamp", "rgb_data", "depth_data"])
+
+
+def recv_exact(connection, size, timeout=10):
+    """从socket精确接收size字节（用于帧头等小数据），连接中断或超时返回None"""
+    buffer = bytearray(size)
+    if not recv_into_exact(connection, memoryview(buffer), timeout):
+        return None
+    return bytes(buffer)
+
+
+def recv_payload(connection, size, pool=None, timeout=10):
+    """把size字节的数据直接接收进缓冲区池，返回memoryview，失败返回None"""
+    view = pool.acquire(size) if pool else memoryview(bytearray(size))
+    if not recv_into_exact(connection, view, timeout):
+        if pool:
+            pool.release(view)
+        return None
+    return view
+
+
+def parse_size_prefix(size_data):
+    """解析v1的4字节大小前缀；超过 MAX_PAYLOAD_SIZE 时抛出 ValueError"""
+    data_size = SIZE_PREFIX.unpack(size_data)[0]
+    if data_size > MAX_PAYLOAD_SIZE:
+        raise ValueError(f"数据大小过大: {data_size} 字节")
+    return data_size
+
+
+def parse_frame_header(header):
+    """解析v2帧头，返回 (帧号, 时间戳, RGB长度, 深度长度)；长度超过 MAX_PAYLOAD_SIZE 时抛出 ValueError"""
+    frame_id, timestamp, rgb_size, depth_size = FRAME_HEADER.unpack(header)
+    if rgb_size > MAX_PAYLOAD_SIZE or depth_size > MAX_PAYLOAD_SIZE:
+        raise ValueError(f"数据大小过大: RGB {rgb_size} 字节, 深度 {depth_size} 字节")
+    return frame_id, timestamp, rgb_size, depth_size
+
+
+def parse_hello(data):
+    """解析客户端 HELLO 的固定部分，返回 (版本, 期望窗口, 选项长度)
+
+    magic 或版本不对、选项超过 MAX_OPTIONS_SIZE 时抛出 ValueError
+    """
+    magic, version, window, options_size = HELLO.unpack(data)
+    if magic != MAGIC:
+        raise ValueError("握手消息的 magic 不对")
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"不支持的协议版本 v{version}（服务器为 v{PROTOCOL_VERSION}）")
+    if options_size > MAX_OPTIONS_SIZE:
+        raise ValueError(f"握手选项过长: {options_size} 字节")
+    return version, window, options_size
+
+
+def parse_options(options_data):
+    """解析 HELLO 的JSON选项；不是合法的JSON对象时抛出 ValueError"""
+    if not options_data:
+        return {}
+    options = json.loads(options_data.decode("utf-8"))
+    if not isinstance(options, dict):
+        raise ValueError(f"握手选项不是JSON对象: {type(options).__name__}")
+    return options
+
+
+def accept_hello(window, options, max_window=DEFAULT_WINDOW):
+    """按客户端的请求确定授予的窗口和采用的传输格式，返回 (窗口, 传输格式, 回复的HELLO)"""
+    granted = grant_window(window, max_window)
+    accepted = negotiate_formats(options)
+    return granted, accepted, pack_hello(granted, accepted)
+
+
+def receive_data_with_size(connection, timeout=10, size_data=None, pool=None):
+    """接收带大小信息的数据，增加超时和错误处理
+
+    size_data: 已经读出的4字节大小前缀（协议识别时预读），为None时从socket读取
+    pool: 缓冲区池，数据直接接收进池中的缓冲区；返回值是memoryview
+    """
+    try:
+        # 设置接收超时
+        connection.settimeout(timeout)
+
+        # 接收数据大小（4字节）
+        if size_data is None:
+            size_data = connection.recv(4)
+        if not size_data or len(size_data) < 4:
+            log.warning("接收数据大小失败: 收到 %d 字节", len(size_data) if size_data else 0)
+            return None
+
+        data_size = parse_size_prefix(size_data)
+        log.debug("期望接收数据大小: %d 字节", data_size)
+
+        # 接收实际数据
+        data = recv_payload(connection, data_size, pool, timeout)
+        if data is None:
+            return None
+
+        log.debug("成功接收数据: %d 字节", len(data))
+        return data
+
+    except socket.timeout:
+        log.warning("接收数据超时")
+        return None
+    except Exception as e:
+        log.warning("接收数据时出错: %s", e)
+        return None
+
+
+def send_ack(connection, success=True):
+    """发送确认消息给客户端"""
+    try:
+        ack = SIZE_PREFIX.pack(1 if success else 0)
+        connection.send(ack)
+        log.debug("发送确认: %s", "成功" if success else "失败")
+    except Exception as e:
+        log.warning("发送确认失败: %s", e)
+
+
+class LegacyChannel:
+    """v1 停等协议：RGB和深度各自带大小前缀，每段数据收到后立即回ACK"""
+
+    version = 1
+    window = 1
+    eof = False  # 网络连接没有"数据流结束"，只有接收失败
+
+    def __init__(self, connection, first_size_data=None, timeout=10):
+        self.connection = connection
+        self.timeout = timeout
+        self.options = dict(DEFAULT_FORMATS)
+        self._pending_size = first_size_data
+        self._next_id = 0
+        self.header_at = None  # 最近一帧大小前缀到达的时间(perf_counter)
+        self.rgb_pool = BufferPool(RGB_BUFFER_SIZE, 2)
+        self.depth_pool = BufferPool(DEPTH_BUFFER_SIZE, 2)
+
+    def recv_frame(self):
+        """接收一帧，失败返回None"""
+        size_data, self._pending_size = self._pending_size, None
+        if size_data is None:
+            try:
+                self.connection.settimeout(self.timeout)
+                size_data = recv_exact(self.connection, SIZE_PREFIX.size, self.timeout)
+            except OSError as e:
+                log.warning("接收数据大小失败: %s", e)
+                return None
+            if size_data is None:
+                log.warning("接收数据大小失败")
+                return None
+        # 从大小前缀到达开始计时，不包括等待下一帧的空闲时间
+        self.header_at = time.perf_counter()
+
+        # 接收RGB数据
+        rgb_data = receive_data_with_size(self.connection, self.timeout, size_data, self.rgb_pool)
+        if not rgb_data:
+            log.warning("RGB数据接收失败")
+            return None
+
+        # 发送RGB接收确认
+        send_ack(self.connection, True)
+
+        # 接收深度数据
+        depth_data = receive_data_with_size(self.connection, self.timeout, pool=self.depth_pool)
+        if not depth_data:
+            log.warning("深度数据接收失败")
+            self.rgb_pool.release(rgb_data)
+            return None
+
+        # 发送深度接收确认（旧版客户端收到后才会采集下一帧）
+        send_ack(self.connection, True)
+
+        frame = Frame(self._next_id, time.time(), rgb_data, depth_data)
+        self._next_id += 1
+        return frame
+
+    def finish(self, frame, success=True, payload=b""):
+        """归还接收缓冲区；旧版协议在接收时已经回过ACK，这里不需要再发送"""
+        self.rgb_pool.release(frame.rgb_data)
+        self.depth_pool.release(frame.depth_data)
+
+
+class WindowedChannel:
+    """v2 窗口协议：每帧一个帧头，处理完成后归还一个额度"""
+
+    version = PROTOCOL_VERSION
+    eof = False
+
+    def __init__(self, connection, window, options=None, timeout=10):
+        self.connection = connection
+        self.window = window
+        self.options = options or dict(DEFAULT_FORMATS)
+        self.timeout = timeout
+        self.header_at = None  # 最近一帧帧头到达的时间(perf_counter)
+        # 窗口内的帧加上正在处理的一帧
+        self.rgb_pool = BufferPool(RGB_BUFFER_SIZE, window + 1)
+        self.depth_pool = BufferPool(DEPTH_BUFFER_SIZE, window + 1)
+        # 流水线模式下检测线程和接收线程（丢帧时）都会回复CREDIT
+        self._send_lock = threading.Lock()
+
+    def recv_frame(self):
+        """接收一帧，失败返回None"""
+        try:
+            self.connection.settimeout(self.timeout)
+            header = recv_exact(self.connection, FRAME_HEADER.size, self.timeout)
+            if header is None:
+                log.warning("帧头接收失败")
+                return None
+            # 从帧头到达开始计时，不包括等待下一帧的空闲时间
+            self.header_at = time.perf_counter()
+
+            frame_id, timestamp, rgb_size, depth_size = parse_frame_header(header)
+
+            rgb_data = recv_payload(self.connection, rgb_size, self.rgb_pool, self.timeout)
+            if rgb_data is None:
+                log.warning("RGB数据接收失败")
+                return None
+            depth_data = recv_payload(self.connection, depth_size, self.depth_pool, self.timeout)
+            if depth_data is None:
+                log.warning("深度数据接收失败")
+                self.rgb_pool.release(rgb_data)
+                return None
+
+            return Frame(frame_id, timestamp, rgb_data, depth_data)
+
+        except socket.timeout:
+            log.warning("接收数据超时")
+            return None
+        except Exception as e:
+            log.warning("接收数据时出错: %s", e)
+            return None
+
+    def finish(self, frame, success=True, payload=b""):
+        """归还接收缓冲区并回复CREDIT，客户端据此发送下一帧"""
+        self.rgb_pool.release(frame.rgb_data)
+        self.depth_pool.release(frame.depth_data)
+        try:
+            credit = CREDIT.pack(frame.frame_id, 1 if success else 0, len(payload))
+            with self._send_lock:
+                self.connection.sendall(credit + payload)
+        except Exception as e:
+            log.warning("发送CREDIT失败: %s", e)
+
+
+def grant_window(requested, max_window=DEFAULT_WINDOW):
+    """服务器实际授予的窗口大小"""
+    return max(1, min(requested, max_window, MAX_WINDOW))
+
+
+def pack_hello(window, options=None):
+    """打包握手消息（客户端请求和服务器回复结构相同）"""
+    options_data = json.dumps(options or {}).encode("utf-8")
+    return HELLO.pack(MAGIC, PROTOCOL_VERSION, window, len(options_data)) + options_data
+
+
+def reject_hello(reason):
+    """打包拒绝握手的回复：窗口为0，选项中带上原因"""
+    return pack_hello(0, {'error': reason})
+
+
+def accept_channel(connection, max_window=DEFAULT_WINDOW, timeout=10):
+    """读取客户端的第一个4字节，识别协议版本并返回对应的通道
+
+    旧版客户端直接返回 LegacyChannel；v2客户端完成握手后返回 WindowedChannel。
+    握手失败返回None。
+    """
+    try:
+        connection.settimeout(timeout)
+        head = recv_exact(connection, SIZE_PREFIX.size, timeout)
+        if head is None:
+            return None
+
+        if head != MAGIC:
+            log.info("客户端使用旧版停等协议 (v1)")
+            return LegacyChannel(connection, head, timeout)
+
+        rest = recv_exact(connection, HELLO.size - len(MAGIC), timeout)
+        if rest is None:
+            return None
+        try:
+            version, window, options_size = parse_hello(head + rest)
+            options_data = recv_exact(connection, options_size, timeout) if options_size else b""
+            if options_data is None:
+                return None
+            # 协商传输格式，回复实际采用的格式
+            granted, accepted, reply = accept_hello(window, parse_options(options_data), max_window)
+        except (ValueError, TypeError) as e:
+            log.warning("协议握手失败: %s", e)
+            try:
+                connection.sendall(reject_hello(str(e)))
+            except OSError:
+                pass
+            return None
+        # 接收缓冲区放得下窗口内的帧，处理当前帧时后续帧可以继续传输
+        try:
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, granted * 2 * 1024 * 1024)
+        except OSError:
+            pass
+        connection.sendall(reply)
+        log.info("客户端使用窗口协议 (v%d)，窗口大小 %d，传输格式 %s", version, granted, accepted)
+
+        return WindowedChannel(connection, granted, accepted, timeout)
+
+    except socket.timeout:
+        log.warning("协议握手超时")
+        return None
+    except Exception as e:
+        log.warning("协议握手失败: %s", e)
+        return None
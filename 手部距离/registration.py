@@ -0,0 +1,107 @@
+"""RGB图像与深度图之间的坐标配准
+
+原来用 wrist_x * depth_width / rgb_width 这样的整数缩放换算坐标，显示代码里又用写死的
+640/480/256/192 再算一遍，既不考虑宽高比和相机内参，每次调用也要重新计算。
+
+Registration 按 (RGB尺寸, 深度尺寸, 内参) 只构建一次并缓存：
+    rgb_to_depth / depth_to_rgb: 一次向量化调用换算任意形状的点集
+    align_depth: 用预先计算的 cv2.remap 查找表把整幅深度图对齐到RGB图像坐标
+
+ARKit 的 sceneDepth 与 capturedImage 来自同一相机、视野相同，所以不提供内参时按两幅图像
+覆盖相同视野处理。客户端可以在v2握手选项中发送两幅图像（按实际传输的分辨率）的内参:
+    rgb_intrinsics / depth_intrinsics: [fx, fy, cx, cy]，像素单位，(cx, cy) 以像素中心为整数坐标
+
+点坐标都是连续坐标：像素 i 覆盖 [i, i+1)，MediaPipe 的归一化坐标乘以图像尺寸即为连续坐标。
+"""
+from collections import namedtuple
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+Intrinsics = namedtuple("Intrinsics", ["fx", "fy", "cx", "cy"])
+
+
+def default_intrinsics(size):
+    """两幅图像视野相同时的等效内参（焦距与图像尺寸成正比，主点在图像中心）"""
+    width, height = size
+    return Intrinsics(float(width), float(height), (width - 1) / 2.0, (height - 1) / 2.0)
+
+
+def intrinsics_from_options(options):
+    """从握手选项读取 (RGB内参, 深度内参)；两者都有效时才使用，否则返回 (None, None)"""
+    values = []
+    for key in ("rgb_intrinsics", "depth_intrinsics"):
+        value = options.get(key) if options else None
+        if not isinstance(value, (list, tuple)) or len(value) != 4:
+            return None, None
+        try:
+            values.append(Intrinsics(*(float(v) for v in value)))
+        except (TypeError, ValueError):
+            return None, None
+    return tuple(values)
+
+
+class Registration:
+    """RGB连续坐标 (u, v) 与深度图连续坐标之间的仿射映射
+
+    对齐的针孔相机之间: u_d = fx_d / fx_r * (u_r - 0.5 - cx_r) + cx_d + 0.5，v 同理
+    """
+
+    def __init__(self, rgb_size, depth_size, rgb_intrinsics=None, depth_intrinsics=None):
+        self.rgb_size = tuple(rgb_size)
+        self.depth_size = tuple(depth_size)
+        rgb_k = rgb_intrinsics or default_intrinsics(rgb_size)
+        depth_k = depth_intrinsics or default_intrinsics(depth_size)
+
+        self.scale = np.array([depth_k.fx / rgb_k.fx, depth_k.fy / rgb_k.fy], dtype=np.float32)
+        self.offset = np.array([depth_k.cx + 0.5, depth_k.cy + 0.5], dtype=np.float32) \
+            - self.scale * np.array([rgb_k.cx + 0.5, rgb_k.cy + 0.5], dtype=np.float32)
+        self._depth_maps = {}
+
+    def rgb_to_depth(self, points):
+        """RGB图像坐标 (..., 2) -> 深度图坐标 (..., 2)"""
+        return np.asarray(points, dtype=np.float32) * self.scale + self.offset
+
+    def depth_to_rgb(self, points):
+        """深度图坐标 (..., 2) -> RGB图像坐标 (..., 2)"""
+        return (np.asarray(points, dtype=np.float32) - self.offset) / self.scale
+
+    def depth_maps(self, nearest=True):
+        """cv2.remap 查找表：RGB图像每个像素对应的深度图像素坐标（按插值方式各构建一次）"""
+        if nearest not in self._depth_maps:
+            width, height = self.rgb_size
+            depth_width, depth_height = self.depth_size
+            # 像素中心的连续坐标为 i + 0.5，remap 使用像素中心为整数的坐标
+            xs = (np.arange(width, dtype=np.float32) + 0.5) * self.scale[0] + self.offset[0] - 0.5
+            ys = (np.arange(height, dtype=np.float32) + 0.5) * self.scale[1] + self.offset[1] - 0.5
+            # 落在边缘像素范围内（距中心不到半个像素）的坐标收到像素中心，不与边界外的0混合
+            xs = np.where((xs >= -0.5) & (xs <= depth_width - 0.5), np.clip(xs, 0, depth_width - 1), xs)
+            ys = np.where((ys >= -0.5) & (ys <= depth_height - 0.5), np.clip(ys, 0, depth_height - 1), ys)
+            map_x = np.ascontiguousarray(np.broadcast_to(xs.astype(np.float32), (height, width)))
+            map_y = np.ascontiguousarray(np.broadcast_to(ys[:, None].astype(np.float32), (height, width)))
+            # 定点查找表比浮点查找表重采样更快
+            self._depth_maps[nearest] = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2,
+                                                        nninterpolation=nearest)
+        return self._depth_maps[nearest]
+
+    def align_depth(self, depth_image, interpolation=cv2.INTER_NEAREST, dst=None):
+        """把深度图重采样到RGB图像坐标；视野外的像素为0（无效深度）
+
+        深度值默认用最近邻插值，避免在物体边缘插出不存在的中间深度
+        """
+        map_xy, map_frac = self.depth_maps(interpolation == cv2.INTER_NEAREST)
+        return cv2.remap(depth_image, map_xy, map_frac, interpolation, dst=dst,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+
+@lru_cache(maxsize=16)
+def get_registration(rgb_size, depth_size, rgb_intrinsics=None, depth_intrinsics=None):
+    """按 (RGB尺寸, 深度尺寸, 内参) 缓存的 Registration"""
+    return Registration(rgb_size, depth_size, rgb_intrinsics, depth_intrinsics)
+
+
+def registration_for(rgb_size, depth_size, options=None):
+    """根据握手选项中的内参（没有时按视野相同处理）返回缓存的 Registration"""
+    rgb_intrinsics, depth_intrinsics = intrinsics_from_options(options)
+    return get_registration(tuple(rgb_size), tuple(depth_size), rgb_intrinsics, depth_intrinsics)
@@ -0,0 +1,132 @@
+"""显示画面绘制
+
+原来每帧对已经是640x480的RGB图再 resize 一次，深度图按本帧的最小/最大值 normalize
+（颜色随画面内容跳动），再 astype 和 resize，最后把RGB图整幅拷贝一份再写文字。
+
+FrameRenderer 预先分配显示画布，每一步都通过 dst= 写进这些缓冲区：
+    深度图: 裁剪到固定范围 -> convertScaleAbs 转成 uint8 -> 配准查找表对齐到RGB坐标
+            -> applyColorMap 用缓存的颜色表着色（0 即无效深度显示为黑色）
+    RGB图:  尺寸与显示窗口相同时直接在解码缓冲区上叠加信息，不再缩放和拷贝
+每帧只重新绘制圆圈和文字。
+"""
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+DISPLAY_SIZE = (640, 480)  # 显示窗口尺寸
+
+# 深度着色的固定范围(米)，与深度清理的 sparse_range 上限一致
+DEFAULT_DISPLAY_RANGE = (0.0, 5.0)
+
+
+@lru_cache(maxsize=8)
+def depth_colormap(colormap=cv2.COLORMAP_TURBO):
+    """applyColorMap 使用的 256x1 颜色表，第0项（无效深度）为黑色"""
+    lut = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), colormap)
+    lut[0] = 0
+    return lut
+
+
+def distance_color(distance):
+    """根据距离设置颜色"""
+    if distance < 0.5:
+        return (0, 255, 0)  # 绿色
+    if distance < 1.0:
+        return (0, 255, 255)  # 黄色
+    return (0, 0, 255)  # 红色
+
+
+class FrameRenderer:
+    """把 demo.FrameResult 绘制成RGB画面和深度雷达图，画布在帧之间复用
+
+    返回的两幅图像是内部缓冲区（或解码器的RGB缓冲区），下一帧绘制时会被覆盖
+    """
+
+    def __init__(self, display_size=DISPLAY_SIZE, depth_range=DEFAULT_DISPLAY_RANGE,
+                 colormap=cv2.COLORMAP_TURBO):
+        self.display_size = tuple(display_size)
+        width, height = self.display_size
+        low, high = depth_range
+        # depth * alpha + beta：low 映射到0，high 映射到255；先裁剪到 [low, high]，
+        # 否则 convertScaleAbs 取绝对值会把低于 low 的深度（包括无效的0）折回成正数
+        self.alpha = 255.0 / (high - low)
+        self.beta = -low * self.alpha
+        self.depth_range = (low, high)
+        self._lut = depth_colormap(colormap)
+        self._depth_canvas = np.empty((height, width, 3), dtype=np.uint8)
+        self._rgb_canvas = np.empty((height, width, 3), dtype=np.uint8)
+        self._buffers = {}
+
+    def _buffer(self, name, shape, dtype=np.uint8):
+        """按名称、尺寸和类型缓存的中间缓冲区"""
+        key = (name, shape, np.dtype(dtype))
+        if key not in self._buffers:
+            self._buffers[key] = np.empty(shape, dtype=dtype)
+        return self._buffers[key]
+
+    def colorize_depth(self, depth_clean, registration):
+        """固定范围着色并对齐到RGB坐标，写进深度画布"""
+        low, high = self.depth_range
+        clipped = np.clip(depth_clean, low, high, out=self._buffer("clipped", depth_clean.shape, np.float32))
+        # 无效深度0裁剪成 low，映射到颜色表第0项（黑色）
+        depth_u8 = cv2.convertScaleAbs(clipped, self._buffer("depth", depth_clean.shape), self.alpha, self.beta)
+        rgb_width, rgb_height = registration.rgb_size
+        aligned = registration.align_depth(depth_u8, cv2.INTER_NEAREST,
+                                           self._buffer("aligned", (rgb_height, rgb_width)))
+        if registration.rgb_size != self.display_size:
+            width, height = self.display_size
+            aligned = cv2.resize(aligned, self.display_size, self._buffer("display", (height, width)),
+                                 interpolation=cv2.INTER_NEAREST)
+        return cv2.applyColorMap(aligned, self._lut, self._depth_canvas)
+
+    def rgb_canvas(self, rgb_image):
+        """尺寸与显示窗口相同时直接使用RGB图像，否则缩放进RGB画布"""
+        height, width = rgb_image.shape[:2]
+        if (width, height) == self.display_size:
+            return rgb_image
+        return cv2.resize(rgb_image, self.display_size, self._rgb_canvas)
+
+    def render(self, result):
+        """绘制距离信息，返回 (RGB画面, 深度雷达图)"""
+        rgb_display = self.rgb_canvas(result.rgb_image)
+        depth_display = self.colorize_depth(result.depth_clean, result.registration)
+        display_scale = np.array(self.display_size, dtype=np.float32) / result.registration.rgb_size
+        right = rgb_display.shape[1] - 200
+
+        # 在深度图上添加信息
+        cv2.putText(depth_display, "Depth Radar", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        valid_ratio = result.valid_after_clean / result.depth_clean.size * 100
+        cv2.putText(depth_display, f"Valid: {valid_ratio:.1f}%  {self.depth_range[0]:.1f}-{self.depth_range[1]:.1f}m",
+                    (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+        # 深度图已对齐到RGB坐标，两幅显示图上的手掌位置相同
+        for hand_info in result.hand_distances:
+            distance = hand_info['distance']
+            display_x, display_y = (int(v) for v in np.asarray(hand_info['position'], dtype=np.float32)
+                                    * display_scale)
+            if 0 <= display_x < depth_display.shape[1] and 0 <= display_y < depth_display.shape[0]:
+                cv2.circle(depth_display, (display_x, display_y), 15, (255, 255, 255), 3)
+                cv2.putText(depth_display, f"{distance:.2f}m", (display_x + 20, display_y),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+                cv2.circle(rgb_display, (display_x, display_y), 8, (0, 255, 0), 2)
+                cv2.circle(rgb_display, (display_x, display_y), 3, (0, 255, 0), -1)
+
+        # 在RGB图像右上角显示距离信息
+        if result.hand_distances:
+            for i, hand_info in enumerate(result.hand_distances):
+                distance = hand_info['distance']
+                cv2.putText(rgb_display, f"Hand {i+1}: {distance:.2f}m", (right, 30 + i * 25),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, distance_color(distance), 2)
+        elif result.results.multi_hand_landmarks:
+            # 有手掌检测但没有有效距离数据
+            cv2.putText(rgb_display, "Hand detected", (right, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+            cv2.putText(rgb_display, "No depth data", (right, 55),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+        else:
+            cv2.putText(rgb_display, "No hand detected", (right, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (128, 128, 128), 2)
+
+        return rgb_display, depth_display
@@ -0,0 +1,72 @@
+"""检测结果消息
+
+无界面模式下服务器不再只回复"成功/失败"，而是把每帧的检测结果放在 CREDIT 的附加数据里
+返回给客户端（v2协议，握手选项 result_format 为 "json" 或 "binary"）。旧版停等客户端
+无法协商选项，仍然只收到4字节ACK。
+
+json: 紧凑JSON，字段与 hand_distance.summarize_result 相同，另加 frame_id
+binary (小端):
+    消息头: uint32 帧号 + uint8 状态(1成功/0失败) + uint8 手数 + float32 服务器耗时(毫秒)
+            + float32 有效深度比例
+    每只手: uint8 手编号 + float32 距离(米) + float32 截尾均值(米) + uint16 有效样本数
+            + int16 x2 RGB位置 + int16 x2 深度图位置 + uint8 关键点数
+            + 关键点数 x float32 x2 归一化坐标
+"""
+import json
+import struct
+
+import numpy as np
+
+RESULT_HEADER = struct.Struct("<IBBff")      # 帧号, 状态, 手数, 耗时, 有效深度比例
+HAND_RECORD = struct.Struct("<BffHhhhhB")    # 手编号, 距离, 截尾均值, 有效样本数, 位置, 深度位置, 关键点数
+
+
+def encode_result(frame_id, result, result_format):
+    """把结果字典编码为 CREDIT 附加数据；result_format 为 "none" 时返回空数据"""
+    if result_format == "json":
+        message = dict(result, frame_id=frame_id)
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    if result_format == "binary":
+        hands = result['hands']
+        parts = [RESULT_HEADER.pack(frame_id, 1 if result['ok'] else 0, len(hands),
+                                    result.get('elapsed_ms', 0.0), result['valid_ratio'])]
+        for hand_info in hands:
+            landmarks = np.asarray(hand_info['landmarks'], dtype=np.float32).reshape(-1, 2)
+            parts.append(HAND_RECORD.pack(hand_info['hand_id'], hand_info['distance'], hand_info['trimmed_mean'],
+                                          min(hand_info['valid_count'], 0xFFFF),
+                                          *hand_info['position'], *hand_info['depth_position'], len(landmarks)))
+            parts.append(landmarks.astype("<f4").tobytes())
+        return b"".join(parts)
+
+    return b""
+
+
+def decode_result(data, result_format):
+    """解析 encode_result 的输出（Python测试客户端使用）；binary 格式不含 error 和 hands_detected"""
+    if result_format == "json":
+        return json.loads(bytes(data).decode("utf-8"))
+
+    if result_format != "binary":
+        raise ValueError(f"未知结果格式: {result_format}")
+
+    frame_id, status, hand_count, elapsed_ms, valid_ratio = RESULT_HEADER.unpack_from(data, 0)
+    offset = RESULT_HEADER.size
+    hands = []
+    for _ in range(hand_count):
+        (hand_id, distance, trimmed_mean, valid_count,
+         x, y, depth_x, depth_y, landmark_count) = HAND_RECORD.unpack_from(data, offset)
+        offset += HAND_RECORD.size
+        landmarks = np.frombuffer(data, dtype="<f4", count=landmark_count * 2, offset=offset)
+        offset += landmarks.nbytes
+        hands.append({
+            'hand_id': hand_id,
+            'distance': distance,
+            'trimmed_mean': trimmed_mean,
+            'valid_count': valid_count,
+            'position': (x, y),
+            'depth_position': (depth_x, depth_y),
+            'landmarks': landmarks.reshape(-1, 2).tolist(),
+        })
+    return {'frame_id': frame_id, 'ok': bool(status), 'valid_ratio': valid_ratio, 'hands': hands,
+            'elapsed_ms': elapsed_ms}
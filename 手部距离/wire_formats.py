@@ -0,0 +1,252 @@
+"""RGB和深度数据的传输格式
+
+原始格式每帧约 1.2MB (640x480 BGRA) + 196KB (256x192 float32)。v2客户端可以在握手选项里
+声明压缩格式，服务器确认后按格式解码：
+
+    rgb_format:        "auto"(按字节数识别, 旧版行为) / "bgra" / "bgr" / "jpeg" / "nv12" / "i420"
+    rgb_size / depth_size: [宽, 高]，默认 640x480 / 256x192
+    depth_format:      "f32" / "f16" / "u16mm"(毫米, uint16, 0表示无效)
+    depth_compression: "none" / "zlib" / "lz4"(需要安装lz4)
+    result_format:     "none"(CREDIT不带数据) / "json" / "binary"，检测结果随CREDIT返回（见 result_message.py）
+    rgb_intrinsics / depth_intrinsics: 可选，两幅图像的相机内参 [fx, fy, cx, cy]，用于坐标配准（见 registration.py）
+
+ARKit 的 capturedImage 本身就是 NV12 (420f)，直接发送 NV12 每像素只有1.5字节；
+u16mm + zlib 的深度数据通常只有原始大小的几分之一。
+
+格式和分辨率每个连接只确定一次：RgbDecoder 按它们选好转换方式并预分配输出缓冲区，
+每帧只做一次 cvtColor(dst=...)，不再按字节数猜格式、也不用 try/except 逐个尝试。
+"""
+import zlib
+
+import cv2
+import numpy as np
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+from frame_log import log
+from registration import intrinsics_from_options
+
+RGB_FORMATS = ("auto", "bgra", "bgr", "jpeg", "nv12", "i420")
+DEPTH_FORMATS = ("f32", "f16", "u16mm")
+DEPTH_COMPRESSIONS = ("none", "zlib", "lz4")
+RESULT_FORMATS = ("none", "json", "binary")
+
+# 默认分辨率为旧版客户端的 640x480（iPhone端缩小后发送，减少网络压力）和 256x192
+DEFAULT_FORMATS = {'rgb_format': "auto", 'depth_format': "f32", 'depth_compression': "none",
+                   'result_format': "none", 'rgb_size': [640, 480], 'depth_size': [256, 192]}
+
+MAX_IMAGE_SIDE = 4096
+
+# "auto" 时按字节数依次尝试的格式：旧版客户端发送BGRA，3通道数据按RGB处理
+AUTO_RGB_FORMATS = ("bgra", "rgb", "nv12")
+
+# 各格式每像素字节数（jpeg 不定长）
+RGB_BYTES_PER_PIXEL = {"bgra": 4, "bgr": 3, "rgb": 3, "nv12": 1.5, "i420": 1.5}
+
+# 解码到BGR的颜色转换，bgr 只需拷贝
+RGB_CONVERSIONS = {"bgra": cv2.COLOR_BGRA2BGR, "rgb": cv2.COLOR_RGB2BGR,
+                   "nv12": cv2.COLOR_YUV2BGR_NV12, "i420": cv2.COLOR_YUV2BGR_I420}
+
+
+def negotiate_formats(options):
+    """根据客户端握手选项决定实际使用的格式；不支持的格式回退到默认值"""
+    accepted = dict(DEFAULT_FORMATS)
+    if options.get('rgb_format') in RGB_FORMATS:
+        accepted['rgb_format'] = options['rgb_format']
+    if options.get('depth_format') in DEPTH_FORMATS:
+        accepted['depth_format'] = options['depth_format']
+    compression = options.get('depth_compression')
+    if compression in DEPTH_COMPRESSIONS and (compression != "lz4" or lz4 is not None):
+        accepted['depth_compression'] = compression
+    if options.get('result_format') in RESULT_FORMATS:
+        accepted['result_format'] = options['result_format']
+    for key in ("rgb_size", "depth_size"):
+        size = _parse_size(options.get(key))
+        if size:
+            accepted[key] = size
+    rgb_intrinsics, depth_intrinsics = intrinsics_from_options(options)
+    if rgb_intrinsics:
+        accepted['rgb_intrinsics'] = list(rgb_intrinsics)
+        accepted['depth_intrinsics'] = list(depth_intrinsics)
+    return accepted
+
+
+def _parse_size(value):
+    """握手选项中的 [宽, 高]，无效时返回None"""
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        return None
+    if not all(isinstance(v, int) and 0 < v <= MAX_IMAGE_SIDE for v in value):
+        return None
+    return list(value)
+
+
+def frame_sizes(options=None):
+    """返回协商的 ((RGB宽, 高), (深度宽, 高))"""
+    options = options or DEFAULT_FORMATS
+    return (tuple(options.get('rgb_size', DEFAULT_FORMATS['rgb_size'])),
+            tuple(options.get('depth_size', DEFAULT_FORMATS['depth_size'])))
+
+
+class RgbDecoder:
+    """一个连接的RGB解码器：格式和分辨率确定后每帧只做一次转换，输出写进预分配的缓冲区
+
+    rgb_format 为 "auto" 时按第一帧的字节数确定格式，之后只在字节数变化时重新识别。
+    buffers: 轮换使用的输出缓冲区个数，与 DepthCleaner 相同，流水线模式下显示线程还在
+        读上一帧时，检测线程写入下一个缓冲区
+    """
+
+    def __init__(self, rgb_format="auto", width=640, height=480, buffers=3):
+        if rgb_format not in RGB_FORMATS:
+            raise ValueError(f"未知RGB格式: {rgb_format}")
+        self.rgb_format = rgb_format
+        self.width = width
+        self.height = height
+        self._outputs = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(max(1, buffers))]
+        self._next = 0
+        self._resolved = None if rgb_format == "auto" else rgb_format
+        self._expected = self._expected_size(self._resolved)
+        if rgb_format in ("nv12", "i420") and self._expected is None:
+            raise ValueError(f"{rgb_format} 要求宽高为偶数: {width}x{height}")
+
+    def _expected_size(self, rgb_format):
+        """该格式一帧的字节数；不定长或分辨率不适用（YUV420的宽高必须为偶数）时返回None"""
+        if rgb_format not in RGB_BYTES_PER_PIXEL:
+            return None
+        if rgb_format in ("nv12", "i420") and (self.width % 2 or self.height % 2):
+            return None
+        return int(self.width * self.height * RGB_BYTES_PER_PIXEL[rgb_format])
+
+    def _resolve(self, data_size):
+        """按字节数识别格式，无法识别返回None"""
+        for rgb_format in AUTO_RGB_FORMATS:
+            if data_size == self._expected_size(rgb_format):
+                return rgb_format
+        return None
+
+    def decode(self, rgb_data):
+        """返回 height x width 的BGR图像（内部缓冲区，之后的帧会复用），数据大小不对返回None"""
+        rgb_array = np.frombuffer(rgb_data, dtype=np.uint8)
+
+        if self.rgb_format == "auto" and len(rgb_array) != self._expected:
+            rgb_format = self._resolve(len(rgb_array))
+            if rgb_format is None:
+                return None
+            if self._resolved is not None:
+                log.info("RGB数据格式变化: %s -> %s", self._resolved, rgb_format)
+            self._resolved = rgb_format
+            self._expected = self._expected_size(rgb_format)
+
+        output = self._outputs[self._next]
+        if self._resolved == "jpeg":
+            image = cv2.imdecode(rgb_array, cv2.IMREAD_COLOR)
+            if image is None or image.shape != output.shape:
+                return None
+            np.copyto(output, image)
+        else:
+            if len(rgb_array) != self._expected:
+                return None
+            if self._resolved == "bgr":
+                np.copyto(output, rgb_array.reshape(output.shape))
+            elif self._resolved in ("nv12", "i420"):
+                cv2.cvtColor(rgb_array.reshape((self.height * 3 // 2, self.width)),
+                             RGB_CONVERSIONS[self._resolved], dst=output)
+            else:
+                channels = RGB_BYTES_PER_PIXEL[self._resolved]
+                cv2.cvtColor(rgb_array.reshape((self.height, self.width, channels)),
+                             RGB_CONVERSIONS[self._resolved], dst=output)
+        self._next = (self._next + 1) % len(self._outputs)
+        return output
+
+
+def decompress_depth(depth_data, compression, max_size):
+    """解压深度数据，未压缩时原样返回（不拷贝）
+
+    解压结果最多max_size字节；超出（压缩流没有解压完）或压缩流后面还有多余数据时返回None，
+    不会把截断的数据当成完整的一帧
+    """
+    if compression == "zlib":
+        decompressor = zlib.decompressobj()
+        raw = decompressor.decompress(depth_data, max_size)
+        if not decompressor.eof or decompressor.unconsumed_tail or decompressor.unused_data:
+            return None
+        return raw
+    if compression == "lz4":
+        decompressor = lz4.frame.LZ4FrameDecompressor()
+        raw = decompressor.decompress(depth_data, max_length=max_size)
+        if not decompressor.eof or decompressor.unused_data:
+            return None
+        return raw
+    return depth_data
+
+
+def decode_depth(depth_data, depth_format, compression, width, height):
+    """按格式把深度数据解码为 height x width 的float32深度图(米)，大小不对返回None"""
+    raw = decompress_depth(depth_data, compression, width * height * 4)
+    if raw is None:
+        return None
+
+    if depth_format == "f32":
+        depth_array = np.frombuffer(raw, dtype=np.float32)
+    elif depth_format == "f16":
+        depth_array = np.frombuffer(raw, dtype=np.float16)
+    elif depth_format == "u16mm":
+        depth_array = np.frombuffer(raw, dtype=np.uint16)
+    else:
+        raise ValueError(f"未知深度格式: {depth_format}")
+
+    if len(depth_array) != width * height:
+        return None
+    depth_image = depth_array.reshape((height, width))
+
+    if depth_format == "f16":
+        return depth_image.astype(np.float32)
+    if depth_format == "u16mm":
+        # 0毫米表示无效，转成米后仍为0，深度清理时会被过滤
+        return depth_image.astype(np.float32) * np.float32(0.001)
+    return depth_image
+
+
+def encode_rgb(bgr_image, rgb_format, jpeg_quality=80):
+    """把BGR图像编码为传输格式（Python测试客户端使用）"""
+    if rgb_format == "jpeg":
+        ok, encoded = cv2.imencode(".jpg", bgr_image, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        if not ok:
+            raise ValueError("JPEG编码失败")
+        return encoded.tobytes()
+    if rgb_format == "nv12":
+        i420 = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2YUV_I420)
+        height, width = bgr_image.shape[:2]
+        y = i420[:height]
+        u = i420[height:height + height // 4].reshape(-1)
+        v = i420[height + height // 4:].reshape(-1)
+        uv = np.empty(u.size * 2, dtype=np.uint8)
+        uv[0::2] = u
+        uv[1::2] = v
+        return y.tobytes() + uv.tobytes()
+    if rgb_format == "i420":
+        return cv2.cvtColor(bgr_image, cv2.COLOR_BGR2YUV_I420).tobytes()
+    if rgb_format in ("bgra", "auto"):
+        return cv2.cvtColor(bgr_image, cv2.COLOR_BGR2BGRA).tobytes()
+    if rgb_format == "bgr":
+        return bgr_image.tobytes()
+    raise ValueError(f"未知RGB格式: {rgb_format}")
+
+
+def encode_depth(depth_image, depth_format, compression):
+    """把float32深度图(米)编码为传输格式（Python测试客户端使用）"""
+    if depth_format == "f16":
+        raw = depth_image.astype(np.float16).tobytes()
+    elif depth_format == "u16mm":
+        millimetres = np.nan_to_num(depth_image, nan=0.0, posinf=0.0, neginf=0.0) * 1000.0
+        raw = np.clip(millimetres, 0, 65535).astype(np.uint16).tobytes()
+    else:
+        raw = depth_image.astype(np.float32).tobytes()
+
+    if compression == "zlib":
+        return zlib.compress(raw, 1)
+    if compression == "lz4":
+        return lz4.frame.compress(raw)
+    return raw